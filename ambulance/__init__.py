@@ -0,0 +1 @@
+"""Shared triage and dispatch logic used by the Streamlit pages."""
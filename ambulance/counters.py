@@ -0,0 +1,257 @@
+"""
+Per-process sharded daily counters (calls_today, dispatched, ...) and
+streaming summaries (response times).
+
+Incrementing a shared JSON stats file from several processes loses
+updates, and rewrites the file on every call. Here each process counts in
+memory instead, keyed by local day, and owns one shard file per day:
+
+    counters/2026-10-17/<host>-<pid>-<start ms>.json
+        {"counts": {"calls_today": 3, ...}, "summaries": {"response_minutes": {...}}}
+
+A shard holds the process's running totals for that day, so rewriting it
+is idempotent. Only its owner writes it, so no lock is needed. Writes
+happen at most every FLUSH_INTERVAL seconds (a timer starts on the first
+unflushed increment) and once at exit, via temp file + rename. A process
+that ends with os._exit (multiprocessing children) should call flush()
+itself. Summaries are estimators.Summary (Welford mean and variance plus a
+quantile sketch), which merge exactly across shards.
+
+values() sums every shard for the day plus this process's unflushed
+counts, and summaries() merges their summaries the same way. A new day
+starts at zero on its own, because nothing has been written under its
+date yet. Other processes' increments show up within
+FLUSH_INTERVAL.
+
+Every process restart leaves a new shard behind, so compact() folds the
+shards of processes on this host that have exited into each day's
+FOLDED_SHARD and deletes them. It runs on a process's first flush and
+then at most every COMPACT_INTERVAL seconds, under the day directory's
+lock. FOLDED_SHARD lists the shards it already contains until they are
+deleted, and readers skip those, so a crash between the two steps does
+not count them twice.
+"""
+import atexit
+import json
+import os
+import socket
+import threading
+import time
+
+from ambulance.estimators import Summary
+from ambulance.locking import atomic_write_json, locked, pid_alive
+from ambulance.read_cache import read_cache
+
+COUNTER_DIR = os.environ.get('AMBULANCE_COUNTER_DIR', 'counters')
+FLUSH_INTERVAL = 1.0
+COMPACT_INTERVAL = 300.0
+
+# Per-day totals of exited processes' shards (see compact)
+FOLDED_SHARD = 'folded.json'
+
+_lock = threading.Lock()
+_totals = {}      # day -> {name: count} for this process
+_summaries = {}   # day -> {name: Summary} for this process
+_dirty = set()    # days with increments not yet written
+_timer = None
+_shard = None     # this process's shard file name
+_shard_pid = None
+_next_compact = 0.0
+
+
+def today():
+    """Local calendar day, so 'calls today' follows the dispatch centre's clock"""
+    return time.strftime('%Y-%m-%d')
+
+
+def _shard_name():
+    global _shard, _shard_pid, _timer
+    if _shard_pid != os.getpid():
+        # New process (or forked child, which must not rewrite its parent's shard
+        # and has no copy of its flush timer)
+        _shard = f'{socket.gethostname()}-{os.getpid()}-{int(time.time() * 1000)}.json'
+        _shard_pid = os.getpid()
+        _totals.clear()
+        _summaries.clear()
+        _dirty.clear()
+        _timer = None
+    return _shard
+
+
+def increment(name, amount=1):
+    """Add to today's counter for this process; written out within FLUSH_INTERVAL"""
+    day = today()
+    with _lock:
+        _shard_name()
+        counts = _totals.setdefault(day, {})
+        counts[name] = counts.get(name, 0) + amount
+        _mark_dirty(day)
+
+
+def observe(name, value):
+    """Add a value to today's summary for this process (O(1))"""
+    day = today()
+    with _lock:
+        _shard_name()
+        _summaries.setdefault(day, {}).setdefault(name, Summary()).add(value)
+        _mark_dirty(day)
+
+
+def _mark_dirty(day):
+    # Caller holds _lock
+    global _timer
+    _dirty.add(day)
+    if _timer is None:
+        _timer = threading.Timer(FLUSH_INTERVAL, flush)
+        _timer.daemon = True
+        _timer.start()
+
+
+def flush():
+    """Write this process's totals for every day with unflushed increments"""
+    global _timer
+    with _lock:
+        _timer = None
+        shard = _shard_name()
+        pending = {
+            day: {'counts': dict(_totals.get(day, {})),
+                  'summaries': {name: summary.to_dict()
+                                for name, summary in _summaries.get(day, {}).items()}}
+            for day in _dirty
+        }
+        _dirty.clear()
+    for day, shard_data in pending.items():
+        day_dir = os.path.join(COUNTER_DIR, day)
+        try:
+            os.makedirs(day_dir, exist_ok=True)
+            atomic_write_json(os.path.join(day_dir, shard), shard_data, indent=None)
+        except OSError as e:
+            print(f"⚠️ Could not write counters for {day}: {e}")
+            with _lock:
+                _dirty.add(day)
+    _maybe_compact()
+
+
+def _maybe_compact():
+    global _next_compact
+    now = time.monotonic()
+    if now < _next_compact:
+        return
+    _next_compact = now + COMPACT_INTERVAL
+    try:
+        compact()
+    except OSError as e:
+        print(f"⚠️ Could not compact counters: {e}")
+
+
+def _shard_owner(name):
+    """(host, pid) of a shard file name, or None for FOLDED_SHARD and other files"""
+    try:
+        host, pid, _ = name[:-len('.json')].rsplit('-', 2)
+        return host, int(pid)
+    except ValueError:
+        return None
+
+
+def _read_shard(path):
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def compact():
+    """Fold the shards of exited processes on this host into FOLDED_SHARD; returns shards removed"""
+    try:
+        days = sorted(os.listdir(COUNTER_DIR))
+    except OSError:
+        return 0
+    removed = 0
+    for day in days:
+        day_dir = os.path.join(COUNTER_DIR, day)
+        if os.path.isdir(day_dir):
+            with locked(os.path.join(day_dir, '.lock')):
+                removed += _compact_day(day_dir)
+    return removed
+
+
+def _compact_day(day_dir):
+    host = socket.gethostname()
+    folded_path = os.path.join(day_dir, FOLDED_SHARD)
+    folded = _read_shard(folded_path)
+    done = set(folded.get('folded', []))
+    dead = []
+    for name in os.listdir(day_dir):
+        owner = _shard_owner(name) if name.endswith('.json') else None
+        if owner is not None and name not in done and owner[0] == host and not pid_alive(owner[1]):
+            dead.append(name)
+    if not dead and not done:
+        return 0
+
+    counts = dict(folded.get('counts', {}))
+    summaries = {name: Summary.from_dict(data) for name, data in folded.get('summaries', {}).items()}
+    for name in dead:
+        shard_data = _read_shard(os.path.join(day_dir, name))
+        for counter, count in shard_data.get('counts', {}).items():
+            counts[counter] = counts.get(counter, 0) + count
+        for summary, data in shard_data.get('summaries', {}).items():
+            summaries.setdefault(summary, Summary()).merge(Summary.from_dict(data))
+    folded = {'counts': counts, 'summaries': {name: summary.to_dict() for name, summary in summaries.items()}}
+
+    # Record what is folded before deleting it, then forget the deleted names
+    atomic_write_json(folded_path, dict(folded, folded=sorted(done | set(dead))), indent=None)
+    for name in done | set(dead):
+        try:
+            os.remove(os.path.join(day_dir, name))
+        except FileNotFoundError:
+            pass
+    atomic_write_json(folded_path, dict(folded, folded=[]), indent=None)
+    return len(dead)
+
+
+def _other_shards(day, own_shard):
+    """Parsed shards of other processes for a day, plus the folded totals of exited ones"""
+    day_dir = os.path.join(COUNTER_DIR, day)
+    try:
+        names = os.listdir(day_dir)
+    except OSError:
+        return []
+    shards = {name: read_cache.load_json(os.path.join(day_dir, name), {})
+              for name in names if name != own_shard and name.endswith('.json')}
+    # Shards already in FOLDED_SHARD but not yet deleted
+    for name in shards.get(FOLDED_SHARD, {}).get('folded', []):
+        shards.pop(name, None)
+    return list(shards.values())
+
+
+def values(day=None):
+    """Counters for a day (default today) summed over every process's shard"""
+    day = day or today()
+    with _lock:
+        own_shard = _shard_name()
+        merged = dict(_totals.get(day, {}))
+    for shard_data in _other_shards(day, own_shard):
+        for name, count in shard_data.get('counts', {}).items():
+            merged[name] = merged.get(name, 0) + count
+    return merged
+
+
+def value(name, day=None):
+    return values(day).get(name, 0)
+
+
+def summaries(day=None):
+    """{name: Summary} for a day (default today) merged over every process's shard"""
+    day = day or today()
+    with _lock:
+        own_shard = _shard_name()
+        merged = {name: Summary().merge(summary) for name, summary in _summaries.get(day, {}).items()}
+    for shard_data in _other_shards(day, own_shard):
+        for name, data in shard_data.get('summaries', {}).items():
+            merged.setdefault(name, Summary()).merge(Summary.from_dict(data))
+    return merged
+
+
+atexit.register(flush)
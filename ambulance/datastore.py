@@ -0,0 +1,388 @@
+"""
+Shared queue, stats and fleet data used by the patient portal, the
+technician dashboard and the headless triage worker.
+
+Three backends, chosen with the AMBULANCE_STORE environment variable:
+
+- json (default): the queue is split into one shard per city zone (see
+  shards.py), and each shard is an append-only operation log plus snapshot
+  (see queue_log.py). enqueue/dispatch/update append one line to one
+  shard, and load_queue only replays what was appended since the last call. Stats and
+  fleet status are plain JSON files, except the daily COUNTERS, which are
+  per-process shards merged on read (see counters.py). Each file is written
+  atomically (temp file + rename), and read-modify-write updates hold the
+  file's flock (see locking.py). Loads are served from a process-wide parsed cache that is
+  revalidated on (inode, mtime_ns, size) (see read_cache.py).
+- sqlite: one WAL-mode SQLite database (see sqlite_store.py). Multi-step
+  changes such as dispatch_patient are a single transaction. The JSON
+  files are imported on first use.
+- events: one append-only event log with periodic snapshots (see
+  event_store.py). Every change, including a whole dispatch, is one event,
+  and the queue, stats and fleet are a fold of the log. The JSON files
+  are imported on first use.
+
+The fleet is a list of ambulances with per-unit state (see fleet.py).
+Every fleet change loads the units, applies legal transitions and saves
+them in one step (_update_fleet). On the json backend, fleet_status.json
+is a versioned document updated by compare-and-swap with retry (see
+versioned.py), so concurrent dashboards do not serialize on a lock while
+they decide. load_fleet_status derives the per-state counts from the units.
+
+On both backends, avg_response, success_rate and the response_p50/p90/p99
+stats are not stored. Each dispatch adds the patient's wait (request id
+time to dispatch) to a streaming summary in counters.py, and load_stats
+reads today's merged summary (see estimators.py).
+
+Pages should prefer the composite operations (dispatch_patient,
+complete_mission, advance_unit, move_units, increment_stat) over load/modify/save, so
+the sqlite backend can apply them atomically.
+
+Functions here raise on write errors; the Streamlit pages wrap them and
+report failures with st.error.
+"""
+import os
+import time
+
+from ambulance import counters, event_store, history, ids, sqlite_store
+from ambulance.fleet import ACTIVE_STATES, Fleet
+from ambulance.shards import sharded_queue, zone_for
+from ambulance.locking import atomic_write_json, lock_path, locked
+from ambulance.read_cache import read_cache
+from ambulance.versioned import update_versioned
+
+STORE = os.environ.get('AMBULANCE_STORE', 'json')
+# Module implementing the store, or None for the JSON files handled here
+BACKEND = {'sqlite': sqlite_store, 'events': event_store}.get(STORE)
+
+# File paths for shared data
+STATS_FILE = "system_stats.json"
+FLEET_FILE = "fleet_status.json"
+
+DEFAULT_STATS = {
+    'calls_today': 0,
+    'dispatched': 0,
+}
+
+# Stats counted per day in counters.py on the json backend (reset at local midnight)
+COUNTERS = ('calls_today', 'dispatched')
+
+# A dispatch counts towards success_rate if the patient waited at most this long
+RESPONSE_TARGET_MINUTES = {'HIGH': 8, 'MEDIUM': 15, 'LOW': 30}
+RESPONSE_SUMMARY = 'response_minutes'
+MISSION_SUMMARY = 'mission_minutes'
+
+# Units created by reset_fleet (and for a missing fleet file)
+DEFAULT_FLEET = {
+    'total': 10,
+    'available': 8,
+    'en_route': 0,
+    'maintenance': 2
+}
+
+
+def _load_json(path, default):
+    return read_cache.load_json(path, default)
+
+
+def _save_json(path, data):
+    with locked(lock_path(path)):
+        atomic_write_json(path, data)
+
+
+def new_request_id():
+    """Return a unique, time-sortable id for a new queue entry (see ids.py)"""
+    return ids.next_id()
+
+
+def new_queue_entry(patient_info, diagnosis, priority, severity_score, differential=(), method=None):
+    """Build a queue entry from patient details and a triage result
+
+    The differential is the model's opinion, so it is only kept when the
+    model made the diagnosis (method 'ML Model').
+    """
+    if method != 'ML Model':
+        differential = ()
+    return {
+        'id': new_request_id(),
+        'name': patient_info['name'],
+        'age': patient_info['age'],
+        'location': patient_info['address'],
+        'zone': zone_for(patient_info['address']),
+        'condition': diagnosis,
+        'priority': priority,
+        'severity_score': severity_score,
+        'differential': [[label, round(confidence, 3)] for label, confidence in differential],
+        'symptoms': patient_info.get('additional_info', 'AI-assessed symptoms'),
+        'time': 'Just now',
+        'phone': patient_info['phone']
+    }
+
+
+def load_queue(zones=None):
+    """Load the queue of the given zones (default all) in dispatch order"""
+    if BACKEND is not None:
+        return BACKEND.load_queue(zones)
+    return sharded_queue.load(zones)
+
+
+def is_queued(entry_id):
+    """True if the entry is still waiting in the queue (indexed lookup)"""
+    if BACKEND is not None:
+        return BACKEND.is_queued(entry_id)
+    return sharded_queue.contains(entry_id)
+
+
+def seen_intake_ref(intake_ref):
+    """True if an intake line was already queued, even if since dispatched"""
+    if BACKEND is not None:
+        return BACKEND.seen_intake_ref(intake_ref)
+    return sharded_queue.has_intake_ref(intake_ref)
+
+
+def next_patient(zones=None):
+    """Return the next entry to dispatch without scanning the queue, or None"""
+    if BACKEND is not None:
+        return BACKEND.next_patient(zones)
+    return sharded_queue.peek(zones)
+
+
+def enqueue(*entries):
+    """Add one or more entries to the queue with a single log append per zone"""
+    if BACKEND is not None:
+        return BACKEND.enqueue(*entries)
+    sharded_queue.enqueue(*entries)
+
+
+def update_entry(entry_id, fields):
+    """Merge fields into a queued entry"""
+    if BACKEND is not None:
+        return BACKEND.update_entry(entry_id, fields)
+    sharded_queue.update(entry_id, fields)
+
+
+def modify_entry(entry_id, change):
+    """Update a queued entry from its current value: change(entry) returns fields to merge
+
+    Optimistic on the json backend (compare-and-swap on the entry's shard,
+    retried on conflict); transactional on the others. Returns the updated
+    entry, or None if it is not queued.
+    """
+    if BACKEND is not None:
+        return BACKEND.modify_entry(entry_id, change)
+    return sharded_queue.modify(entry_id, change)
+
+
+def load_stats():
+    """Load stats from file"""
+    today = counters.values()
+    if BACKEND is not None:
+        stats = BACKEND.load_stats()
+    else:
+        stats = _load_json(STATS_FILE, dict(DEFAULT_STATS))
+        for name in COUNTERS:
+            stats[name] = today.get(name, 0)
+    return _add_response_stats(stats, today)
+
+
+def _add_response_stats(stats, today):
+    """Fill the response-time stats from today's merged summary (None before any dispatch)"""
+    summary = counters.summaries().get(RESPONSE_SUMMARY)
+    if summary is None or summary.count == 0:
+        stats.update(avg_response=None, success_rate=None,
+                     response_p50=None, response_p90=None, response_p99=None)
+        return stats
+    stats['avg_response'] = summary.stats.mean
+    stats['success_rate'] = round(100 * today.get('responses_on_target', 0) / summary.count)
+    for q in (50, 90, 99):
+        stats[f'response_p{q}'] = summary.quantile(q / 100)
+    return stats
+
+
+def save_stats(stats):
+    """Save stats to file"""
+    if BACKEND is not None:
+        return BACKEND.save_stats(stats)
+    _save_json(STATS_FILE, stats)
+
+
+def increment_stat(name, amount=1):
+    """Add to a stats counter"""
+    if BACKEND is not None:
+        return BACKEND.increment_stat(name, amount)
+    if name in COUNTERS:
+        return counters.increment(name, amount)
+    with locked(lock_path(STATS_FILE)):
+        stats = load_stats()
+        stats[name] = stats.get(name, 0) + amount
+        save_stats(stats)
+
+
+def load_fleet():
+    """Load the units as a Fleet"""
+    if BACKEND is not None:
+        return BACKEND.load_fleet()
+    return Fleet.from_dict(_load_json(FLEET_FILE, dict(DEFAULT_FLEET)))
+
+
+def save_fleet(fleet):
+    """Save every unit"""
+    if BACKEND is not None:
+        return BACKEND.save_fleet(fleet)
+    def replace_units(data):
+        version = data.get('version', 0)
+        data.clear()
+        data.update(fleet.to_dict(), version=version)
+    update_versioned(FLEET_FILE, replace_units, dict(DEFAULT_FLEET))
+
+
+def load_fleet_status():
+    """Units per state, plus 'on_mission' and 'total'"""
+    if BACKEND is not None:
+        return BACKEND.load_fleet_status()
+    return load_fleet().counts()
+
+
+def _update_fleet(change, event='units_moved'):
+    """Apply change(fleet) to the stored units atomically; returns its result
+
+    `event` (or event(result)) is the event type recorded by the events backend.
+    """
+    if STORE == 'events':
+        return event_store.update_fleet(change, event)
+    if BACKEND is not None:
+        return BACKEND.update_fleet(change)
+
+    def change_document(data):
+        # Runs again on a fresh read whenever another writer won the swap
+        fleet = Fleet.from_dict(data)
+        result = change(fleet)
+        version = data.get('version', 0)
+        data.clear()
+        data.update(fleet.to_dict(), version=version)
+        return result
+    return update_versioned(FLEET_FILE, change_document, dict(DEFAULT_FLEET))
+
+
+def reset_fleet():
+    """Replace the fleet with DEFAULT_FLEET's units, all at base"""
+    save_fleet(Fleet.with_counts(DEFAULT_FLEET))
+
+
+def move_units(source, target):
+    """Move the unit longest in `source` to `target`; returns False if none is in `source`
+
+    Raises fleet.IllegalTransition if `target` cannot be reached from `source`.
+    """
+    def change(fleet):
+        unit_id = fleet.first(source)
+        if unit_id is None:
+            return False
+        fleet.transition(unit_id, target)
+        return True
+    return _update_fleet(change, 'sent_to_maintenance' if target == 'maintenance' else 'units_moved')
+
+
+def advance_unit(unit_id):
+    """Move a unit to its next state (en_route -> on_scene -> returning -> available)
+
+    Raises fleet.IllegalTransition for an available unit.
+    """
+    def change(fleet):
+        before = fleet.unit(unit_id)
+        fleet.advance(unit_id)
+        return before
+    before = _update_fleet(change, lambda before: 'mission_completed'
+                           if before['state'] == 'returning' else 'unit_advanced')
+    if before['state'] == 'returning':
+        _finish_mission(before)
+    return True
+
+
+def complete_mission():
+    """Bring the earliest-dispatched unit on a mission back to available
+
+    Returns False if no unit is on a mission.
+    """
+    def change(fleet):
+        heads = [fleet.unit(fleet.first(state)) for state in ACTIVE_STATES if fleet.first(state)]
+        if not heads:
+            return None
+        unit = min(heads, key=lambda unit: unit['dispatched_at'] or 0.0)
+        while fleet.unit(unit['id'])['state'] != 'available':
+            fleet.advance(unit['id'])
+        return unit
+    unit = _update_fleet(change, 'mission_completed')
+    if unit is None:
+        return False
+    _finish_mission(unit)
+    return True
+
+
+def _finish_mission(unit):
+    # Called with the unit as it was before it came back
+    counters.increment('missions_completed')
+    if unit.get('dispatched_at'):
+        counters.observe(MISSION_SUMMARY, max(0.0, time.time() - unit['dispatched_at']) / 60)
+    _archive({'id': unit.get('patient')}, 'mission_completed')
+
+
+def dispatch_patient(entry_id):
+    """Dequeue a patient, count the dispatch and send an available ambulance
+
+    The longest-idle available unit goes en route with the patient assigned.
+    Returns False without changing anything if the patient is no longer
+    queued or no ambulance is available. Atomic with the sqlite and events
+    backends. With JSON files, the unit is claimed by a compare-and-swap on
+    the versioned fleet document, and that claim decides races: a technician
+    who loses re-runs the claim on the new fleet and finds the patient
+    already assigned or the last unit gone. The winner then dequeues the
+    patient. The dispatched case is then archived to the history store.
+    """
+    if BACKEND is not None:
+        entry = BACKEND.dispatch_patient(entry_id)
+    else:
+        entry = sharded_queue.get(entry_id)
+        if entry is None:
+            return False
+        zones = [entry['zone']] if entry.get('zone') else None
+
+        def claim(fleet):
+            if any(unit['patient'] == entry_id for state in ACTIVE_STATES for unit in fleet.units(state)):
+                return 'taken'
+            unit_id = fleet.first('available')
+            if unit_id is not None:
+                fleet.transition(unit_id, 'en_route', patient=entry_id, destination=entry.get('location'))
+            return unit_id
+
+        claimed = _update_fleet(claim)
+        if claimed == 'taken':
+            # Another dispatch won; finish its dequeue in case it stopped before it (idempotent)
+            sharded_queue.dispatch(entry_id, zones)
+            return False
+        if claimed is None:
+            return False
+        sharded_queue.dispatch(entry_id, zones)
+        increment_stat('dispatched')
+    if entry is None:
+        return False
+    _observe_response(entry)
+    _archive(entry, 'dispatched')
+    return True
+
+
+def _observe_response(entry):
+    created = ids.created_at(entry.get('id'))
+    if created is None:
+        return
+    minutes = max(0.0, time.time() - created) / 60
+    counters.observe(RESPONSE_SUMMARY, minutes)
+    if minutes <= RESPONSE_TARGET_MINUTES.get(entry.get('priority'), RESPONSE_TARGET_MINUTES['LOW']):
+        counters.increment('responses_on_target')
+
+
+def _archive(entry, event):
+    # The dispatch has already happened; a history write error must not undo or hide it
+    try:
+        history.record(entry, event)
+    except Exception as e:
+        print(f"⚠️ Could not archive case {entry.get('id')}: {e}")
@@ -0,0 +1,147 @@
+"""
+Streaming, mergeable summaries of a stream of numbers (response times).
+
+RunningStats keeps count, mean and the sum of squared deviations (Welford),
+so mean and variance are updated in O(1) per value without storing the
+values. Two summaries combine exactly with Chan's parallel formula, so the
+per-process summaries in counters.py merge into one.
+
+QuantileSketch is a log-bucketed histogram (as in DDSketch). A value x
+falls in bucket ceil(log_gamma(x)), with gamma = (1 + a) / (1 - a), and any
+quantile it returns is within relative error a (RELATIVE_ACCURACY) of a
+true value at that rank. Adding is one dict increment, merging is adding
+bucket counts, and the bucket count only grows with log(max / min). For
+response times between a second and a day that is a few hundred buckets.
+
+Summary bundles both, and each has a JSON form (to_dict / from_dict).
+"""
+import math
+
+RELATIVE_ACCURACY = 0.01
+MIN_VALUE = 1e-3
+
+
+class RunningStats:
+    """Welford mean and variance"""
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        return self
+
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def stdev(self):
+        return math.sqrt(self.variance())
+
+    def to_dict(self):
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('count', 0), data.get('mean', 0.0), data.get('m2', 0.0))
+
+
+class QuantileSketch:
+    """Log-bucketed histogram with relative-error quantiles"""
+
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY, buckets=None, zeros=0):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = buckets or {}   # bucket index -> count
+        self.zeros = zeros             # values below MIN_VALUE
+
+    @property
+    def count(self):
+        return self.zeros + sum(self.buckets.values())
+
+    def add(self, value):
+        if value < MIN_VALUE:
+            self.zeros += 1
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different accuracy")
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zeros += other.zeros
+        return self
+
+    def quantile(self, q):
+        """Value at quantile q (0..1), or None if the sketch is empty"""
+        total = self.count
+        if total == 0:
+            return None
+        rank = q * (total - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                # Midpoint (in relative terms) of (gamma^(i-1), gamma^i]
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def to_dict(self):
+        return {'accuracy': self.relative_accuracy, 'zeros': self.zeros,
+                'buckets': {str(index): count for index, count in self.buckets.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('accuracy', RELATIVE_ACCURACY),
+                   {int(index): count for index, count in data.get('buckets', {}).items()},
+                   data.get('zeros', 0))
+
+
+class Summary:
+    """Mean, variance and quantiles of one stream"""
+
+    def __init__(self, stats=None, sketch=None):
+        self.stats = stats or RunningStats()
+        self.sketch = sketch or QuantileSketch()
+
+    @property
+    def count(self):
+        return self.stats.count
+
+    def add(self, value):
+        self.stats.add(value)
+        self.sketch.add(value)
+
+    def merge(self, other):
+        self.stats.merge(other.stats)
+        self.sketch.merge(other.sketch)
+        return self
+
+    def quantile(self, q):
+        return self.sketch.quantile(q)
+
+    def to_dict(self):
+        return {'stats': self.stats.to_dict(), 'sketch': self.sketch.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(RunningStats.from_dict(data.get('stats', {})),
+                   QuantileSketch.from_dict(data.get('sketch', {})))
@@ -0,0 +1,442 @@
+"""
+Event-sourced store for the queue, stats and fleet.
+
+    AMBULANCE_STORE=events streamlit run index.py
+    python -m ambulance.event_store            # replay and print the current state
+    python -m ambulance.event_store --tail 20  # and the last 20 events
+
+Selected with AMBULANCE_STORE=events (see datastore.py). Every change is
+one line of an append-only log, events.jsonl:
+
+    {"seq": 42, "type": "dispatched", "at": 1760000000.0, "id": 123..., "units": [{...}]}
+
+The current queue, stats and fleet are a fold of those events (apply()).
+A dispatch is a single event carrying the removed request, the counter
+bump and the unit sent. A crash can therefore lose the whole dispatch or
+none of it, never leave the three disagreeing. Fleet events carry the
+units as they are after the change, so replay does not re-run transition
+logic and yields exactly what the writer saw.
+
+The daily counters (calls_today, dispatched) are folded per local day of
+each event's timestamp, keeping the last DAILY_DAYS days. load_stats
+reports the current day's counts, so they start from zero at midnight as
+on the other backends.
+
+Every SNAPSHOT_EVERY events the writer saves the folded state with its
+seq and log offset to events.snapshot.json. A process starting up reads
+that snapshot and replays only the log after it. After that, each read
+folds just the events appended since its last read, as queue_log.py does.
+Events with a seq the state already covers are skipped, so replay stays
+correct even if the snapshot and log offsets disagree. A torn last line
+left by a crashed writer is ignored by readers and cut off by the next
+writer.
+
+Writers hold an flock on events.lock. Under it they catch up with the
+log, validate the change against the current state (a patient still
+queued, a unit still available), append one event and fold it in. The
+first use imports the JSON store as a state_imported event. The JSON
+files are not modified.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+from ambulance.fleet import ACTIVE_STATES, STATES, Fleet
+from ambulance.locking import append_bytes, atomic_write_json, locked
+from ambulance.priority_queue import DispatchQueue, entry_key
+
+EVENT_PREFIX = os.environ.get('AMBULANCE_EVENTS', 'events')
+LOG_FILE = EVENT_PREFIX + '.jsonl'
+SNAPSHOT_FILE = EVENT_PREFIX + '.snapshot.json'
+LOCK_FILE = EVENT_PREFIX + '.lock'
+
+SNAPSHOT_EVERY = 500
+
+# Counters kept per day (datastore.COUNTERS) and how many days are kept
+DAILY_COUNTERS = ('calls_today', 'dispatched')
+DAILY_DAYS = 31
+
+# Events whose payload is the changed units, folded by replacing them
+FLEET_EVENTS = ('mission_completed', 'sent_to_maintenance', 'unit_advanced', 'units_moved')
+
+
+class State:
+    """Folded queue, intake refs, stats, daily counters and fleet as of event `seq`"""
+
+    def __init__(self, queue=(), intake_refs=(), stats=None, fleet=None, seq=0, daily=None):
+        self.queue = DispatchQueue(queue)
+        self.intake_refs = set(intake_refs)
+        self.stats = dict(stats or {})
+        self.daily = {day: dict(counts) for day, counts in (daily or {}).items()}
+        self.fleet = Fleet.from_dict(fleet or {'units': []})
+        self.seq = seq
+
+    def to_dict(self):
+        return {'seq': self.seq, 'queue': self.queue.entries(), 'intake_refs': sorted(self.intake_refs),
+                'stats': self.stats, 'daily': self.daily, 'fleet': self.fleet.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('queue', []), data.get('intake_refs', []), data.get('stats'),
+                   data.get('fleet'), data.get('seq', 0), data.get('daily'))
+
+
+def _day(timestamp=None):
+    """Local calendar day of a timestamp (default now), as counters.today() uses"""
+    return time.strftime('%Y-%m-%d', time.localtime(timestamp))
+
+
+def _count(state, event, name, amount):
+    """Add to a stat; daily counters go to the event's day"""
+    if name not in DAILY_COUNTERS:
+        state.stats[name] = state.stats.get(name, 0) + amount
+        return
+    counts = state.daily.setdefault(_day(event.get('at')), {})
+    counts[name] = counts.get(name, 0) + amount
+    for day in sorted(state.daily)[:-DAILY_DAYS]:
+        del state.daily[day]
+
+
+def _set_stats(state, event, stats):
+    """Replace the stats; daily counters in them become the event day's counts"""
+    stats = dict(stats)
+    for name in DAILY_COUNTERS:
+        if name in stats:
+            state.daily.setdefault(_day(event.get('at')), {})[name] = stats.pop(name)
+    state.stats = stats
+
+
+def _add_entries(state, entries):
+    for entry in entries:
+        if state.queue.push(entry) and entry.get('intake_ref'):
+            state.intake_refs.add(entry['intake_ref'])
+
+
+def apply(state, event):
+    """Fold one event into a State"""
+    kind = event.get('type')
+    if kind == 'state_imported':
+        imported = State.from_dict(event)
+        state.queue, state.intake_refs = imported.queue, imported.intake_refs
+        state.fleet = imported.fleet
+        _set_stats(state, event, imported.stats)
+    elif kind == 'request_created':
+        _add_entries(state, event['entries'])
+    elif kind == 'request_updated':
+        state.queue.update(event['id'], event.get('fields') or {})
+    elif kind == 'dispatched':
+        state.queue.remove(event['id'])
+        _count(state, event, 'dispatched', 1)
+        for unit in event.get('units', []):
+            state.fleet.put(unit)
+    elif kind == 'stat_incremented':
+        _count(state, event, event['name'], event['amount'])
+    elif kind == 'stats_saved':
+        _set_stats(state, event, event['stats'])
+    elif kind == 'fleet_reset':
+        state.fleet = Fleet(event['units'])
+    elif kind in FLEET_EVENTS:
+        for unit in event.get('units', []):
+            state.fleet.put(unit)
+    state.seq = event.get('seq', state.seq)
+
+
+def _log_size():
+    try:
+        return os.path.getsize(LOG_FILE)
+    except OSError:
+        return 0
+
+
+def _replay(state, offset):
+    """Fold complete log lines from `offset` that are newer than the state; returns the new offset"""
+    try:
+        f = open(LOG_FILE, 'rb')
+    except OSError:
+        return 0
+    with f:
+        f.seek(offset)
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                break  # torn final write; ignore until it is completed
+            offset += len(raw)
+            try:
+                event = json.loads(raw)
+            except ValueError:
+                continue
+            if event.get('seq', 0) > state.seq:
+                apply(state, event)
+    return offset
+
+
+class EventStore:
+    """Per-process folded view of the event log"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._state = None
+        self._offset = 0
+
+    def _load_snapshot(self):
+        try:
+            with open(SNAPSHOT_FILE, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return State(), 0
+        return State.from_dict(data['state']), data.get('offset', 0)
+
+    def _refresh(self):
+        """Fold events appended since the last call; caller holds self._lock and a file lock"""
+        log_size = _log_size()
+        if self._state is not None and log_size == self._offset:
+            return
+        if self._state is None or log_size < self._offset:
+            self._state, self._offset = self._load_snapshot()
+            if self._offset > log_size:
+                self._offset = 0  # log replaced; fall back to seq checks from the start
+        self._offset = _replay(self._state, self._offset)
+
+    def read(self, view):
+        """Return view(state) for the current state"""
+        with self._lock:
+            with locked(LOCK_FILE, exclusive=False):
+                self._refresh()
+            return view(self._state)
+
+    def commit(self, build):
+        """Append the event build(state) returns and fold it in
+
+        build returns (event or None, result); nothing is written for None.
+        Returns result.
+        """
+        with self._lock:
+            with locked(LOCK_FILE):
+                self._refresh()
+                if _log_size() > self._offset:
+                    # A torn final line from a crashed writer; drop it before appending
+                    os.truncate(LOG_FILE, self._offset)
+                if self._state.seq == 0 and not os.path.exists(SNAPSHOT_FILE):
+                    self._append(_import_event())
+                event, result = build(self._state)
+                if event is not None:
+                    self._append(event)
+                return result
+
+    def _append(self, event):
+        event = dict(event, seq=self._state.seq + 1, at=time.time())
+        data = (json.dumps(event, separators=(',', ':')) + '\n').encode('utf-8')
+        append_bytes(LOG_FILE, data)
+        # Fold the written form, so this process's state matches a replay exactly
+        apply(self._state, json.loads(data))
+        self._offset += len(data)
+        if self._state.seq % SNAPSHOT_EVERY == 0:
+            self.snapshot()
+
+    def snapshot(self):
+        """Save the folded state and the log offset it covers"""
+        with self._lock:
+            with locked(LOCK_FILE):
+                self._refresh()
+                atomic_write_json(SNAPSHOT_FILE, {'offset': self._offset, 'state': self._state.to_dict()},
+                                  indent=None)
+
+
+def _import_event():
+    """state_imported event holding the JSON store's queue, stats and fleet"""
+    from ambulance import counters, datastore
+    from ambulance.shards import sharded_queue
+
+    queue = sharded_queue.load()
+    for entry in queue:
+        if entry.get('id') is None:
+            entry['id'] = datastore.new_request_id()
+    stats = datastore._load_json(datastore.STATS_FILE, dict(datastore.DEFAULT_STATS))
+    # The JSON store's daily counts live in the counter shards, not the stats file
+    today = counters.values()
+    for name in DAILY_COUNTERS:
+        stats[name] = today.get(name, 0)
+    fleet = Fleet.from_dict(datastore._load_json(datastore.FLEET_FILE, dict(datastore.DEFAULT_FLEET)))
+    print(f"✅ Imported {len(queue)} queued requests, stats and fleet status into {LOG_FILE}")
+    return {'type': 'state_imported', 'queue': queue,
+            'intake_refs': [entry['intake_ref'] for entry in queue if entry.get('intake_ref')],
+            'stats': stats, 'fleet': fleet.to_dict()}
+
+
+store = EventStore()
+
+
+def _ensure_imported():
+    # Reads before the first write still see the imported JSON store
+    if not os.path.exists(LOG_FILE) and not os.path.exists(SNAPSHOT_FILE):
+        store.commit(lambda state: (None, None))
+
+
+def _read(view):
+    _ensure_imported()
+    return store.read(view)
+
+
+# =======================================================
+# QUEUE
+# =======================================================
+
+def load_queue(zones=None):
+    """Return queued entries of the given zones (default all) in dispatch order"""
+    return _read(lambda state: [dict(entry) for entry in state.queue.entries()
+                                if not zones or entry.get('zone') in zones])
+
+
+def is_queued(entry_id):
+    return _read(lambda state: entry_id in state.queue)
+
+
+def seen_intake_ref(intake_ref):
+    return _read(lambda state: intake_ref in state.intake_refs)
+
+
+def next_patient(zones=None):
+    """Return the next entry to dispatch, or None"""
+    def view(state):
+        if not zones:
+            entry = state.queue.peek()
+        else:
+            entry = next((entry for entry in state.queue.entries() if entry.get('zone') in zones), None)
+        return dict(entry) if entry is not None else None
+    return _read(view)
+
+
+def enqueue(*entries):
+    """Record new requests (ids already queued are dropped)"""
+    def build(state):
+        fresh, seen = [], set()
+        for entry in entries:
+            key = entry_key(entry)
+            if key in state.queue or key in seen:
+                continue
+            seen.add(key)
+            fresh.append(entry)
+        return ({'type': 'request_created', 'entries': fresh} if fresh else None), None
+    store.commit(build)
+
+
+def update_entry(entry_id, fields):
+    """Merge fields into a queued entry"""
+    store.commit(lambda state: ({'type': 'request_updated', 'id': entry_id, 'fields': fields}, None)
+                 if entry_id in state.queue else (None, None))
+
+
+def modify_entry(entry_id, change):
+    """Merge change(entry) into a queued entry as one request_updated event; returns it or None"""
+    def build(state):
+        entry = state.queue.get(entry_id)
+        if entry is None:
+            return None, None
+        fields = change(dict(entry))
+        if not fields:
+            return None, dict(entry)
+        return {'type': 'request_updated', 'id': entry_id, 'fields': fields}, dict(entry, **fields)
+    return store.commit(build)
+
+
+# =======================================================
+# STATS AND FLEET
+# =======================================================
+
+def load_stats():
+    """Stats with today's daily counters (zero until the first event of the day)"""
+    def view(state):
+        stats = dict(state.stats)
+        today = state.daily.get(_day(), {})
+        for name in DAILY_COUNTERS:
+            stats[name] = today.get(name, 0)
+        return stats
+    return _read(view)
+
+
+def save_stats(stats):
+    store.commit(lambda state: ({'type': 'stats_saved', 'stats': dict(stats)}, None))
+
+
+def increment_stat(name, amount=1):
+    store.commit(lambda state: ({'type': 'stat_incremented', 'name': name, 'amount': amount}, None))
+
+
+def load_fleet():
+    return _read(lambda state: Fleet(state.fleet.units()))
+
+
+def save_fleet(fleet):
+    """Replace every unit (a fleet_reset event)"""
+    store.commit(lambda state: ({'type': 'fleet_reset', 'units': fleet.units()}, None))
+
+
+def update_fleet(change, event='units_moved'):
+    """Call change(fleet) on a copy of the fleet and record the units it changed
+
+    `event` is the event type, or a function of change's result returning it.
+    """
+    def build(state):
+        before = {unit['id']: unit for unit in state.fleet.units()}
+        fleet = Fleet(before.values())
+        result = change(fleet)
+        changed = [unit for unit in fleet.units() if unit != before.get(unit['id'])]
+        if not changed:
+            return None, result
+        kind = event(result) if callable(event) else event
+        return {'type': kind, 'units': changed}, result
+    return store.commit(build)
+
+
+def load_fleet_status():
+    """Units per state, plus 'on_mission' and 'total'"""
+    return _read(lambda state: state.fleet.counts())
+
+
+def dispatch_patient(entry_id):
+    """Dequeue a patient and send the longest-idle unit as one event
+
+    Returns the dispatched entry, or None (and records nothing) if the
+    patient is no longer queued or no ambulance is available.
+    """
+    def build(state):
+        entry = state.queue.get(entry_id)
+        unit_id = state.fleet.first('available')
+        if entry is None or unit_id is None:
+            return None, None
+        fleet = Fleet([state.fleet.unit(unit_id)])
+        unit = fleet.transition(unit_id, 'en_route', patient=entry_id, destination=entry.get('location'))
+        return {'type': 'dispatched', 'id': entry_id, 'units': [unit]}, dict(entry)
+    return store.commit(build)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay the event log and print the current state")
+    parser.add_argument('--tail', type=int, default=0, help='also print the last N events')
+    parser.add_argument('--snapshot', action='store_true', help='write a snapshot now')
+    args = parser.parse_args(argv)
+
+    if args.snapshot:
+        _ensure_imported()
+        store.snapshot()
+    state = _read(lambda state: state)
+    counts = state.fleet.counts()
+    print(f"{LOG_FILE}: {state.seq} events, {len(state.queue)} queued, stats {state.stats}, today {state.daily.get(_day(), {})}")
+    print("fleet " + ', '.join(f"{counts[name]} {name}" for name in STATES + ('total',)))
+    busy = [unit for state_name in ACTIVE_STATES for unit in state.fleet.units(state_name)]
+    for unit in busy:
+        print(f"  {unit['id']:<8} {unit['state']:<10} patient {unit['patient']}")
+    if args.tail:
+        try:
+            with open(LOG_FILE, 'rb') as f:
+                lines = f.readlines()[-args.tail:]
+        except OSError:
+            lines = []
+        for raw in lines:
+            event = json.loads(raw)
+            print(f"  #{event['seq']:<6} {time.strftime('%H:%M:%S', time.localtime(event['at']))} {event['type']}")
+
+
+if __name__ == '__main__':
+    main()
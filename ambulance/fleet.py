@@ -0,0 +1,170 @@
+"""
+Per-ambulance fleet model.
+
+Each unit is a small dict:
+
+    {'id': 'AMB-03', 'state': 'en_route', 'position': 'Central Station',
+     'destination': 'Nandanvan, Nagpur', 'base': 'Central Station',
+     'patient': 1234..., 'since': 1760000000.0, 'dispatched_at': 1760000000.0}
+
+A unit moves only along TRANSITIONS. A mission is
+available -> en_route -> on_scene -> returning -> available. An en-route
+unit can be stood down straight back to available. Only an idle or
+returning unit can go to maintenance. Anything else raises
+IllegalTransition.
+
+Fleet keeps one insertion-ordered index per state (a dict used as an
+ordered set). Picking a unit in a state is a lookup of the first key,
+which is the unit that has been in that state longest, and a transition
+moves one key between two indexes. Both are O(1). The counts shown on the
+dashboard are the index sizes, so they cannot go negative or disagree
+with the units.
+
+fleet_status.json and the SQLite units table store the unit list
+(to_dict). The old four-count format is still read: from_dict expands it
+into that many units at DEFAULT_BASE.
+"""
+import time
+
+STATES = ('available', 'en_route', 'on_scene', 'returning', 'maintenance')
+ACTIVE_STATES = ('en_route', 'on_scene', 'returning')
+
+TRANSITIONS = {
+    'available': ('en_route', 'maintenance'),
+    'en_route': ('on_scene', 'available'),   # stood down before arrival
+    'on_scene': ('returning',),
+    'returning': ('available', 'maintenance'),
+    'maintenance': ('available',),
+}
+
+# Next step when a technician advances a unit
+NEXT_STATE = {
+    'en_route': 'on_scene',
+    'on_scene': 'returning',
+    'returning': 'available',
+    'maintenance': 'available',
+}
+
+DEFAULT_BASE = 'Central Station'
+
+
+class IllegalTransition(ValueError):
+    """A unit was asked to move to a state it cannot reach from its current one"""
+
+
+def make_unit(unit_id, state='available', base=DEFAULT_BASE, since=0.0):
+    return {'id': unit_id, 'state': state, 'position': base, 'destination': None,
+            'base': base, 'patient': None, 'since': since, 'dispatched_at': None}
+
+
+class Fleet:
+    """Units by id, with an ordered index of unit ids per state"""
+
+    def __init__(self, units=()):
+        self._units = {}
+        self._by_state = {state: {} for state in STATES}
+        # Oldest in state first, so first() picks the longest-idle unit
+        for unit in sorted(units, key=lambda unit: unit.get('since') or 0.0):
+            self.add(unit)
+
+    def add(self, unit):
+        unit = dict(make_unit(unit['id']), **unit)
+        if unit['state'] not in self._by_state:
+            raise IllegalTransition(f"Unknown state {unit['state']!r} for {unit['id']}")
+        if unit['id'] in self._units:
+            raise ValueError(f"Duplicate unit {unit['id']}")
+        self._units[unit['id']] = unit
+        self._by_state[unit['state']][unit['id']] = None
+
+    def put(self, unit):
+        """Add a unit or replace it with a stored copy (no transition check; for replaying saved units)"""
+        old = self._units.pop(unit['id'], None)
+        if old is not None:
+            del self._by_state[old['state']][old['id']]
+        self.add(unit)
+
+    @classmethod
+    def with_counts(cls, counts, base=DEFAULT_BASE):
+        """Fleet of numbered units matching per-state counts (the old file format)"""
+        units = []
+        for state in STATES:
+            units += [state] * max(0, int(counts.get(state, 0) or 0))
+        # Any of 'total' not covered by a state is available
+        units += ['available'] * max(0, int(counts.get('total', 0) or 0) - len(units))
+        width = max(2, len(str(len(units))))
+        return cls(make_unit(f'AMB-{i + 1:0{width}d}', state, base)
+                   for i, state in enumerate(units))
+
+    @classmethod
+    def from_dict(cls, data):
+        if 'units' in data:
+            return cls(data['units'])
+        return cls.with_counts(data)
+
+    def to_dict(self):
+        return {'units': self.units()}
+
+    def __len__(self):
+        return len(self._units)
+
+    def __contains__(self, unit_id):
+        return unit_id in self._units
+
+    def unit(self, unit_id):
+        """Copy of a unit, or None"""
+        unit = self._units.get(unit_id)
+        return dict(unit) if unit is not None else None
+
+    def units(self, state=None):
+        """Copies of all units by id, or of one state's units longest-in-state first"""
+        if state is None:
+            return [dict(self._units[unit_id]) for unit_id in sorted(self._units)]
+        return [dict(self._units[unit_id]) for unit_id in self._by_state[state]]
+
+    def first(self, state):
+        """Id of the unit longest in `state`, or None"""
+        return next(iter(self._by_state[state]), None)
+
+    def counts(self):
+        """Units per state plus 'on_mission' and 'total', derived from the indexes"""
+        counts = {state: len(ids) for state, ids in self._by_state.items()}
+        counts['on_mission'] = sum(counts[state] for state in ACTIVE_STATES)
+        counts['total'] = len(self._units)
+        return counts
+
+    def transition(self, unit_id, target, patient=None, destination=None, now=None):
+        """Move a unit to `target` if TRANSITIONS allow it; returns the updated unit"""
+        unit = self._units.get(unit_id)
+        if unit is None:
+            raise KeyError(unit_id)
+        source = unit['state']
+        if target not in TRANSITIONS[source]:
+            raise IllegalTransition(f"{unit_id} cannot go from {source} to {target}")
+        now = time.time() if now is None else now
+
+        if target == 'en_route':
+            if patient is None:
+                raise IllegalTransition(f"{unit_id} needs a patient to go en route")
+            unit.update(patient=patient, destination=destination, dispatched_at=now)
+        elif target == 'on_scene':
+            unit['position'] = unit['destination'] or unit['position']
+        elif target == 'returning':
+            unit['destination'] = unit['base']
+        else:
+            # available or maintenance: back at base with no patient
+            unit.update(position=unit['base'], destination=None, patient=None, dispatched_at=None)
+
+        del self._by_state[source][unit_id]
+        self._by_state[target][unit_id] = None
+        unit['state'] = target
+        unit['since'] = now
+        return dict(unit)
+
+    def advance(self, unit_id, now=None):
+        """Move a unit to its NEXT_STATE"""
+        unit = self._units.get(unit_id)
+        if unit is None:
+            raise KeyError(unit_id)
+        if unit['state'] not in NEXT_STATE:
+            raise IllegalTransition(f"{unit_id} is {unit['state']} and has nothing to advance to")
+        return self.transition(unit_id, NEXT_STATE[unit['state']], now=now)
@@ -0,0 +1,237 @@
+"""
+Cold history store for dispatched cases.
+
+    python -m ambulance.history            # seal pending rows and list partitions
+    python -m ambulance.history --days 7   # summary of the last 7 days
+
+The live queue only holds waiting patients. When a patient is dispatched,
+datastore records the case here so it is kept for analytics. The store is
+partitioned by UTC day:
+
+    history/2026-10-17/pending.jsonl              # recent rows, one JSON line each
+    history/2026-10-17/part-<content hash>.npz    # sealed rows, compressed columns
+
+Recording a case is one short append to pending.jsonl. Once that file
+passes SEAL_BYTES, or its day is over (checked when a process records its
+first case of a new day), it is sealed. The rows are written
+as one compressed .npz part with one array per column (COLUMNS), and the
+pending file is removed. Sealing first renames pending.jsonl to
+sealing.jsonl. An interrupted seal is finished on the next call, and
+rewriting the part gives the same file, so no row is lost or doubled.
+
+scan() reads only the requested columns of the requested days. An .npz
+member is decompressed only when it is accessed. Sealing needs NumPy;
+without it, rows stay in pending.jsonl and scan() returns plain lists.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from ambulance import ids
+from ambulance.locking import append_bytes, locked
+
+HISTORY_DIR = os.environ.get('AMBULANCE_HISTORY_DIR', 'history')
+LOCK_FILE = os.path.join(HISTORY_DIR, '.lock')
+PENDING_FILE = 'pending.jsonl'
+SEALING_FILE = 'sealing.jsonl'
+
+SEAL_BYTES = 256 * 1024
+
+# Day whose earlier partitions this process has already sealed
+_sealed_before = None
+
+# Column -> NumPy dtype in sealed parts (strings are fixed-width unicode)
+COLUMNS = {
+    'id': 'int64',
+    'event': 'U',
+    'event_at': 'float64',
+    'wait_seconds': 'float64',
+    'priority': 'U',
+    'severity_score': 'int32',
+    'condition': 'U',
+    'location': 'U',
+    'age': 'U',
+    'name': 'U',
+    'phone': 'U',
+    'symptoms': 'U',
+}
+
+
+def day_of(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d')
+
+
+def _day_dir(day):
+    return os.path.join(HISTORY_DIR, day)
+
+
+def _locked(exclusive=True):
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+    return locked(LOCK_FILE, exclusive)
+
+
+def case_row(entry, event, event_at=None):
+    """Flatten a queue entry into a history row"""
+    event_at = time.time() if event_at is None else event_at
+    entry_id = entry.get('id')
+    created = ids.created_at(entry_id, event_at)
+    wait = event_at - created if created is not None else float('nan')
+    return {
+        'id': entry_id if isinstance(entry_id, int) else -1,
+        'event': event,
+        'event_at': event_at,
+        'wait_seconds': wait,
+        'priority': str(entry.get('priority', '')),
+        'severity_score': int(entry.get('severity_score') or 0),
+        'condition': str(entry.get('condition', '')),
+        'location': str(entry.get('location', '')),
+        'age': str(entry.get('age', '')),
+        'name': str(entry.get('name', '')),
+        'phone': str(entry.get('phone', '')),
+        'symptoms': str(entry.get('symptoms', '')),
+    }
+
+
+def record(entry, event='dispatched', event_at=None):
+    """Append a case to today's partition, sealing it if it grew past SEAL_BYTES"""
+    global _sealed_before
+    row = case_row(entry, event, event_at)
+    day = day_of(row['event_at'])
+    day_dir = _day_dir(day)
+    os.makedirs(day_dir, exist_ok=True)
+    path = os.path.join(day_dir, PENDING_FILE)
+    with _locked():
+        size = append_bytes(path, (json.dumps(row) + '\n').encode('utf-8'))
+        if size >= SEAL_BYTES:
+            _seal_day(day_dir)
+        if _sealed_before != day:
+            for older in days():
+                if older < day:
+                    _seal_day(_day_dir(older))
+            _sealed_before = day
+
+
+def _read_rows(path):
+    rows = []
+    try:
+        with open(path, 'rb') as f:
+            for raw in f:
+                if raw.endswith(b'\n'):
+                    rows.append(json.loads(raw))
+    except OSError:
+        pass
+    return rows
+
+
+def _seal_day(day_dir):
+    """Turn a day's pending rows into a compressed part; caller holds the lock"""
+    try:
+        import numpy as np
+    except ImportError:
+        return False
+    pending = os.path.join(day_dir, PENDING_FILE)
+    sealing = os.path.join(day_dir, SEALING_FILE)
+    if not os.path.exists(sealing):
+        if not os.path.exists(pending):
+            return False
+        os.replace(pending, sealing)
+    with open(sealing, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:16]
+    rows = _read_rows(sealing)
+    if rows:
+        # Named after the content, so re-running an interrupted seal rewrites the same part
+        part = os.path.join(day_dir, f"part-{digest}.npz")
+        tmp_path = part + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **{
+                name: np.array([row[name] for row in rows], dtype=dtype)
+                for name, dtype in COLUMNS.items()
+            })
+        os.replace(tmp_path, part)
+    os.remove(sealing)
+    return True
+
+
+def days():
+    """Partition days on disk, oldest first"""
+    try:
+        names = os.listdir(HISTORY_DIR)
+    except OSError:
+        return []
+    return sorted(name for name in names if os.path.isdir(_day_dir(name)))
+
+
+def seal(include_today=False):
+    """Seal pending rows of finished days (and today's too if asked); returns days sealed"""
+    today = day_of(time.time())
+    sealed = []
+    with _locked():
+        for day in days():
+            if (day < today or include_today) and _seal_day(_day_dir(day)):
+                sealed.append(day)
+    return sealed
+
+
+def scan(columns=('id', 'event_at', 'priority'), start_day=None, end_day=None):
+    """Requested columns over a day range (inclusive), parts first then pending rows
+
+    Returns {column: NumPy array} when NumPy is available, else {column: list}.
+    """
+    unknown = set(columns) - set(COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown history columns: {sorted(unknown)}")
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+
+    chunks = {name: [] for name in columns}
+    with _locked(exclusive=False):
+        for day in days():
+            if (start_day and day < start_day) or (end_day and day > end_day):
+                continue
+            day_dir = _day_dir(day)
+            if np is not None:
+                for part in sorted(name for name in os.listdir(day_dir) if name.endswith('.npz')):
+                    with np.load(os.path.join(day_dir, part)) as data:
+                        for name in columns:
+                            chunks[name].append(data[name])
+            rows = _read_rows(os.path.join(day_dir, SEALING_FILE)) \
+                + _read_rows(os.path.join(day_dir, PENDING_FILE))
+            if rows:
+                for name in columns:
+                    values = [row[name] for row in rows]
+                    chunks[name].append(np.array(values, dtype=COLUMNS[name]) if np is not None else values)
+
+    if np is None:
+        return {name: [v for chunk in chunks[name] for v in chunk] for name in columns}
+    return {
+        name: np.concatenate(chunks[name]) if chunks[name] else np.array([], dtype=COLUMNS[name])
+        for name in columns
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seal and summarize the dispatch history")
+    parser.add_argument('--days', type=int, default=0, help='summarize the last N days')
+    parser.add_argument('--include-today', action='store_true', help="also seal today's pending rows")
+    args = parser.parse_args(argv)
+
+    for day in seal(include_today=args.include_today):
+        print(f"✅ Sealed {day}")
+    start_day = None
+    if args.days:
+        start_day = (datetime.now(timezone.utc) - timedelta(days=args.days - 1)).strftime('%Y-%m-%d')
+    data = scan(('priority', 'wait_seconds'), start_day=start_day)
+    print(f"{len(days())} day partitions, {len(data['priority'])} cases")
+    for priority in ('HIGH', 'MEDIUM', 'LOW'):
+        waits = [w for p, w in zip(data['priority'], data['wait_seconds']) if p == priority and w == w]
+        if waits:
+            print(f"  {priority:<6} {len(waits):>6} cases, mean wait {sum(waits) / len(waits):.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Persistent id index for the JSON queue.
+
+A small SQLite file (emergency_queue.idx) next to the queue log with two
+keyed tables:
+
+    queued       ids of entries currently in the queue
+    intake_refs  every intake_ref ever enqueued (kept after dispatch)
+
+queue_log updates it in the same locked section as each log append. So
+"is this id queued?" and "was this intake line already taken?" are a
+single key lookup, and their cost does not grow with the queue. Without
+the index, each check replays the log and scans every entry.
+
+The index records the snapshot key and log offset it covers. If they do
+not match the files (a crash between the log write and the index update,
+or the files were edited by hand), the caller rebuilds it from a replay.
+The log stays the source of truth.
+"""
+import json
+import sqlite3
+import threading
+
+INDEX_FILE = "emergency_queue.idx"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queued (id TEXT PRIMARY KEY) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS intake_refs (ref TEXT PRIMARY KEY) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def _id_key(entry_id):
+    # Ids are ints (or names for very old entries); keep them distinct as text
+    return json.dumps(entry_id)
+
+
+class IdIndex:
+    """Keyed sets of queued ids and seen intake refs, stored in SQLite"""
+
+    def __init__(self, path=INDEX_FILE):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def position(self):
+        """(snapshot key, log offset) the index is up to date with, or None"""
+        row = self._conn().execute("SELECT value FROM meta WHERE key = 'position'").fetchone()
+        if row is None:
+            return None
+        snapshot_key, offset = json.loads(row[0])
+        return (tuple(snapshot_key) if snapshot_key else None), offset
+
+    def is_current(self, snapshot_key, log_offset):
+        return self.position() == (snapshot_key, log_offset)
+
+    def _set_position(self, conn, snapshot_key, log_offset):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('position', ?)",
+                     (json.dumps([snapshot_key, log_offset]),))
+
+    def rebuild(self, entries, snapshot_key, log_offset):
+        """Replace the queued set with `entries` (intake refs are only added)"""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM queued')
+            self._add(conn, entries)
+            self._set_position(conn, snapshot_key, log_offset)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def apply(self, records, snapshot_key, log_offset):
+        """Apply queue log records that were just appended"""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for record in records:
+                op = record.get('op')
+                if op == 'enqueue':
+                    self._add(conn, [record['entry']])
+                elif op == 'dispatch':
+                    conn.execute('DELETE FROM queued WHERE id = ?', (_id_key(record.get('id')),))
+            self._set_position(conn, snapshot_key, log_offset)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _add(self, conn, entries):
+        conn.executemany('INSERT OR IGNORE INTO queued (id) VALUES (?)',
+                         [(_id_key(entry.get('id') or entry.get('name')),) for entry in entries])
+        conn.executemany('INSERT OR IGNORE INTO intake_refs (ref) VALUES (?)',
+                         [(entry['intake_ref'],) for entry in entries if entry.get('intake_ref')])
+
+    def contains(self, entry_id):
+        """True if the id is currently queued"""
+        return self._conn().execute('SELECT 1 FROM queued WHERE id = ?',
+                                    (_id_key(entry_id),)).fetchone() is not None
+
+    def has_intake_ref(self, intake_ref):
+        """True if an entry with this intake_ref was ever enqueued"""
+        return self._conn().execute('SELECT 1 FROM intake_refs WHERE ref = ?',
+                                    (intake_ref,)).fetchone() is not None
@@ -0,0 +1,125 @@
+"""
+Snowflake-style request ids.
+
+    | 41 bits: ms since EPOCH_MS | 10 bits: worker id | 12 bits: sequence |
+
+Ids are positive 63-bit integers, so they fit SQLite's INTEGER key. They
+sort by creation time, and a worker can issue up to 4096 per millisecond.
+
+The worker id keeps ids unique across processes. It comes from
+AMBULANCE_WORKER_ID when that is set. Otherwise each process claims the
+first free slot by holding a non-blocking flock on WORKER_LOCK_DIR/<n>.lock
+for its lifetime. The lock is released when the process exits, and a
+forked child claims its own slot. If the clock steps backwards, the
+generator waits until it passes the last timestamp it issued rather than
+reuse one.
+"""
+import fcntl
+import os
+import threading
+import time
+
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+
+TIMESTAMP_BITS = 41
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+
+MAX_WORKER = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+WORKER_SHIFT = SEQUENCE_BITS
+TIMESTAMP_SHIFT = SEQUENCE_BITS + WORKER_BITS
+
+WORKER_LOCK_DIR = os.environ.get('AMBULANCE_WORKER_LOCK_DIR', '.worker_ids')
+
+
+def _now_ms():
+    return time.time_ns() // 1_000_000 - EPOCH_MS
+
+
+def _claim_worker_slot():
+    """Hold the first free worker slot lock; returns (worker_id, fd)"""
+    os.makedirs(WORKER_LOCK_DIR, exist_ok=True)
+    for worker_id in range(MAX_WORKER + 1):
+        fd = os.open(os.path.join(WORKER_LOCK_DIR, f'{worker_id}.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            continue
+        return worker_id, fd
+    raise RuntimeError(f"All {MAX_WORKER + 1} request id worker slots are in use")
+
+
+class SnowflakeGenerator:
+    """Thread-safe generator of time-sortable ids for one worker"""
+
+    def __init__(self, worker_id=None):
+        if worker_id is not None and not 0 <= worker_id <= MAX_WORKER:
+            raise ValueError(f"worker_id must be in 0..{MAX_WORKER}, got {worker_id}")
+        self._fixed_worker = worker_id
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self.worker_id = worker_id
+        self._last_ms = -1
+        self._sequence = 0
+
+    def _ensure_worker(self):
+        if self._fixed_worker is not None or self._pid == os.getpid():
+            return
+        # First use in this process (or a forked child sharing the parent's lock)
+        self.worker_id, self._fd = _claim_worker_slot()
+        self._pid = os.getpid()
+        self._last_ms = -1
+
+    def next_id(self):
+        """Return a new id, greater than every id this generator issued before"""
+        with self._lock:
+            self._ensure_worker()
+            now = _now_ms()
+            if now < self._last_ms:
+                # Clock stepped back - wait rather than risk a duplicate
+                time.sleep((self._last_ms - now) / 1000)
+                now = max(_now_ms(), self._last_ms)
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    # Sequence exhausted for this millisecond
+                    while now <= self._last_ms:
+                        now = _now_ms()
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            return (now << TIMESTAMP_SHIFT) | (self.worker_id << WORKER_SHIFT) | self._sequence
+
+
+def parse(request_id):
+    """Split an id into (unix time in ms, worker id, sequence)"""
+    return ((request_id >> TIMESTAMP_SHIFT) + EPOCH_MS,
+            (request_id >> WORKER_SHIFT) & MAX_WORKER,
+            request_id & MAX_SEQUENCE)
+
+
+def created_at(request_id, now=None):
+    """Creation time (unix seconds) of a Snowflake id, or None for older non-Snowflake ids"""
+    if not isinstance(request_id, int):
+        return None
+    # Older hash ids decode to nonsense times
+    created_ms = parse(request_id)[0]
+    now = time.time() if now is None else now
+    return created_ms / 1000 if EPOCH_MS <= created_ms <= now * 1000 else None
+
+
+def min_id_at(unix_ms):
+    """Smallest id that can be issued at or after `unix_ms` (for range scans)"""
+    return max(unix_ms - EPOCH_MS, 0) << TIMESTAMP_SHIFT
+
+
+_env_worker = os.environ.get('AMBULANCE_WORKER_ID')
+generator = SnowflakeGenerator(int(_env_worker) if _env_worker else None)
+
+
+def next_id():
+    """Return a new request id from the process-wide generator"""
+    return generator.next_id()
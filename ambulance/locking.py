@@ -0,0 +1,152 @@
+"""
+Cross-process locking, atomic file writes and group commit.
+
+Streamlit serves every browser session from threads of one process, and
+the worker runs as another process, so shared files need both:
+
+- locked(): an fcntl flock on a side lock file. Re-entrant per thread,
+  so a helper that takes a lock can be called while it is already held.
+- atomic_write_json(): write a temp file, fsync it, then rename it over
+  the target. Readers see the old file or the new one, never a partial
+  write, so they do not need the lock.
+- append_bytes(): append to a log file with O_APPEND, looping until a
+  short write has written everything.
+- pid_alive(): whether a per-process file's owner is still running, so
+  the files of exited processes can be folded and removed.
+- GroupCommitter: submissions that arrive within GROUP_COMMIT_WINDOW of
+  each other are committed by one thread in a single locked write, and
+  every submitter returns once that write is done. Throughput then grows
+  with the number of concurrent callers instead of one lock round-trip
+  each.
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+GROUP_COMMIT_WINDOW = 0.002
+
+_held = threading.local()
+
+
+def lock_path(path):
+    """Side lock file guarding `path`"""
+    return path + '.lock'
+
+
+@contextmanager
+def locked(path, exclusive=True):
+    """Hold an flock on the lock file `path` (shared for readers)
+
+    Nested acquisitions of the same path by one thread reuse the outer
+    lock (and its mode).
+    """
+    depth = getattr(_held, 'depth', None)
+    if depth is None:
+        depth = _held.depth = {}
+    if depth.get(path):
+        depth[path] += 1
+        try:
+            yield
+        finally:
+            depth[path] -= 1
+        return
+
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        depth[path] = 1
+        try:
+            yield
+        finally:
+            depth[path] = 0
+    finally:
+        os.close(fd)  # releases the flock
+
+
+def atomic_write_json(path, data, indent=2):
+    """Replace `path` with JSON data via temp file + fsync + rename"""
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def append_bytes(path, data):
+    """Append `data` to `path` (created if missing); returns the file size after"""
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        written = 0
+        while written < len(data):
+            written += os.write(fd, data[written:])
+        return os.fstat(fd).st_size
+    finally:
+        os.close(fd)
+
+
+def pid_alive(pid):
+    """True if a process with this pid is running on this host"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # exists, owned by another user
+    return True
+
+
+class _Batch:
+    def __init__(self):
+        self.items = []
+        self.done = threading.Event()
+        self.error = None
+
+
+class GroupCommitter:
+    """Coalesce concurrent submissions into one commit(items) call"""
+
+    def __init__(self, commit, window=GROUP_COMMIT_WINDOW):
+        self._commit = commit
+        self._window = window
+        self._lock = threading.Lock()
+        self._batch = None
+        self.commits = 0
+        self.submissions = 0
+
+    def submit(self, items):
+        """Add items to the open batch and return once they are committed"""
+        with self._lock:
+            self.submissions += 1
+            batch = self._batch
+            leader = batch is None
+            if leader:
+                batch = self._batch = _Batch()
+            batch.items.extend(items)
+
+        if not leader:
+            batch.done.wait()
+            if batch.error is not None:
+                raise batch.error
+            return
+
+        # The first submitter waits briefly for company, closes the batch and writes it
+        time.sleep(self._window)
+        with self._lock:
+            self._batch = None
+            self.commits += 1
+        try:
+            self._commit(batch.items)
+        except BaseException as e:
+            batch.error = e
+            raise
+        finally:
+            batch.done.set()
@@ -0,0 +1,223 @@
+"""
+Per-process triage latency histograms.
+
+Every triage phase records its latency into a fixed-bucket histogram
+keyed by phase (and by the method that produced the result, where it
+matters). Histograms live in memory and are flushed to
+metrics/triage_<pid>.json at most every FLUSH_INTERVAL seconds (a timer
+starts on the first unflushed sample, so an idle process still writes its
+last samples), plus once at exit. A flush writes a temp file and renames it, so readers never see a
+partial file.
+
+Each restart would leave another triage_<pid>.json behind, so flushes also
+fold the files of processes on this host that have exited into
+metrics/triage_folded.json and delete them (compact(), on a process's
+first flush and then at most every COMPACT_INTERVAL seconds). The folded
+file lists the files it already contains until they are deleted.
+"""
+import atexit
+import bisect
+import json
+import os
+import threading
+import socket
+import time
+
+from ambulance.locking import atomic_write_json, locked, pid_alive
+
+METRICS_DIR = os.environ.get('TRIAGE_METRICS_DIR', 'metrics')
+FLUSH_INTERVAL = 10.0
+COMPACT_INTERVAL = 300.0
+FOLDED_FILE = 'triage_folded.json'
+
+# Bucket upper bounds in microseconds (1-2-5 series, 1 µs .. 10 s); last bucket is overflow
+BUCKETS_US = [m * 10 ** e for e in range(0, 7) for m in (1, 2, 5)] + [10_000_000]
+
+
+class Histogram:
+    """Fixed-bucket latency histogram"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_US) + 1)
+        self.count = 0
+        self.total_us = 0.0
+        self.max_us = 0.0
+
+    def add(self, micros):
+        self.counts[bisect.bisect_left(BUCKETS_US, micros)] += 1
+        self.count += 1
+        self.total_us += micros
+        if micros > self.max_us:
+            self.max_us = micros
+
+    def quantile(self, q):
+        """Upper bound (µs) of the bucket holding the q-th quantile"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for idx, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return float(BUCKETS_US[idx]) if idx < len(BUCKETS_US) else self.max_us
+        return self.max_us
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total_us += other.total_us
+        self.max_us = max(self.max_us, other.max_us)
+        return self
+
+    @classmethod
+    def from_dict(cls, data):
+        hist = cls()
+        if data.get('buckets_us', BUCKETS_US) == BUCKETS_US:
+            hist.counts = list(data.get('counts', hist.counts))
+            hist.count = data.get('count', 0)
+            hist.total_us = data.get('mean_us', 0.0) * hist.count
+            hist.max_us = data.get('max_us', 0.0)
+        return hist
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean_us': self.total_us / self.count if self.count else 0.0,
+            'p50_us': self.quantile(0.50),
+            'p95_us': self.quantile(0.95),
+            'p99_us': self.quantile(0.99),
+            'max_us': self.max_us,
+            'buckets_us': BUCKETS_US,
+            'counts': self.counts,
+        }
+
+
+_histograms = {}
+_lock = threading.Lock()
+_timer = None
+_timer_pid = None
+_next_compact = 0.0
+
+
+def record(phase, seconds, method=None):
+    """Record one latency sample for a phase (and optionally the method used)"""
+    global _timer, _timer_pid
+
+    key = f'{phase}:{method}' if method else phase
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = Histogram()
+        hist.add(seconds * 1e6)
+        # A forked child has no copy of its parent's timer thread
+        if _timer is None or _timer_pid != os.getpid():
+            _timer = threading.Timer(FLUSH_INTERVAL, flush)
+            _timer.daemon = True
+            _timer.start()
+            _timer_pid = os.getpid()
+
+
+def snapshot():
+    """Return {key: summary dict} for every histogram in this process"""
+    with _lock:
+        return {key: hist.to_dict() for key, hist in _histograms.items()}
+
+
+def flush():
+    """Write this process's histograms to the metrics directory"""
+    global _timer
+    with _lock:
+        _timer = None
+    data = {
+        'pid': os.getpid(),
+        'host': socket.gethostname(),
+        'updated_at': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'histograms': snapshot(),
+    }
+    if not data['histograms']:
+        return None
+    path = os.path.join(METRICS_DIR, f'triage_{os.getpid()}.json')
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"⚠️ Could not write triage metrics: {e}")
+        return None
+    _maybe_compact()
+    return path
+
+
+def _maybe_compact():
+    global _next_compact
+    now = time.monotonic()
+    if now < _next_compact:
+        return
+    _next_compact = now + COMPACT_INTERVAL
+    try:
+        compact()
+    except OSError as e:
+        print(f"⚠️ Could not compact triage metrics: {e}")
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def compact():
+    """Fold the files of exited processes on this host into FOLDED_FILE; returns files removed"""
+    try:
+        names = os.listdir(METRICS_DIR)
+    except OSError:
+        return 0
+    host = socket.gethostname()
+    folded_path = os.path.join(METRICS_DIR, FOLDED_FILE)
+    with locked(os.path.join(METRICS_DIR, '.lock')):
+        folded = _read(folded_path)
+        done = set(folded.get('folded', []))
+        dead, histograms = [], {}
+        for name in names:
+            if not name.startswith('triage_') or not name.endswith('.json') or name == FOLDED_FILE:
+                continue
+            if name in done:
+                continue
+            data = _read(os.path.join(METRICS_DIR, name))
+            # Files written before 'host' was recorded are from this host
+            if data.get('host', host) == host and isinstance(data.get('pid'), int) \
+                    and not pid_alive(data['pid']):
+                dead.append(name)
+                for key, hist in data.get('histograms', {}).items():
+                    histograms.setdefault(key, Histogram()).merge(Histogram.from_dict(hist))
+        if not dead and not done:
+            return 0
+
+        for key, hist in folded.get('histograms', {}).items():
+            histograms.setdefault(key, Histogram()).merge(Histogram.from_dict(hist))
+        folded = {'updated_at': time.strftime("%Y-%m-%d %H:%M:%S"),
+                  'histograms': {key: hist.to_dict() for key, hist in histograms.items()}}
+
+        # Record what is folded before deleting it, then forget the deleted names
+        atomic_write_json(folded_path, dict(folded, folded=sorted(done | set(dead))))
+        for name in done | set(dead):
+            try:
+                os.remove(os.path.join(METRICS_DIR, name))
+            except FileNotFoundError:
+                pass
+        atomic_write_json(folded_path, dict(folded, folded=[]))
+    return len(dead)
+
+
+def reset():
+    """Drop all recorded samples (used by benchmarks between runs)"""
+    with _lock:
+        _histograms.clear()
+
+
+atexit.register(flush)
@@ -0,0 +1,114 @@
+"""
+Process-wide triage model registry.
+
+Streamlit re-executes page scripts on every widget interaction, but
+imported modules stay loaded for the life of the server process. The
+registry lives here so the model and its triage table are loaded once and
+shared by every session. The model file, and the pickle it was exported
+from, are stat()ed at most once per CHECK_INTERVAL; they are only
+re-hashed when an mtime or size changes, and only reloaded when a content
+hash differs. A reload builds the new model completely before
+swapping it in with a single reference assignment.
+"""
+import os
+import threading
+import time
+from collections import namedtuple
+
+from ambulance.triage import TriageTable, find_model_path, find_pickle_path, load_predictor
+from ambulance.tree_export import file_sha256
+
+ModelInfo = namedtuple('ModelInfo', [
+    'table',         # TriageTable built from the model (rule-only if no model)
+    'version',       # first 12 hex chars of the source model's SHA-256, or None
+    'source',        # where the predictor came from
+    'path',          # watched model file (artifact or pickle), or None
+    'sha256',        # SHA-256 of the watched file, or None
+    'source_sha256', # SHA-256 of the pickle, or None
+    'stat_key',      # (mtime_ns, size) of the model file and of the pickle when loaded
+    'loaded_at',     # datetime string of the load
+    'load_seconds',  # time spent loading the predictor and building the table
+    'error',         # load error message (for logs, not for patients), or None
+])
+
+
+class ModelRegistry:
+    """Loads the triage model once per process and hot-reloads it on change"""
+
+    # Seconds between model file checks; lookups in between cost nothing
+    CHECK_INTERVAL = 1.0
+
+    def __init__(self):
+        self._current = None
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+        self.reloads = 0
+
+    def current(self):
+        """Return the active ModelInfo, reloading if the model file changed"""
+        info = self._current
+        now = time.monotonic()
+        if info is not None and now < self._next_check:
+            return info
+        self._next_check = now + self.CHECK_INTERVAL
+
+        path = find_model_path()
+        pickle_path = find_pickle_path()
+        stat_key = (self._stat_key(path), self._stat_key(pickle_path))
+        if info is not None and path == info.path and stat_key == info.stat_key:
+            return info
+
+        with self._lock:
+            info = self._current
+            if info is not None and path == info.path and stat_key == info.stat_key:
+                return info
+            sha256 = file_sha256(path) if path else None
+            if pickle_path is None:
+                source_sha256 = None
+            elif pickle_path == path:
+                source_sha256 = sha256
+            else:
+                source_sha256 = file_sha256(pickle_path)
+            if (info is not None and path == info.path and sha256
+                    and (sha256, source_sha256) == (info.sha256, info.source_sha256)):
+                # Touched but unchanged - keep the model, remember the new stat
+                self._current = info._replace(stat_key=stat_key)
+            else:
+                self._current = self._load(path, stat_key, sha256, source_sha256)
+                self.reloads += 1
+            return self._current
+
+    def _stat_key(self, path):
+        if path is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _load(self, path, stat_key, sha256, source_sha256):
+        started = time.perf_counter()
+        error = None
+        try:
+            predictor, source = load_predictor(path, source_sha256)
+        except Exception as e:
+            predictor, source = None, None
+            error = f"Failed to load from {path}: {e}"
+            print(f"⚠️ Triage model not loaded. {error}. Using the clinical rules and fallback score.")
+        table = TriageTable(predictor)
+        return ModelInfo(
+            table=table,
+            version=predictor.version if predictor is not None else None,
+            source=source,
+            path=path,
+            sha256=sha256,
+            source_sha256=source_sha256,
+            stat_key=stat_key,
+            loaded_at=time.strftime("%Y-%m-%d %H:%M:%S"),
+            load_seconds=time.perf_counter() - started,
+            error=error,
+        )
+
+
+registry = ModelRegistry()
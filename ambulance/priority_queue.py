@@ -0,0 +1,147 @@
+"""
+Dispatch priority queue.
+
+A binary heap keyed on (priority rank, -severity_score, request id,
+replay order), so HIGH comes before MEDIUM before LOW, higher scores come
+first within a priority, and equal cases leave in arrival order. Arrival
+is the time-sortable request id (ids.py), so every queue that holds the
+same entries orders them the same way, whatever order they were appended
+in; shards.py relies on that to merge zones. Entries with older
+non-Snowflake ids predate every Snowflake id, so they sort first, in
+replay order. Push and pop are O(log n) and peek is amortized O(1).
+
+Dispatching a patient from the middle of the queue does not touch the
+heap. The entry is dropped from the id map and its heap item is discarded
+when it reaches the top (lazy deletion). A priority update pushes a new
+item the same way, and the old one goes stale. An item is live only if
+it is the very tuple recorded for its id, so an entry re-keyed back to an
+earlier key cannot revive its stale copy. The heap is rebuilt once
+stale items outnumber live ones.
+
+A list sorted by key is already a valid heap. So the queue is persisted
+in dispatch order (entries()), and loading it back needs neither a sort
+nor a heapify. The same list is what the dashboard renders.
+"""
+import heapq
+import itertools
+
+from ambulance import ids
+
+PRIORITY_RANK = {'HIGH': 0, 'MEDIUM': 1, 'LOW': 2}
+
+
+def dispatch_key(entry):
+    """(priority rank, -severity_score) for an entry; unknown priorities go last"""
+    return (PRIORITY_RANK.get(entry.get('priority'), len(PRIORITY_RANK)),
+            -(entry.get('severity_score') or 0))
+
+
+def arrival_key(entry):
+    """Request id if it is a Snowflake id (ids.py), else 0 - older entries come first"""
+    entry_id = entry.get('id')
+    return entry_id if ids.created_at(entry_id) is not None else 0
+
+
+def entry_key(entry):
+    return entry.get("id") or entry.get("name")
+
+
+class DispatchQueue:
+    """Heap of queue entries with stable ordering and lazy deletion by id"""
+
+    def __init__(self, entries=()):
+        self._arrival = itertools.count()
+        self._entries = {}   # id -> entry, in arrival order
+        self._items = {}     # id -> live heap item (rank, -score, request id, replay order, id)
+        self._heap = []
+        self._ordered = None
+        for entry in entries:
+            key = entry_key(entry)
+            if key is None or key in self._entries:
+                continue
+            item = dispatch_key(entry) + (arrival_key(entry), next(self._arrival), key)
+            self._entries[key] = entry
+            self._items[key] = item
+            self._heap.append(item)
+        # Snapshots are written in dispatch order, which is already a heap;
+        # anything else (an old snapshot) is heapified in O(n)
+        if any(a > b for a, b in zip(self._heap, self._heap[1:])):
+            heapq.heapify(self._heap)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, entry_id):
+        return entry_id in self._entries
+
+    def get(self, entry_id):
+        return self._entries.get(entry_id)
+
+    def push(self, entry):
+        """Add an entry; returns False if its id is already queued"""
+        key = entry_key(entry)
+        if key is None or key in self._entries:
+            return False
+        self._entries[key] = entry
+        self._push_item(dispatch_key(entry) + (arrival_key(entry), next(self._arrival), key))
+        return True
+
+    def remove(self, entry_id):
+        """Drop an entry by id (its heap item is discarded lazily); returns it or None"""
+        entry = self._entries.pop(entry_id, None)
+        if entry is not None:
+            del self._items[entry_id]
+            self._ordered = None
+            self._maybe_rebuild()
+        return entry
+
+    def update(self, entry_id, fields):
+        """Merge fields into an entry, re-keying it if its priority or score changed"""
+        entry = self._entries.get(entry_id)
+        if entry is None:
+            return
+        entry.update(fields)
+        current = self._items[entry_id]
+        item = dispatch_key(entry) + current[2:]
+        if item != current:
+            self._push_item(item)
+            self._maybe_rebuild()
+        else:
+            self._ordered = None
+
+    def peek(self):
+        """Return the next entry to dispatch without removing it, or None"""
+        heap = self._heap
+        while heap and self._items.get(heap[0][-1]) is not heap[0]:
+            heapq.heappop(heap)  # stale: dispatched or re-keyed
+        return self._entries[heap[0][-1]] if heap else None
+
+    def pop(self):
+        """Remove and return the next entry to dispatch, or None"""
+        entry = self.peek()
+        if entry is not None:
+            key = heapq.heappop(self._heap)[-1]
+            del self._entries[key]
+            del self._items[key]
+            self._ordered = None
+        return entry
+
+    def entries(self):
+        """All entries in dispatch order (cached until the queue changes)"""
+        if self._ordered is None:
+            # Mostly-sorted heap array (snapshot order plus recent pushes),
+            # so this sort runs close to linear
+            live = [item for item in self._heap if self._items.get(item[-1]) is item]
+            live.sort()
+            self._ordered = [self._entries[item[-1]] for item in live]
+        return self._ordered
+
+    def _push_item(self, item):
+        self._items[item[-1]] = item
+        heapq.heappush(self._heap, item)
+        self._ordered = None
+
+    def _maybe_rebuild(self):
+        if len(self._heap) > 2 * len(self._items) + 16:
+            self._heap = list(self._items.values())
+            heapq.heapify(self._heap)
@@ -0,0 +1,318 @@
+"""
+Append-only operation log for the emergency queue.
+
+The queue is stored as a snapshot (emergency_queue.json, a plain list of
+entries as before, now in dispatch order) plus a write-ahead log (emergency_queue.wal) with one
+JSON operation per line:
+
+    {"op": "enqueue",  "entry": {...}}
+    {"op": "dispatch", "id": 123}
+    {"op": "update",   "id": 123, "fields": {...}}
+
+Writers append one line per event instead of rewriting the whole queue.
+Each process keeps its replayed state plus the log offset it has read up
+to, so a reload only parses the tail that was appended since. A background
+thread folds the log into a fresh snapshot and truncates it once it grows
+past COMPACT_BYTES, which keeps load time flat as history grows.
+
+Replayed state is a DispatchQueue (priority_queue.py), and snapshots are
+written in dispatch order, so loading one needs no sort and the next
+patient is a heap peek.
+
+Replay is idempotent: enqueueing an id that is already queued is a no-op,
+dispatching a missing id is a no-op and updates merge fields. A crash
+between writing the snapshot and truncating the log is therefore
+harmless. A torn last line left by a crashed writer is ignored by readers
+and cut off by the next writer before it appends. Appends, compaction and reads coordinate through an flock on
+emergency_queue.lock. Concurrent appends from one process are group
+committed (see locking.py): submissions within a couple of milliseconds
+share one locked write.
+
+version() is (snapshot key, log size), which every write changes.
+append_if() appends only if the queue is still at a version the caller
+read. That makes it a compare-and-swap for read-modify-write updates of
+an entry (see shards.ShardedQueue.modify).
+
+Writers also keep a persistent id index (id_index.py) in step with the
+log. It lets enqueue drop duplicate ids, and lets contains() and
+has_intake_ref() answer, with a key lookup instead of a replay and scan.
+"""
+import json
+import os
+import threading
+import time
+
+from ambulance.id_index import IdIndex
+from ambulance.locking import (GROUP_COMMIT_WINDOW, GroupCommitter, append_bytes, atomic_write_json,
+                               locked)
+from ambulance.priority_queue import DispatchQueue, entry_key
+from ambulance.read_cache import file_key
+
+# A queue is the set of files <prefix>.json / .wal / .lock / .idx
+DEFAULT_PREFIX = "emergency_queue"
+SNAPSHOT_FILE = DEFAULT_PREFIX + ".json"
+LOG_FILE = DEFAULT_PREFIX + ".wal"
+LOCK_FILE = DEFAULT_PREFIX + ".lock"
+
+COMPACT_BYTES = 64 * 1024
+COMPACT_INTERVAL = 30.0
+
+
+def apply(state, record):
+    """Apply one log record to a DispatchQueue"""
+    op = record.get('op')
+    if op == 'enqueue':
+        state.push(record['entry'])
+    elif op == 'dispatch':
+        state.remove(record.get('id'))
+    elif op == 'update':
+        state.update(record.get('id'), record.get('fields') or {})
+
+
+def _read_snapshot(snapshot_file):
+    try:
+        with open(snapshot_file, 'r') as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        entries = []
+    return DispatchQueue(entries)
+
+
+def _write_snapshot(snapshot_file, state):
+    atomic_write_json(snapshot_file, state.entries())
+
+
+def _log_size(log_file):
+    try:
+        return os.path.getsize(log_file)
+    except OSError:
+        return 0
+
+
+def _trim_torn_tail(log_file):
+    """Cut the log back to just after its last newline; returns the new size
+
+    Caller holds the exclusive lock, so a line without a newline is the
+    remains of a crashed append. Appending after it would glue the next
+    record onto it, and both would be skipped on replay.
+    """
+    try:
+        f = open(log_file, 'r+b')
+    except OSError:
+        return 0
+    with f:
+        size = end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - 4096)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline >= 0:
+                end = start + newline + 1
+                break
+            end = start
+        if end != size:
+            f.truncate(end)
+        return end
+
+
+def _replay(log_file, state, offset):
+    """Apply complete log lines from `offset`; returns the new offset"""
+    try:
+        f = open(log_file, 'rb')
+    except OSError:
+        return 0
+    with f:
+        f.seek(offset)
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                break  # torn final write; ignore until it is completed
+            offset += len(raw)
+            try:
+                apply(state, json.loads(raw))
+            except (ValueError, KeyError):
+                continue
+    return offset
+
+
+class QueueLog:
+    """Per-process view of the queue that replays only the unread log tail"""
+
+    def __init__(self, prefix=DEFAULT_PREFIX, commit_window=GROUP_COMMIT_WINDOW, auto_compact=True):
+        self.snapshot_file = prefix + '.json'
+        self.log_file = prefix + '.wal'
+        self.lock_file = prefix + '.lock'
+        self._lock = threading.Lock()
+        self._auto_compact = auto_compact
+        self._snapshot_key = None
+        self._offset = 0
+        self._state = None
+        self._compactor = None
+        self._committer = GroupCommitter(self._write, commit_window)
+        self.index = IdIndex(prefix + '.idx')
+
+    def load(self):
+        """Return the current queue in dispatch order as a list of entry copies"""
+        with self._lock:
+            self._refresh()
+            return [dict(entry) for entry in self._state.entries()]
+
+    def peek(self):
+        """Return a copy of the next entry to dispatch, or None"""
+        with self._lock:
+            self._refresh()
+            entry = self._state.peek()
+            return dict(entry) if entry is not None else None
+
+    def _refresh(self):
+        with locked(self.lock_file, exclusive=False):
+            snapshot_key = file_key(self.snapshot_file)
+            log_size = _log_size(self.log_file)
+            if self._state is not None and snapshot_key == self._snapshot_key \
+                    and log_size == self._offset:
+                return
+            if self._state is None or snapshot_key != self._snapshot_key or log_size < self._offset:
+                # Compacted (or first load) - start again from the snapshot
+                self._state = _read_snapshot(self.snapshot_file)
+                self._snapshot_key = snapshot_key
+                self._offset = 0
+            if log_size > self._offset:
+                self._offset = _replay(self.log_file, self._state, self._offset)
+
+    def get(self, entry_id):
+        """Return a copy of a queued entry, or None"""
+        with self._lock:
+            self._refresh()
+            entry = self._state.get(entry_id)
+            return dict(entry) if entry is not None else None
+
+    def version(self):
+        """(snapshot key, log size) - changes with every write to this queue
+
+        May include a torn tail that get_versioned() has not replayed; use the
+        version get_versioned() returns for append_if().
+        """
+        with locked(self.lock_file, exclusive=False):
+            return file_key(self.snapshot_file), _log_size(self.log_file)
+
+    def get_versioned(self, entry_id):
+        """(copy of a queued entry or None, version it was read at)"""
+        with self._lock:
+            with locked(self.lock_file, exclusive=False):
+                self._refresh()
+                entry = self._state.get(entry_id)
+                return (dict(entry) if entry is not None else None), (self._snapshot_key, self._offset)
+
+    def append_if(self, version, *records):
+        """Append records only if the queue is still at `version`; returns True if written"""
+        with locked(self.lock_file):
+            # Compare complete lines only, as get_versioned's replay offset does
+            if (file_key(self.snapshot_file), _trim_torn_tail(self.log_file)) != version:
+                return False
+            self._write(records)
+        return True
+
+    def contains(self, entry_id):
+        """True if an entry with this id is queued"""
+        with locked(self.lock_file, exclusive=False):
+            if self.index.is_current(file_key(self.snapshot_file), _log_size(self.log_file)):
+                return self.index.contains(entry_id)
+        with self._lock:
+            self._refresh()
+            return entry_id in self._state
+
+    def has_intake_ref(self, intake_ref):
+        """True if an entry with this intake_ref was ever enqueued"""
+        with locked(self.lock_file, exclusive=False):
+            if self.index.is_current(file_key(self.snapshot_file), _log_size(self.log_file)):
+                return self.index.has_intake_ref(intake_ref)
+        with self._lock:
+            self._refresh()
+            return any(entry.get('intake_ref') == intake_ref for entry in self._state.entries())
+
+    def _sync_index(self):
+        """Rebuild the id index if it is behind the files; caller holds the lock"""
+        snapshot_key, log_size = file_key(self.snapshot_file), _log_size(self.log_file)
+        if not self.index.is_current(snapshot_key, log_size):
+            state = _read_snapshot(self.snapshot_file)
+            _replay(self.log_file, state, 0)
+            self.index.rebuild(state.entries(), snapshot_key, log_size)
+        return snapshot_key, log_size
+
+    def _drop_duplicates(self, records):
+        """Skip enqueues of ids that are already queued (or repeated in this batch)"""
+        fresh, batch_keys = [], set()
+        for record in records:
+            if record.get('op') == 'enqueue':
+                key = entry_key(record['entry'])
+                if key in batch_keys or self.index.contains(key):
+                    continue
+                batch_keys.add(key)
+            fresh.append(record)
+        return fresh
+
+    def append(self, *records):
+        """Append operation records to the log; returns once they are written"""
+        self._committer.submit(records)
+        self._start_compactor()
+
+    def _write(self, records):
+        """Write a group-committed batch of records in a single append"""
+        with locked(self.lock_file):
+            _trim_torn_tail(self.log_file)
+            snapshot_key, log_size = self._sync_index()
+            records = self._drop_duplicates(records)
+            if not records:
+                return
+            data = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records)
+            data = data.encode('utf-8')
+            append_bytes(self.log_file, data)
+            self.index.apply(records, snapshot_key, log_size + len(data))
+
+    def compact(self):
+        """Fold the log into a new snapshot and truncate the log"""
+        with locked(self.lock_file):
+            state = _read_snapshot(self.snapshot_file)
+            _replay(self.log_file, state, 0)
+            _write_snapshot(self.snapshot_file, state)
+            open(self.log_file, 'w').close()
+            self.index.rebuild(state.entries(), file_key(self.snapshot_file), 0)
+
+    def replace(self, entries):
+        """Overwrite the whole queue (snapshot + empty log)"""
+        state = DispatchQueue(entries)
+        with locked(self.lock_file):
+            _write_snapshot(self.snapshot_file, state)
+            open(self.log_file, 'w').close()
+            self.index.rebuild(state.entries(), file_key(self.snapshot_file), 0)
+
+    def _start_compactor(self):
+        if self._auto_compact and self._compactor is None:
+            with self._lock:
+                if self._compactor is None:
+                    self._compactor = threading.Thread(target=self._compact_loop,
+                                                       name='queue-log-compactor', daemon=True)
+                    self._compactor.start()
+
+    def _compact_loop(self):
+        while True:
+            time.sleep(COMPACT_INTERVAL)
+            try:
+                if os.path.getsize(self.log_file) >= COMPACT_BYTES:
+                    self.compact()
+            except OSError:
+                continue
+
+    def enqueue(self, *entries):
+        """Append enqueue records for one or more entries"""
+        self.append(*[{'op': 'enqueue', 'entry': entry, 'ts': time.time()} for entry in entries])
+
+    def dispatch(self, entry_id):
+        """Append a dispatch record removing an entry from the queue"""
+        self.append({'op': 'dispatch', 'id': entry_id, 'ts': time.time()})
+
+    def update(self, entry_id, fields):
+        """Append an update record merging fields into an entry"""
+        self.append({'op': 'update', 'id': entry_id, 'fields': fields, 'ts': time.time()})
+
+
+queue_log = QueueLog()
@@ -0,0 +1,66 @@
+"""
+Process-wide parsed-JSON cache for the shared data files.
+
+Every technician session reloads stats and fleet status every five
+seconds, and patient pages reload them on each rerun, but the files
+rarely change. A load first stats the file. If (inode, mtime_ns, size)
+still match what was parsed last time, the cached object is reused
+instead of re-reading and re-parsing the file. Writers replace files by
+rename (locking.atomic_write_json), which usually changes the key. It is
+not guaranteed to: the filesystem may reuse the old inode, and a
+same-size rewrite within one mtime tick keeps the rest. So the cache is
+for display reads; a decision that must see the latest write, such as the
+version check in versioned.py, reads the file itself under its lock.
+
+Callers get a deep copy, so a page that edits its dict (or keeps it in
+st.session_state) cannot change what other sessions see.
+"""
+import copy
+import json
+import os
+import threading
+
+
+def file_key(path):
+    """(inode, mtime_ns, size) of a file, or None if it does not exist"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class ReadCache:
+    """Parsed JSON per path, revalidated against the file's stat key"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # path -> (file key, parsed object)
+
+    def load_json(self, path, default):
+        """Return a copy of the parsed file, or `default` if it is missing or invalid"""
+        key = file_key(path)
+        if key is None:
+            return default
+        with self._lock:
+            cached = self._entries.get(path)
+            if cached is not None and cached[0] == key:
+                return copy.deepcopy(cached[1])
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return default
+        with self._lock:
+            self._entries[path] = (key, data)
+        return copy.deepcopy(data)
+
+    def invalidate(self, path=None):
+        """Forget one path (or everything)"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+read_cache = ReadCache()
@@ -0,0 +1,62 @@
+"""
+Declarative bitmask rule engine.
+
+A rule fires when every symptom in its `present` mask is set and every
+symptom in its `absent` mask is clear. Rules are listed in priority order
+and the first one that fires wins. Masks are 10-bit symptom masks (see
+triage.symptom_mask), so a RuleSet compiles its rules into a table over
+every possible mask once. Matching is then one table index, however many
+rules there are.
+"""
+from collections import namedtuple
+
+Rule = namedtuple('Rule', ['present', 'absent', 'diagnosis', 'priority', 'score'])
+
+NO_MATCH = -1
+
+
+def symptom_bits(features, *names):
+    """Build a mask with the bit for each named symptom set"""
+    mask = 0
+    for name in names:
+        mask |= 1 << features.index(name)
+    return mask
+
+
+class RuleSet:
+    """An ordered rule table compiled into a first-match index per symptom mask"""
+
+    def __init__(self, features, rules, method):
+        self.features = list(features)
+        self.method = method
+        self.rules = [
+            Rule(symptom_bits(self.features, *present), symptom_bits(self.features, *absent),
+                 diagnosis, priority, score)
+            for present, absent, diagnosis, priority, score in rules
+        ]
+        self.results = [(r.diagnosis, r.priority, r.score, method) for r in self.rules]
+
+        # first_match[mask] = index of the winning rule, or NO_MATCH
+        self.first_match = []
+        for mask in range(1 << len(self.features)):
+            winner = NO_MATCH
+            for idx, rule in enumerate(self.rules):
+                if mask & rule.present == rule.present and not mask & rule.absent:
+                    winner = idx
+                    break
+            self.first_match.append(winner)
+
+    def match(self, mask):
+        """Return (diagnosis, priority, score, method) of the winning rule, or None"""
+        idx = self.first_match[mask]
+        return self.results[idx] if idx != NO_MATCH else None
+
+    def matching(self, mask):
+        """Return every rule that fires for a mask, in priority order"""
+        return [rule for rule in self.rules
+                if mask & rule.present == rule.present and not mask & rule.absent]
+
+    def match_indices(self, masks):
+        """Winning rule index (or NO_MATCH) for each mask in a NumPy array"""
+        import numpy as np
+        return np.asarray(self.first_match, dtype=np.int64)[masks]
@@ -0,0 +1,203 @@
+"""
+Region-sharded emergency queue.
+
+Each zone of the city has its own queue log under queues/ (queues/east.json,
+.wal, .lock and .idx; see queue_log.py), with its own lock and its own
+group commit. A submission from Nandanvan only locks and appends to the
+east shard, and a dashboard subscribed to east only reads that shard. Lock
+contention and payload size then grow with one zone's load, not the whole
+city's.
+
+Entries get their zone from the address when they are created (zone_for
+matches known localities; anything else goes to DEFAULT_ZONE). The global
+view is a k-way heapq.merge of the shards, each loaded in dispatch order.
+Shards break ties on the time-sortable request id (priority_queue.py), and
+the merge uses the same key, so ties across zones are still first come,
+first served and the merge never reorders a shard. The
+next patient across several zones is the best of one peek per shard.
+
+The first use imports an existing single-file queue (emergency_queue.json
+plus its log) into the shards, and leaves those files untouched.
+"""
+import heapq
+import os
+import random
+import threading
+import time
+
+from ambulance import queue_log
+from ambulance.locking import atomic_write_json, locked
+from ambulance.priority_queue import arrival_key, dispatch_key
+from ambulance.versioned import CAS_BACKOFF, CAS_RETRIES, VersionConflict
+
+SHARD_DIR = os.environ.get('AMBULANCE_QUEUE_DIR', 'queues')
+MIGRATED_MARKER = '.migrated'
+
+# Zone -> localities matched (case-insensitively) in the address
+ZONES = {
+    'central': ('sitabuldi', 'dharampeth', 'civil lines', 'sadar', 'mahal', 'itwari',
+                'ramdaspeth', 'dhantoli', 'gandhibagh'),
+    'east': ('nandanvan', 'wardhaman nagar', 'lakadganj', 'pardi', 'kalamna', 'hasanbag'),
+    'south': ('manish nagar', 'besa', 'hudkeshwar', 'pratap nagar', 'narendra nagar',
+              'trimurti nagar', 'somalwada', 'ajni'),
+    'north': ('koradi', 'jaripatka', 'kamptee', 'indora', 'gittikhadan', 'mankapur'),
+    'west': ('hingna', 'wadi', 'bajaj nagar', 'laxmi nagar', 'ambazari', 'shankar nagar'),
+}
+DEFAULT_ZONE = 'unassigned'
+ZONE_NAMES = list(ZONES) + [DEFAULT_ZONE]
+
+
+def zone_for(address):
+    """Zone whose locality appears first in the address, else DEFAULT_ZONE"""
+    text = str(address or '').lower()
+    best_zone, best_pos = DEFAULT_ZONE, len(text) + 1
+    for zone, localities in ZONES.items():
+        for locality in localities:
+            pos = text.find(locality)
+            if 0 <= pos < best_pos:
+                best_zone, best_pos = zone, pos
+    return best_zone
+
+
+def entry_zone(entry):
+    return entry.get('zone') or zone_for(entry.get('location'))
+
+
+def merge_key(entry):
+    """Dispatch order across shards: priority, severity, then request id (arrival)
+
+    The shards' own order with the replay tie-break dropped, so each shard's
+    list is sorted by it and heapq.merge keeps their order for equal keys.
+    """
+    return dispatch_key(entry) + (arrival_key(entry),)
+
+
+class ShardedQueue:
+    """One QueueLog per zone, routed by entry zone and merged on read"""
+
+    def __init__(self, directory=SHARD_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._shards = {}
+        self._migrated = False
+
+    def shard(self, zone):
+        """QueueLog for a zone (created on first use)"""
+        log = self._shards.get(zone)
+        if log is None:
+            with self._lock:
+                log = self._shards.get(zone)
+                if log is None:
+                    os.makedirs(self.directory, exist_ok=True)
+                    log = self._shards[zone] = queue_log.QueueLog(os.path.join(self.directory, zone))
+        return log
+
+    def _active(self, zones):
+        """Shards among `zones` that have any data on disk"""
+        self._migrate_legacy()
+        try:
+            present = set(os.listdir(self.directory))
+        except OSError:
+            return []
+        return [self.shard(zone) for zone in (zones or ZONE_NAMES)
+                if zone + '.json' in present or zone + '.wal' in present]
+
+    def _migrate_legacy(self):
+        if self._migrated:
+            return
+        marker = os.path.join(self.directory, MIGRATED_MARKER)
+        if not os.path.exists(marker):
+            with locked(queue_log.LOCK_FILE):
+                if not os.path.exists(marker):
+                    self.replace(queue_log.queue_log.load())
+                    atomic_write_json(marker, {'from': queue_log.SNAPSHOT_FILE})
+        self._migrated = True
+
+    def _group(self, entries):
+        groups = {}
+        for entry in entries:
+            entry.setdefault('zone', entry_zone(entry))
+            groups.setdefault(entry['zone'], []).append(entry)
+        return groups
+
+    def enqueue(self, *entries):
+        """Append entries to their zones' shards"""
+        self._migrate_legacy()
+        for zone, group in self._group(entries).items():
+            self.shard(zone).enqueue(*group)
+
+    def replace(self, entries):
+        """Overwrite every shard with `entries` routed by zone"""
+        groups = self._group(entries)
+        for zone in ZONE_NAMES:
+            self.shard(zone).replace(groups.get(zone, []))
+
+    def find(self, entry_id, zones=None):
+        """Shard holding a queued id (one index lookup per shard), or None"""
+        for log in self._active(zones):
+            if log.contains(entry_id):
+                return log
+        return None
+
+    def contains(self, entry_id, zones=None):
+        return self.find(entry_id, zones) is not None
+
+    def get(self, entry_id, zones=None):
+        log = self.find(entry_id, zones)
+        return log.get(entry_id) if log is not None else None
+
+    def dispatch(self, entry_id, zones=None):
+        log = self.find(entry_id, zones)
+        if log is not None:
+            log.dispatch(entry_id)
+
+    def update(self, entry_id, fields, zones=None):
+        log = self.find(entry_id, zones)
+        if log is not None:
+            log.update(entry_id, fields)
+
+    def modify(self, entry_id, change, zones=None, retries=CAS_RETRIES):
+        """Merge change(entry) into a queued entry by compare-and-swap on its shard
+
+        change returns the fields to merge (or nothing to leave the entry
+        as it is) and is re-run on a fresh copy whenever another write to
+        the shard lands first. Returns the updated entry, or None if it is
+        not queued.
+        """
+        for attempt in range(retries):
+            log = self.find(entry_id, zones)
+            if log is None:
+                return None
+            entry, version = log.get_versioned(entry_id)
+            if entry is None:
+                continue  # dispatched or compacted since find(); look again
+            fields = change(dict(entry))
+            if not fields:
+                return entry
+            if log.append_if(version, {'op': 'update', 'id': entry_id, 'fields': fields, 'ts': time.time()}):
+                entry.update(fields)
+                return entry
+            time.sleep(random.uniform(0, CAS_BACKOFF * (attempt + 1)))
+        raise VersionConflict(f"Queue entry {entry_id} changed on every one of {retries} attempts")
+
+    def has_intake_ref(self, intake_ref):
+        return any(log.has_intake_ref(intake_ref) for log in self._active(None))
+
+    def merged(self, zones=None):
+        """Iterator over the subscribed shards in dispatch order
+
+        Each shard is loaded in full (already ordered, no sort); only the
+        k-way merge of those lists is lazy.
+        """
+        return heapq.merge(*[log.load() for log in self._active(zones)], key=merge_key)
+
+    def load(self, zones=None):
+        return list(self.merged(zones))
+
+    def peek(self, zones=None):
+        """Next entry to dispatch across the subscribed shards, or None"""
+        heads = [entry for entry in (log.peek() for log in self._active(zones)) if entry is not None]
+        return min(heads, key=merge_key) if heads else None
+
+
+sharded_queue = ShardedQueue()
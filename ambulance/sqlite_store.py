@@ -0,0 +1,405 @@
+"""
+SQLite store for the queue, stats and fleet status.
+
+    AMBULANCE_STORE=sqlite streamlit run index.py
+    python -m ambulance.sqlite_store          # run the JSON migration now
+
+Selected with AMBULANCE_STORE=sqlite (see datastore.py). The pages and the
+worker share one database file in WAL mode, so dashboard reads never block
+a submission. Changes that touch more than one table commit or roll back
+together. A dispatch dequeues the patient, increments 'dispatched' and
+sends the longest-idle available unit en route in a single transaction.
+Each ambulance is a row of the units table (see fleet.py). Fleet changes
+load the units, apply legal transitions and write them back inside one
+BEGIN IMMEDIATE transaction, so two technicians racing for the last unit
+cannot both get it.
+
+The daily counters (calls_today, dispatched) are rows of daily_stats keyed
+by local day, keeping the last DAILY_DAYS days. load_stats reports the
+current day's counts, so they start from zero at midnight as on the other
+backends.
+
+The queue is indexed on (priority, severity_score, created_at), which is
+the dispatch order, and on (zone, ...) the same for dashboards subscribed
+to some zones (see shards.py). Each row also keeps the full entry as JSON, so callers
+see the same dicts as with the JSON files.
+
+The first connection to a new database imports emergency_queue.json (plus
+its log), system_stats.json and fleet_status.json once. The JSON files are
+not modified.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from ambulance import counters
+from ambulance.fleet import STATES, Fleet
+from ambulance.priority_queue import PRIORITY_RANK
+from ambulance.shards import entry_zone
+
+DB_FILE = os.environ.get('AMBULANCE_DB', 'ambulance.db')
+
+# Counters kept per day (datastore.COUNTERS) and how many days are kept
+DAILY_COUNTERS = ('calls_today', 'dispatched')
+DAILY_DAYS = 31
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue (
+    id             INTEGER PRIMARY KEY,
+    priority       INTEGER NOT NULL,
+    severity_score INTEGER NOT NULL DEFAULT 0,
+    created_at     REAL    NOT NULL,
+    entry          TEXT    NOT NULL,
+    zone           TEXT    NOT NULL DEFAULT 'unassigned'
+);
+CREATE INDEX IF NOT EXISTS queue_dispatch_order
+    ON queue (priority, severity_score DESC, created_at);
+CREATE TABLE IF NOT EXISTS intake_refs (
+    ref TEXT PRIMARY KEY
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS stats (
+    name  TEXT PRIMARY KEY,
+    value NUMERIC NOT NULL
+);
+CREATE TABLE IF NOT EXISTS daily_stats (
+    day   TEXT NOT NULL,
+    name  TEXT NOT NULL,
+    value NUMERIC NOT NULL,
+    PRIMARY KEY (day, name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS units (
+    id    TEXT PRIMARY KEY,
+    state TEXT NOT NULL CHECK (state IN ('available', 'en_route', 'on_scene', 'returning', 'maintenance')),
+    since REAL NOT NULL DEFAULT 0,
+    unit  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS units_state ON units (state, since);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_local = threading.local()
+
+
+def connect():
+    """Return this thread's connection, creating and migrating the database if needed"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DB_FILE, timeout=10.0, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(SCHEMA)
+        _add_zone_column(conn)
+        _add_units(conn)
+        _local.conn = conn
+        migrate_from_json()
+    return conn
+
+
+def _add_zone_column(conn):
+    """Databases created before zones were added get the column, backfilled from entries"""
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(queue)')]
+    if 'zone' not in columns:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute("ALTER TABLE queue ADD COLUMN zone TEXT NOT NULL DEFAULT 'unassigned'")
+            rows = conn.execute('SELECT id, entry FROM queue').fetchall()
+            conn.executemany('UPDATE queue SET zone = ? WHERE id = ?',
+                             [(entry_zone(json.loads(entry)), entry_id) for entry_id, entry in rows])
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+    conn.execute('CREATE INDEX IF NOT EXISTS queue_zone_dispatch_order '
+                 'ON queue (zone, priority, severity_score DESC, created_at)')
+
+
+def _add_units(conn):
+    """Databases from before per-unit tracking get units expanded from their fleet counts"""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'fleet'").fetchone():
+        return
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if not conn.execute('SELECT 1 FROM units LIMIT 1').fetchone():
+            counts = dict(conn.execute('SELECT name, value FROM fleet').fetchall())
+            if counts:
+                _write_fleet(conn, Fleet.with_counts(counts))
+        conn.execute('DROP TABLE fleet')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+@contextmanager
+def transaction():
+    """BEGIN IMMEDIATE ... COMMIT, rolled back if the block raises"""
+    conn = connect()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+def _queue_row(entry, created_at=None):
+    return (
+        entry['id'],
+        PRIORITY_RANK.get(entry.get('priority'), len(PRIORITY_RANK)),
+        entry.get('severity_score') or 0,
+        created_at if created_at is not None else time.time(),
+        json.dumps(entry),
+        entry_zone(entry),
+    )
+
+
+def _insert_entries(conn, entries):
+    # OR IGNORE keeps the first entry for an id, like the JSON queue's dedup
+    now = time.time()
+    conn.executemany(
+        'INSERT OR IGNORE INTO queue (id, priority, severity_score, created_at, entry, zone) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        # Bump created_at per row so a batch keeps its arrival order
+        [_queue_row(entry, now + i * 1e-6) for i, entry in enumerate(entries)],
+    )
+    conn.executemany('INSERT OR IGNORE INTO intake_refs (ref) VALUES (?)',
+                     [(entry['intake_ref'],) for entry in entries if entry.get('intake_ref')])
+
+
+def _write_values(conn, table, values):
+    conn.executemany(f'INSERT OR REPLACE INTO {table} (name, value) VALUES (?, ?)',
+                     list(values.items()))
+
+
+def migrate_from_json():
+    """Import the JSON queue, stats and fleet files once; returns True if it ran"""
+    from ambulance import datastore
+    from ambulance.shards import sharded_queue
+
+    with transaction() as conn:
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return False
+        queue = sharded_queue.load()
+        for entry in queue:
+            if entry.get('id') is None:
+                entry['id'] = datastore.new_request_id()
+        _insert_entries(conn, queue)
+        stats = datastore._load_json(datastore.STATS_FILE, dict(datastore.DEFAULT_STATS))
+        # The JSON store keeps the daily counters in per-process shards (counters.py)
+        counts = counters.values()
+        for name in DAILY_COUNTERS:
+            stats[name] = counts.get(name, 0)
+        _write_stats(conn, stats)
+        _write_fleet(conn, Fleet.from_dict(datastore._load_json(datastore.FLEET_FILE,
+                                                                dict(datastore.DEFAULT_FLEET))))
+        conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)",
+                     (time.strftime("%Y-%m-%d %H:%M:%S"),))
+    print(f"✅ Migrated {len(queue)} queued requests, stats and fleet status into {DB_FILE}")
+    return True
+
+
+# =======================================================
+# QUEUE
+# =======================================================
+
+def _zone_filter(zones):
+    if not zones:
+        return '', ()
+    return f"WHERE zone IN ({', '.join('?' * len(zones))}) ", tuple(zones)
+
+
+def load_queue(zones=None):
+    """Return queued entries of the given zones (default all) in dispatch order"""
+    where, params = _zone_filter(zones)
+    rows = connect().execute(
+        f'SELECT entry FROM queue {where}ORDER BY priority, severity_score DESC, created_at', params
+    ).fetchall()
+    return [json.loads(entry) for entry, in rows]
+
+
+def is_queued(entry_id):
+    """True if the id is in the queue (primary key lookup)"""
+    return connect().execute('SELECT 1 FROM queue WHERE id = ?', (entry_id,)).fetchone() is not None
+
+
+def seen_intake_ref(intake_ref):
+    """True if an entry with this intake_ref was ever enqueued"""
+    return connect().execute('SELECT 1 FROM intake_refs WHERE ref = ?',
+                             (intake_ref,)).fetchone() is not None
+
+
+def next_patient(zones=None):
+    """Return the next entry to dispatch, or None (index seek)"""
+    where, params = _zone_filter(zones)
+    row = connect().execute(
+        f'SELECT entry FROM queue {where}ORDER BY priority, severity_score DESC, created_at LIMIT 1',
+        params
+    ).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def enqueue(*entries):
+    """Insert one or more entries in a single transaction"""
+    with transaction() as conn:
+        _insert_entries(conn, entries)
+
+
+def update_entry(entry_id, fields):
+    """Merge fields into a queued entry"""
+    with transaction() as conn:
+        row = conn.execute('SELECT entry FROM queue WHERE id = ?', (entry_id,)).fetchone()
+        if row is None:
+            return
+        entry = json.loads(row[0])
+        entry.update(fields)
+        _, priority, severity_score, _, data, zone = _queue_row(entry)
+        conn.execute('UPDATE queue SET priority = ?, severity_score = ?, entry = ?, zone = ? '
+                     'WHERE id = ?', (priority, severity_score, data, zone, entry_id))
+
+
+def modify_entry(entry_id, change):
+    """Merge change(entry) into a queued entry in one transaction; returns it or None"""
+    with transaction() as conn:
+        row = conn.execute('SELECT entry FROM queue WHERE id = ?', (entry_id,)).fetchone()
+        if row is None:
+            return None
+        entry = json.loads(row[0])
+        fields = change(dict(entry))
+        if fields:
+            entry.update(fields)
+            _, priority, severity_score, _, data, zone = _queue_row(entry)
+            conn.execute('UPDATE queue SET priority = ?, severity_score = ?, entry = ?, zone = ? '
+                         'WHERE id = ?', (priority, severity_score, data, zone, entry_id))
+    return entry
+
+
+# =======================================================
+# STATS AND FLEET
+# =======================================================
+
+def load_stats():
+    """Return the stats table as a dict, with today's daily counters"""
+    conn = connect()
+    stats = dict(conn.execute('SELECT name, value FROM stats').fetchall())
+    stats.update(dict.fromkeys(DAILY_COUNTERS, 0))
+    stats.update(conn.execute('SELECT name, value FROM daily_stats WHERE day = ?',
+                              (counters.today(),)).fetchall())
+    return stats
+
+
+def save_stats(stats):
+    """Overwrite stats values (daily counters become today's counts)"""
+    with transaction() as conn:
+        _write_stats(conn, stats)
+
+
+def _write_stats(conn, stats):
+    stats = dict(stats)
+    day = counters.today()
+    conn.executemany('INSERT OR REPLACE INTO daily_stats (day, name, value) VALUES (?, ?, ?)',
+                     [(day, name, stats.pop(name)) for name in DAILY_COUNTERS if name in stats])
+    _write_values(conn, 'stats', stats)
+
+
+def increment_stat(name, amount=1):
+    """Add to a stats counter without a read-modify-write in the caller"""
+    with transaction() as conn:
+        _increment(conn, name, amount)
+
+
+def _increment(conn, name, amount):
+    # Upsert, so a counter missing from the stats table starts at amount
+    if name not in DAILY_COUNTERS:
+        conn.execute('INSERT INTO stats (name, value) VALUES (?, ?) '
+                     'ON CONFLICT (name) DO UPDATE SET value = value + excluded.value',
+                     (name, amount))
+        return
+    conn.execute('INSERT INTO daily_stats (day, name, value) VALUES (?, ?, ?) '
+                 'ON CONFLICT (day, name) DO UPDATE SET value = value + excluded.value',
+                 (counters.today(), name, amount))
+    oldest = time.strftime('%Y-%m-%d', time.localtime(time.time() - (DAILY_DAYS - 1) * 86400))
+    conn.execute('DELETE FROM daily_stats WHERE day < ?', (oldest,))
+
+
+def _read_fleet(conn):
+    return Fleet(json.loads(unit) for unit, in conn.execute('SELECT unit FROM units'))
+
+
+def _write_fleet(conn, fleet):
+    conn.execute('DELETE FROM units')
+    conn.executemany('INSERT INTO units (id, state, since, unit) VALUES (?, ?, ?, ?)',
+                     [(unit['id'], unit['state'], unit['since'], json.dumps(unit))
+                      for unit in fleet.units()])
+
+
+def load_fleet():
+    """Return the units as a Fleet"""
+    return _read_fleet(connect())
+
+
+def save_fleet(fleet):
+    """Replace every unit"""
+    with transaction() as conn:
+        _write_fleet(conn, fleet)
+
+
+def update_fleet(change):
+    """Call change(fleet) and save the units in one transaction; returns its result"""
+    with transaction() as conn:
+        fleet = _read_fleet(conn)
+        result = change(fleet)
+        _write_fleet(conn, fleet)
+    return result
+
+
+def load_fleet_status():
+    """Units per state (one index scan), plus 'on_mission' and 'total'"""
+    counts = dict.fromkeys(STATES, 0)
+    counts.update(connect().execute('SELECT state, COUNT(*) FROM units GROUP BY state').fetchall())
+    counts['on_mission'] = counts['en_route'] + counts['on_scene'] + counts['returning']
+    counts['total'] = sum(counts[state] for state in STATES)
+    return counts
+
+
+def dispatch_patient(entry_id):
+    """Dequeue a patient and assign an ambulance in one transaction
+
+    Returns the dispatched entry, or None (and changes nothing) if the
+    patient is no longer queued or no ambulance is available.
+    """
+    with transaction() as conn:
+        row = conn.execute('SELECT entry FROM queue WHERE id = ?', (entry_id,)).fetchone()
+        if row is None:
+            return None  # already dispatched elsewhere; nothing was changed
+        fleet = _read_fleet(conn)
+        unit_id = fleet.first('available')
+        if unit_id is None:
+            return None
+        entry = json.loads(row[0])
+        fleet.transition(unit_id, 'en_route', patient=entry_id, destination=entry.get('location'))
+        conn.execute('DELETE FROM queue WHERE id = ?', (entry_id,))
+        _increment(conn, 'dispatched', 1)
+        _write_fleet(conn, fleet)
+    return entry
+
+
+def main(argv=None):
+    global DB_FILE
+    parser = argparse.ArgumentParser(description="Create the SQLite store and import the JSON files")
+    parser.add_argument('--db', default=DB_FILE, help='database file')
+    args = parser.parse_args(argv)
+    DB_FILE = args.db
+    connect()
+    print(f"{DB_FILE}: {len(load_queue())} queued, stats {load_stats()}, fleet {load_fleet_status()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+"""
+In-process time series of queue depth, fleet use and triage rate.
+
+    python -m ambulance.timeseries            # last hour, one row per minute
+    python -m ambulance.timeseries --level 1  # last 15 minutes, one row per second
+
+start() runs one sampler thread per process. Every SAMPLE_INTERVAL
+seconds it reads the datastore and adds one sample of each SERIES to three
+ring buffers (LEVELS):
+
+    1 s   x 900     last 15 minutes
+    1 min x 1440    last 24 hours
+    1 h   x 720     last 30 days
+
+A buffer is a fixed set of slots, and a time falls in slot
+(time // resolution) % capacity. Each slot keeps the sum and count of the
+samples in its interval, so a coarser level holds the mean over its
+interval. Adding is O(1), and memory does not grow however long the
+process runs. A slot that still holds an older interval is cleared when
+it is next written and skipped when read.
+
+Every PERSIST_INTERVAL seconds, and at exit, the buffers are written to
+timeseries.json. Only filled slots are saved, with values rounded. They
+are read back when the store is created, so the charts keep their history
+across restarts. The dashboard process owns the file; other processes
+should not call start().
+"""
+import argparse
+import atexit
+import os
+import threading
+import time
+from datetime import datetime
+
+from ambulance import datastore
+from ambulance.locking import atomic_write_json
+from ambulance.read_cache import read_cache
+
+TIMESERIES_FILE = os.environ.get('AMBULANCE_TIMESERIES', 'timeseries.json')
+SAMPLE_INTERVAL = 1.0
+PERSIST_INTERVAL = 60.0
+
+# (resolution in seconds, number of slots)
+LEVELS = ((1, 900), (60, 1440), (3600, 720))
+
+SERIES = ('queue_high', 'queue_medium', 'queue_low',
+          'available', 'on_mission', 'maintenance', 'triage_per_min')
+
+
+class RingBuffer:
+    """Fixed number of time slots, each holding per-series sum and count"""
+
+    def __init__(self, resolution, capacity, series=SERIES):
+        self.resolution = resolution
+        self.capacity = capacity
+        self.series = tuple(series)
+        self._buckets = [None] * capacity    # interval number held by each slot
+        self._sums = {name: [0.0] * capacity for name in self.series}
+        self._counts = {name: [0] * capacity for name in self.series}
+
+    def _slot(self, bucket):
+        slot = bucket % self.capacity
+        if self._buckets[slot] != bucket:
+            self._buckets[slot] = bucket
+            for name in self.series:
+                self._sums[name][slot] = 0.0
+                self._counts[name][slot] = 0
+        return slot
+
+    def add(self, timestamp, values):
+        """Add one sample; series missing from `values` are left out of this interval"""
+        slot = self._slot(int(timestamp // self.resolution))
+        for name, value in values.items():
+            if name in self._sums and value is not None:
+                self._sums[name][slot] += value
+                self._counts[name][slot] += 1
+
+    def rows(self, start=None, now=None):
+        """[(interval start, {series: mean})] oldest first, within the buffer's span"""
+        now = time.time() if now is None else now
+        newest = int(now // self.resolution)
+        oldest = newest - self.capacity + 1
+        if start is not None:
+            oldest = max(oldest, int(start // self.resolution))
+        rows = []
+        for bucket in range(oldest, newest + 1):
+            slot = bucket % self.capacity
+            if self._buckets[slot] != bucket:
+                continue
+            means = {name: self._sums[name][slot] / self._counts[name][slot]
+                     for name in self.series if self._counts[name][slot]}
+            if means:
+                rows.append((bucket * self.resolution, means))
+        return rows
+
+    def to_dict(self):
+        """Filled slots only: {"resolution", "capacity", "slots": [[bucket, {name: [sum, count]}]]}"""
+        slots = []
+        for slot, bucket in enumerate(self._buckets):
+            if bucket is None:
+                continue
+            values = {name: [round(self._sums[name][slot], 3), self._counts[name][slot]]
+                      for name in self.series if self._counts[name][slot]}
+            if values:
+                slots.append([bucket, values])
+        return {'resolution': self.resolution, 'capacity': self.capacity, 'slots': slots}
+
+    def load_dict(self, data):
+        if data.get('resolution') != self.resolution or data.get('capacity') != self.capacity:
+            return  # saved with other LEVELS; start empty
+        for bucket, values in data.get('slots', []):
+            slot = self._slot(bucket)
+            for name, (total, count) in values.items():
+                if name in self._sums:
+                    self._sums[name][slot] = total
+                    self._counts[name][slot] = count
+
+
+class TimeSeriesStore:
+    """One RingBuffer per level, fed together"""
+
+    def __init__(self, levels=LEVELS, path=TIMESERIES_FILE):
+        self.path = path
+        self.buffers = {resolution: RingBuffer(resolution, capacity) for resolution, capacity in levels}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = None
+        self._last_calls = None
+        self.load()
+
+    def add(self, values, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            for buffer in self.buffers.values():
+                buffer.add(timestamp, values)
+
+    def rows(self, resolution, start=None):
+        """[(datetime, {series: mean})] for one level, oldest first"""
+        with self._lock:
+            rows = self.buffers[resolution].rows(start)
+        return [(datetime.fromtimestamp(t), values) for t, values in rows]
+
+    def sample(self, now=None):
+        """Read the datastore and add one sample of every series"""
+        now = time.time() if now is None else now
+        depth = {'HIGH': 0, 'MEDIUM': 0, 'LOW': 0}
+        for entry in datastore.load_queue():
+            if entry.get('priority') in depth:
+                depth[entry['priority']] += 1
+        fleet = datastore.load_fleet_status()
+        calls = datastore.load_stats().get('calls_today', 0)
+
+        rate = None
+        if self._last_calls is not None:
+            last_time, last_calls = self._last_calls
+            # calls_today drops back at midnight; skip that interval
+            if calls >= last_calls and now > last_time:
+                rate = (calls - last_calls) / (now - last_time) * 60
+        self._last_calls = (now, calls)
+
+        self.add({
+            'queue_high': depth['HIGH'],
+            'queue_medium': depth['MEDIUM'],
+            'queue_low': depth['LOW'],
+            'available': fleet.get('available', 0),
+            'on_mission': fleet.get('on_mission', 0),
+            'maintenance': fleet.get('maintenance', 0),
+            'triage_per_min': rate,
+        }, now)
+
+    def save(self):
+        with self._lock:
+            data = {str(resolution): buffer.to_dict() for resolution, buffer in self.buffers.items()}
+        try:
+            atomic_write_json(self.path, data, indent=None)
+        except OSError as e:
+            print(f"⚠️ Could not save time series: {e}")
+
+    def load(self):
+        data = read_cache.load_json(self.path, {})
+        with self._lock:
+            for resolution, buffer in self.buffers.items():
+                buffer.load_dict(data.get(str(resolution), {}))
+
+    def start(self):
+        """Start this process's sampler thread (once)"""
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread = threading.Thread(target=self._run, name='timeseries-sampler', daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+        atexit.register(self.save)
+
+    def _run(self):
+        last_save = time.monotonic()
+        while True:
+            started = time.monotonic()
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"⚠️ Time series sample failed: {e}")
+            if started - last_save >= PERSIST_INTERVAL:
+                self.save()
+                last_save = started
+            time.sleep(max(0.0, SAMPLE_INTERVAL - (time.monotonic() - started)))
+
+
+store = TimeSeriesStore()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print stored queue and fleet trends")
+    parser.add_argument('--level', type=int, default=60, choices=[r for r, _ in LEVELS],
+                        help='resolution in seconds')
+    parser.add_argument('--rows', type=int, default=60)
+    args = parser.parse_args(argv)
+
+    print(f"{'time':<20}" + ''.join(f'{name:>15}' for name in SERIES))
+    for when, values in store.rows(args.level)[-args.rows:]:
+        print(f"{when:%Y-%m-%d %H:%M:%S} " + ''.join(
+            f"{values[name]:>15.1f}" if name in values else f"{'':>15}" for name in SERIES))
+
+
+if __name__ == '__main__':
+    main()
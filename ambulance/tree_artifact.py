@@ -0,0 +1,151 @@
+"""
+Versioned, checksummed, memory-mappable triage tree artifact.
+
+    python -m ambulance.tree_artifact [model.pkl] [output.tree] [training.csv]
+
+File layout (little endian):
+
+    8 bytes   magic b'TRIAGE\\x00\\x01'
+    4 bytes   uint32 header length
+    4 bytes   reserved (zero)
+    N bytes   UTF-8 JSON header, space-padded to a 64-byte boundary
+    ...       node arrays, each starting on a 64-byte boundary
+
+The JSON header records the format version, feature order, class labels,
+SHA-256 of the source pickle and of the training CSV, the dtype/shape/
+offset of every node array and a SHA-256 checksum of the array block.
+Readers memory-map the file and view the arrays in place with
+np.frombuffer, so loading copies nothing and needs no scikit-learn.
+"""
+import json
+import mmap
+import struct
+import sys
+
+from ambulance.tree_model import TreePredictor
+from ambulance.triage import FEATURES
+
+MAGIC = b'TRIAGE\x00\x01'
+FORMAT_VERSION = 1
+ALIGN = 64
+PREAMBLE = struct.Struct('<8sII')
+
+DEFAULT_OUTPUT = 'emergency_triage_model.tree'
+DEFAULT_TRAINING_DATA = 'balanced_emergency_triage_dataset.csv'
+
+# Array name -> dtype stored in the file
+ARRAYS = [
+    ('feature', '<i4'),
+    ('threshold', '<f8'),
+    ('children_left', '<i4'),
+    ('children_right', '<i4'),
+    ('value', '<f8'),
+]
+
+
+class ArtifactError(ValueError):
+    """Raised when an artifact is malformed or fails its checksum"""
+
+
+def _pad(n):
+    return (-n) % ALIGN
+
+
+def write_artifact(model_path='emergency_triage_model.pkl', output_path=DEFAULT_OUTPUT,
+                   training_data=DEFAULT_TRAINING_DATA):
+    """Convert the joblib model into a .tree artifact"""
+    import hashlib
+    import os
+
+    import joblib
+    import numpy as np
+
+    from ambulance.tree_export import file_sha256, tree_arrays
+
+    arrays = tree_arrays(joblib.load(model_path))
+    node_count = len(arrays['FEATURE'])
+
+    blob = bytearray()
+    layout = {}
+    for name, dtype in ARRAYS:
+        data = np.ascontiguousarray(arrays[name.upper()], dtype=dtype)
+        blob += b'\x00' * _pad(len(blob))
+        layout[name] = {'dtype': dtype, 'shape': list(data.shape), 'offset': len(blob)}
+        blob += data.tobytes()
+
+    header = {
+        'format_version': FORMAT_VERSION,
+        'features': FEATURES,
+        'classes': arrays['CLASSES'],
+        'node_count': node_count,
+        'source_sha256': file_sha256(model_path),
+        'training_data_sha256': file_sha256(training_data) if os.path.exists(training_data) else None,
+        'arrays': layout,
+        'checksum': 'sha256:' + hashlib.sha256(blob).hexdigest(),
+    }
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    header_bytes += b' ' * _pad(PREAMBLE.size + len(header_bytes))
+
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(PREAMBLE.pack(MAGIC, len(header_bytes), 0))
+        f.write(header_bytes)
+        f.write(blob)
+    os.replace(tmp_path, output_path)
+    print(f"✅ Wrote {output_path} ({node_count} nodes, {PREAMBLE.size + len(header_bytes) + len(blob)} bytes)")
+    return output_path
+
+
+def read_header(buf):
+    """Parse and validate the preamble and JSON header of a mapped artifact"""
+    if len(buf) < PREAMBLE.size:
+        raise ArtifactError("File too short for a triage artifact")
+    magic, header_len, _ = PREAMBLE.unpack_from(buf, 0)
+    if magic != MAGIC:
+        raise ArtifactError("Not a triage tree artifact (bad magic)")
+    header = json.loads(bytes(buf[PREAMBLE.size:PREAMBLE.size + header_len]))
+    if header.get('format_version') != FORMAT_VERSION:
+        raise ArtifactError(f"Unsupported artifact format version {header.get('format_version')}")
+    if header.get('features') != FEATURES:
+        raise ArtifactError("Artifact feature order does not match the questionnaire")
+    return header, PREAMBLE.size + header_len
+
+
+def load_artifact(path, verify=True):
+    """Memory-map an artifact and return a TreePredictor viewing it in place
+
+    The returned predictor keeps the mapping open through its arrays.
+    Raises ArtifactError on a malformed file or checksum mismatch.
+    """
+    import hashlib
+
+    import numpy as np
+
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    header, data_start = read_header(mm)
+    data = memoryview(mm)[data_start:]
+
+    if verify:
+        algo, _, expected = header['checksum'].partition(':')
+        if hashlib.new(algo, data).hexdigest() != expected:
+            raise ArtifactError(f"Checksum mismatch in {path}")
+
+    views = {}
+    for name, dtype in ARRAYS:
+        spec = header['arrays'][name]
+        count = 1
+        for dim in spec['shape']:
+            count *= dim
+        views[name] = np.frombuffer(data, dtype=spec['dtype'], count=count,
+                                    offset=spec['offset']).reshape(spec['shape'])
+
+    predictor = TreePredictor(views['feature'], views['threshold'], views['children_left'],
+                              views['children_right'], views['value'], header['classes'],
+                              version=header['source_sha256'][:12])
+    predictor.header = header
+    return predictor
+
+
+if __name__ == '__main__':
+    write_artifact(*sys.argv[1:4])
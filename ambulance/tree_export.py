@@ -0,0 +1,95 @@
+"""
+Export the fitted DecisionTreeClassifier to a generated Python module.
+
+    python -m ambulance.tree_export [model.pkl] [output.py]
+
+The generated module holds the tree as flat lists (feature, threshold,
+children_left/right, value) remapped to the FEATURES symptom order, so the
+patient portal can triage without importing scikit-learn or pandas.
+"""
+import hashlib
+import os
+import pprint
+import sys
+
+from ambulance.tree_model import LEAF, TreePredictor
+from ambulance.triage import FEATURES
+
+DEFAULT_MODEL = 'emergency_triage_model.pkl'
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(__file__), 'triage_tree.py')
+
+
+def file_sha256(path):
+    """Return the hex SHA-256 of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def tree_arrays(model):
+    """Flatten a fitted DecisionTreeClassifier into plain Python lists
+
+    Raises ValueError unless the model was trained on exactly the 10
+    questionnaire symptoms in FEATURES order. scikit-learn rejects the
+    portal's input for any other model, so the portal has never used one;
+    exporting it anyway would silently change triage results.
+    """
+    tree = model.tree_
+    trained_on = [str(name) for name in getattr(model, 'feature_names_in_', FEATURES)]
+    if trained_on != FEATURES:
+        raise ValueError(f"Model was trained on {trained_on}, not the questionnaire's {FEATURES}")
+
+    feature = [LEAF if tree.children_left[node] == LEAF else idx
+               for node, idx in enumerate(tree.feature.tolist())]
+
+    # Normalise per-node class weights to fractions (older sklearn stores counts)
+    value = []
+    for row in tree.value[:, 0, :].tolist():
+        total = sum(row) or 1.0
+        value.append([round(v / total, 6) for v in row])
+
+    return {
+        'FEATURE': feature,
+        'THRESHOLD': [float(t) for t in tree.threshold.tolist()],
+        'CHILDREN_LEFT': [int(c) for c in tree.children_left.tolist()],
+        'CHILDREN_RIGHT': [int(c) for c in tree.children_right.tolist()],
+        'VALUE': value,
+        'CLASSES': [str(c) for c in model.classes_],
+    }
+
+
+def export_predictor(model, source_sha256=None):
+    """Build an in-memory TreePredictor from a fitted model"""
+    arrays = tree_arrays(model)
+    return TreePredictor(arrays['FEATURE'], arrays['THRESHOLD'], arrays['CHILDREN_LEFT'],
+                         arrays['CHILDREN_RIGHT'], arrays['VALUE'], arrays['CLASSES'],
+                         version=(source_sha256 or '')[:12] or None)
+
+
+def write_module(model_path=DEFAULT_MODEL, output_path=DEFAULT_OUTPUT):
+    """Load the joblib model and write the generated inference module"""
+    import joblib
+
+    model = joblib.load(model_path)
+    arrays = tree_arrays(model)
+
+    lines = [
+        f'# Generated by ambulance/tree_export.py from {os.path.basename(model_path)} - do not edit.',
+        '# Re-run `python -m ambulance.tree_export` after retraining the model.',
+        '',
+        f'SOURCE_SHA256 = {file_sha256(model_path)!r}',
+        f'FEATURES = {FEATURES!r}',
+    ]
+    for name in ['CLASSES', 'FEATURE', 'THRESHOLD', 'CHILDREN_LEFT', 'CHILDREN_RIGHT', 'VALUE']:
+        lines.append(f'{name} = {pprint.pformat(arrays[name], width=100, compact=True)}')
+
+    with open(output_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    print(f"✅ Wrote {output_path} ({len(arrays['FEATURE'])} nodes)")
+    return output_path
+
+
+if __name__ == '__main__':
+    write_module(*sys.argv[1:3])
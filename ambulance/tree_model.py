@@ -0,0 +1,69 @@
+"""
+Pure-Python decision tree walker.
+
+Holds the fitted triage tree as flat node arrays (the same layout as
+sklearn's tree_ attributes) so prediction needs neither scikit-learn nor
+pandas. Arrays can be plain lists (generated module) or NumPy arrays.
+"""
+
+LEAF = -1
+
+# Classes kept per leaf for the differential diagnosis
+TOP_K = 3
+
+
+class TreePredictor:
+    """Flat-array decision tree over the FEATURES symptom order"""
+
+    def __init__(self, feature, threshold, children_left, children_right, value, classes,
+                 version=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.children_left = children_left
+        self.children_right = children_right
+        self.value = value
+        self.classes = list(classes)
+        self.version = version
+        # Winning class per node, resolved once (first maximum, like sklearn's argmax),
+        # and the top-k (class, probability) per leaf for the differential diagnosis
+        self.node_class = []
+        self.leaf_differential = {}
+        for node, row in enumerate(value):
+            row = [float(v) for v in row]
+            self.node_class.append(self.classes[row.index(max(row))])
+            if children_left[node] == LEAF:
+                total = sum(row) or 1.0
+                ranked = sorted(range(len(row)), key=lambda i: (-row[i], i))
+                self.leaf_differential[node] = [
+                    (self.classes[i], row[i] / total) for i in ranked[:TOP_K] if row[i] > 0
+                ]
+
+    @classmethod
+    def from_module(cls, module):
+        """Build a predictor from a module generated by tree_export"""
+        return cls(module.FEATURE, module.THRESHOLD, module.CHILDREN_LEFT,
+                   module.CHILDREN_RIGHT, module.VALUE, module.CLASSES,
+                   version=module.SOURCE_SHA256[:12])
+
+    def leaf(self, features):
+        """Return the leaf node index reached by one feature row"""
+        node = 0
+        left = self.children_left
+        while left[node] != LEAF:
+            if features[self.feature[node]] <= self.threshold[node]:
+                node = left[node]
+            else:
+                node = self.children_right[node]
+        return node
+
+    def predict_one(self, features):
+        """Predict the diagnosis for one feature row"""
+        return self.node_class[self.leaf(features)]
+
+    def differential(self, features, k=TOP_K):
+        """Top-k (diagnosis, probability) pairs from the leaf a feature row reaches"""
+        return self.leaf_differential[self.leaf(features)][:k]
+
+    def predict(self, X):
+        """Predict diagnoses for a sequence of feature rows"""
+        return [self.node_class[self.leaf(row)] for row in X]
@@ -0,0 +1,456 @@
+"""
+Hybrid triage classification shared by the patient portal.
+
+The questionnaire is exactly 10 binary symptoms, so every possible answer
+vector fits in a 10-bit mask (1024 cases). Instead of walking the rule chain
+and calling the ML model on every submission, the full answer space is
+classified once into a lookup table and served by index.
+"""
+import logging
+import os
+import time
+
+from ambulance import metrics
+from ambulance.rules import NO_MATCH, RuleSet
+
+logger = logging.getLogger(__name__)
+
+# Feature order the model was trained on (bit i of a symptom mask = FEATURES[i])
+FEATURES = [
+    'chest_pain', 'shortness_of_breath', 'unconsciousness', 'bleeding',
+    'confusion', 'weakness', 'seizure', 'trauma', 'dizziness', 'cyanosis'
+]
+N_MASKS = 1 << len(FEATURES)
+
+MODEL_PATHS = [
+    'emergency_triage_model.pkl',
+    './emergency_triage_model.pkl',
+    '../emergency_triage_model.pkl',
+    'models/emergency_triage_model.pkl',
+]
+
+# Compact .tree artifacts (see tree_artifact.py) are preferred over the pickle
+ARTIFACT_PATHS = [path[:-len('.pkl')] + '.tree' for path in MODEL_PATHS]
+
+# Map ML diagnosis to priority and severity score
+SEVERITY_MAP = {
+    'Cardiac Arrest': ('HIGH', 150),
+    'Heart Attack': ('HIGH', 135),
+    'Severe Respiratory Distress': ('HIGH', 130),
+    'Major Trauma/Bleeding': ('HIGH', 125),
+    'Stroke': ('HIGH', 120),
+    'Shock/Collapse': ('MEDIUM', 90),
+    'Seizure/Post-Seizure': ('MEDIUM', 85),
+    'Fainting/Syncope': ('LOW', 50),
+    'Minor Trauma': ('LOW', 45),
+    'Anxiety/Panic': ('LOW', 40)
+}
+
+# Weights for the fallback severity score
+SYMPTOM_WEIGHTS = {
+    'chest_pain': 35,            # Cardiac indicator
+    'shortness_of_breath': 30,   # Respiratory/cardiac
+    'unconsciousness': 50,       # Critical brain/cardiac
+    'bleeding': 30,              # Hemorrhage risk
+    'confusion': 25,             # Neurological/stroke
+    'weakness': 25,              # Stroke/cardiac
+    'seizure': 28,               # Neurological emergency
+    'trauma': 30,                # Injury severity
+    'dizziness': 15,             # General instability
+    'cyanosis': 40               # Oxygen deprivation
+}
+
+
+# ========== DECLARATIVE RULE TABLES ==========
+# (required present, required absent, diagnosis, priority, severity score)
+# First matching rule wins; compiled into a per-mask lookup by RuleSet.
+
+# Phase 1 of classify(): life-threatening conditions that bypass ML
+CRITICAL_RULES = RuleSet(FEATURES, [
+    # Unconscious + Cyanosis = Cardiac Arrest (HIGHEST PRIORITY)
+    (('unconsciousness', 'cyanosis'), (), 'Cardiac Arrest', 'HIGH', 150),
+    # Unconscious alone = Critical (brain injury, stroke, cardiac event)
+    (('unconsciousness',), (), 'Critical - Unconscious Patient', 'HIGH', 145),
+    # Severe Respiratory Distress + Cyanosis (suffocation, cardiac/respiratory failure)
+    (('shortness_of_breath', 'cyanosis'), (), 'Severe Respiratory Distress', 'HIGH', 140),
+    # Triple cardiac symptoms (Chest pain + Breathing difficulty + Cyanosis)
+    (('chest_pain', 'shortness_of_breath', 'cyanosis'), (), 'Heart Attack (STEMI Suspected)', 'HIGH', 135),
+    # Major Trauma with Bleeding (hypovolemic shock risk)
+    (('trauma', 'bleeding'), (), 'Major Trauma/Hemorrhage', 'HIGH', 130),
+    # Chest Pain + Shortness of Breath (cardiac event without cyanosis yet)
+    (('chest_pain', 'shortness_of_breath'), (), 'Heart Attack (Suspected)', 'HIGH', 128),
+    # Stroke symptoms (Confusion + One-sided Weakness)
+    (('confusion', 'weakness'), (), 'Stroke (Suspected)', 'HIGH', 125),
+], method='Critical Rule')
+
+# Rapid triage of the 3 critical questions (bleeding_trauma sets both bits)
+RAPID_TRIAGE_RULES = RuleSet(FEATURES, [
+    (('unconsciousness', 'bleeding'), (), 'Critical - Unconscious with Trauma/Bleeding', 'HIGH', 150),
+    (('unconsciousness', 'trauma'), (), 'Critical - Unconscious with Trauma/Bleeding', 'HIGH', 150),
+    (('unconsciousness',), (), 'Critical - Unconscious Patient', 'HIGH', 145),
+    (('shortness_of_breath', 'bleeding'), (), 'Severe Respiratory Distress with Trauma', 'HIGH', 145),
+    (('shortness_of_breath', 'trauma'), (), 'Severe Respiratory Distress with Trauma', 'HIGH', 145),
+    (('shortness_of_breath',), (), 'Severe Respiratory Distress', 'HIGH', 140),
+    (('bleeding',), (), 'Major Trauma/Bleeding', 'HIGH', 135),
+    (('trauma',), (), 'Major Trauma/Bleeding', 'HIGH', 135),
+    ((), (), 'Critical Emergency - Multiple Critical Symptoms', 'HIGH', 135),
+], method='Rapid Triage (Critical Rule)')
+
+# Phase 3 diagnosis patterns; priority and score come from the weighted score
+FALLBACK_PATTERNS = RuleSet(FEATURES, [
+    (('chest_pain', 'shortness_of_breath'), (), 'Heart Attack (Suspected)', None, None),
+    (('confusion', 'weakness'), (), 'Stroke (Suspected)', None, None),
+    (('bleeding', 'trauma'), (), 'Major Trauma/Bleeding', None, None),
+    (('seizure',), (), 'Seizure/Post-Seizure', None, None),
+    (('shortness_of_breath',), (), 'Respiratory Distress', None, None),
+    (('dizziness', 'weakness'), (), 'Syncope/Collapse', None, None),
+], method='Rule-Based Fallback')
+
+
+def symptom_mask(answers):
+    """Pack a questionnaire answers dict into a 10-bit integer"""
+    mask = 0
+    for bit, name in enumerate(FEATURES):
+        if answers.get(name, 0) == 1:
+            mask |= 1 << bit
+    return mask
+
+
+def answers_from_mask(mask):
+    """Unpack a 10-bit symptom mask into an answers dict"""
+    return {name: (mask >> bit) & 1 for bit, name in enumerate(FEATURES)}
+
+
+def find_model_path():
+    """Return the first artifact or pickle path that exists, or None"""
+    for path in ARTIFACT_PATHS + MODEL_PATHS:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def find_pickle_path():
+    """Return the first joblib pickle path that exists, or None"""
+    for path in MODEL_PATHS:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def classify(answers, predict=None, record_metrics=True):
+    """
+    Hybrid ML + Rule-based emergency classification
+
+    PRIORITY ORDER:
+    1. Critical life-threatening rules (INSTANT response - no ML delay)
+    2. ML Model prediction (for complex pattern recognition)
+    3. Fallback scoring system (if ML unavailable)
+
+    `predict` takes a feature list in FEATURES order and returns a diagnosis
+    string, or None when the model is unavailable. Each phase's latency is
+    recorded in the per-process triage metrics, unless record_metrics is
+    False (building the triage table is not triage traffic).
+
+    Returns: (diagnosis, priority, severity_score, method_used)
+    """
+    record = metrics.record if record_metrics else _skip_record
+
+    started = time.perf_counter()
+    result = critical_rule(answers)
+    phase_end = time.perf_counter()
+    record('critical_rules', phase_end - started)
+
+    if result is None and predict is not None:
+        phase_start = phase_end
+        result = ml_phase(answers, predict)
+        phase_end = time.perf_counter()
+        record('ml_model', phase_end - phase_start)
+
+    if result is None:
+        phase_start = phase_end
+        result = fallback_score(answers)
+        phase_end = time.perf_counter()
+        record('fallback', phase_end - phase_start)
+
+    record('total', phase_end - started, method=result[3])
+    return result
+
+
+def _skip_record(phase, seconds, method=None):
+    pass
+
+
+def critical_rule(answers):
+    """Phase 1: return the first matching critical rule result, or None"""
+
+    # ========== PHASE 1: CRITICAL RULE-BASED CONDITIONS (INSTANT RESPONSE) ==========
+    # These bypass ML for speed - life-threatening conditions need immediate classification
+    return CRITICAL_RULES.match(symptom_mask(answers))
+
+
+def ml_phase(answers, predict):
+    """Phase 2: classify with the ML model, or None if it has no answer"""
+
+    # ========== PHASE 2: USE ML MODEL FOR COMPLEX PATTERN RECOGNITION ==========
+    # ML is better at detecting subtle combinations and non-obvious patterns
+
+    diagnosis = predict([answers.get(name, 0) for name in FEATURES])
+    if diagnosis is None:
+        return None
+    priority, severity_score = SEVERITY_MAP.get(diagnosis, ('MEDIUM', 70))
+    return diagnosis, priority, severity_score, 'ML Model'
+
+
+def fallback_score(answers):
+    """Phase 3: weighted symptom score with pattern-based diagnosis"""
+
+    # ========== PHASE 3: FALLBACK RULE-BASED SCORING SYSTEM ==========
+    # Used when ML model is unavailable or fails
+
+    # Calculate weighted severity score
+    score = 0
+    for name, weight in SYMPTOM_WEIGHTS.items():
+        score += answers.get(name, 0) * weight
+
+    # Determine diagnosis from symptom patterns
+    pattern = FALLBACK_PATTERNS.match(symptom_mask(answers))
+    if pattern is not None:
+        diagnosis = pattern[0]
+    elif score > 0:
+        diagnosis = 'General Medical Emergency'
+    else:
+        diagnosis = 'Non-Emergency Medical Assistance'
+
+    # Determine priority based on score
+    if score >= 120:
+        priority = 'HIGH'
+    elif score >= 60:
+        priority = 'MEDIUM'
+    else:
+        priority = 'LOW'
+
+    return diagnosis, priority, score, 'Rule-Based Fallback'
+
+
+def map_critical_answers(critical_answers):
+    """Map the 3 rapid-triage answers onto the 10-symptom questionnaire format
+
+    The combined bleeding_trauma question sets both bleeding and trauma;
+    every other symptom defaults to 0.
+    """
+    answers = {name: 0 for name in FEATURES}
+    if 'unconsciousness' in critical_answers:
+        answers['unconsciousness'] = critical_answers['unconsciousness']
+    if 'shortness_of_breath' in critical_answers:
+        answers['shortness_of_breath'] = critical_answers['shortness_of_breath']
+    if 'bleeding_trauma' in critical_answers:
+        answers['bleeding'] = critical_answers['bleeding_trauma']
+        answers['trauma'] = critical_answers['bleeding_trauma']
+    return answers
+
+
+def rapid_triage(answers):
+    """
+    Diagnosis for a rapid-triage critical case (2+ critical questions answered Yes)
+
+    Returns: (diagnosis, priority, severity_score, method_used)
+    """
+    return RAPID_TRIAGE_RULES.match(symptom_mask(answers))
+
+
+class ModelNotExported(RuntimeError):
+    """The pickle exists but no .tree artifact or generated module was exported from it"""
+
+
+def load_predictor(path, source_sha256=None):
+    """Load the triage tree as a pure-Python TreePredictor
+
+    Load order:
+    1. A .tree artifact, memory-mapped and checksum-verified
+    2. The generated ambulance/triage_tree.py module
+
+    Either must have been exported from the current pickle (or no pickle
+    is present). The pickle itself is never loaded here, so the portal
+    does not import scikit-learn; exporting it is a build step.
+
+    `source_sha256` is the SHA-256 of the pickle, hashed here when not
+    given.
+    Returns (predictor, source), or (None, None) if there is no model.
+    Raises ModelNotExported if there is a pickle but no current export.
+    """
+    from ambulance.tree_model import TreePredictor
+    from ambulance.tree_export import file_sha256
+
+    pickle_path = find_pickle_path()
+    if source_sha256 is None and pickle_path is not None:
+        source_sha256 = file_sha256(pickle_path)
+
+    note = ''
+    if path is not None and path.endswith('.tree'):
+        from ambulance.tree_artifact import ArtifactError, load_artifact
+        try:
+            predictor = load_artifact(path)
+            if source_sha256 is not None and predictor.header['source_sha256'] != source_sha256:
+                raise ArtifactError(f"exported from a different {pickle_path}")
+            return predictor, f'{path} (mmap)'
+        except Exception as e:
+            note = f' - {path} rejected: {e}'
+
+    try:
+        from ambulance import triage_tree
+    except ImportError:
+        triage_tree = None
+
+    if triage_tree is not None and source_sha256 in (None, triage_tree.SOURCE_SHA256):
+        return TreePredictor.from_module(triage_tree), 'ambulance/triage_tree.py' + note
+    if pickle_path is None:
+        return None, None
+    raise ModelNotExported(f"{pickle_path} has no current export (run python -m ambulance.tree_artifact){note}")
+
+
+class TriageTable:
+    """Precomputed triage result for every 10-bit symptom mask"""
+
+    def __init__(self, model=None):
+        self.model = model
+        self.model_loaded = model is not None
+        predict = model.predict_one if model is not None else None
+        self.entries = [classify(answers_from_mask(mask), predict, record_metrics=False)
+                        for mask in range(N_MASKS)]
+
+        # Top-k leaf class distribution per mask, only where the model made the
+        # diagnosis ([] where a critical rule or the fallback score did)
+        self.differentials = []
+        for mask in range(N_MASKS):
+            if self.entries[mask][3] != 'ML Model':
+                self.differentials.append([])
+            else:
+                features = [(mask >> bit) & 1 for bit in range(len(FEATURES))]
+                self.differentials.append(model.differential(features))
+
+    def lookup(self, answers):
+        """Return (diagnosis, priority, severity_score, method_used) for an answers dict"""
+        return self.entries[symptom_mask(answers)]
+
+    def differential(self, answers):
+        """Return the model's top-k [(diagnosis, probability)] for an answers dict ([] unless ML-diagnosed)"""
+        return self.differentials[symptom_mask(answers)]
+
+
+_registry = None
+
+
+def get_table():
+    """Return the process-wide triage table from the model registry"""
+    global _registry
+    if _registry is None:
+        # Imported on first use: model_registry imports this module
+        from ambulance.model_registry import registry as _registry
+    return _registry.current().table
+
+
+def hybrid_classify_and_prioritize(answers):
+    """Classify an answers dict via the precompiled triage table"""
+    started = time.perf_counter()
+    result = get_table().lookup(answers)
+    metrics.record('table_lookup', time.perf_counter() - started, method=result[3])
+    return result
+
+
+def differential_diagnosis(answers):
+    """Top-k (diagnosis, confidence) pairs from the model's leaf distribution
+
+    Empty unless the table's result for these answers came from the model.
+    """
+    return get_table().differential(answers)
+
+
+def format_differential(differential):
+    """Render [(diagnosis, confidence), ...] as 'Stroke 80% · Shock/Collapse 20%'"""
+    return ' · '.join(f"{diagnosis} {confidence:.0%}" for diagnosis, confidence in differential)
+
+
+def classify_batch(X, model=None):
+    """
+    Vectorized hybrid classification over an N x 10 symptom matrix
+
+    X is a NumPy array with columns in FEATURES order, or a DataFrame that
+    has those columns. Rows are packed into symptom masks and matched against
+    the compiled rule tables with one array index, the model is called once
+    for all remaining rows and the fallback score is a single dot product
+    with the weight vector. `model` is a TreePredictor; the process-wide one
+    is used when it is None.
+
+    Returns: (diagnosis, priority, severity_score, method_used) column arrays,
+    row-for-row identical to classify()
+    """
+    import numpy as np
+
+    if hasattr(X, 'columns'):
+        X = X[FEATURES].to_numpy()
+    X = np.asarray(X).reshape(-1, len(FEATURES))
+    if model is None:
+        model = get_table().model
+
+    n = len(X)
+    masks = (X == 1).astype(np.int64) @ (1 << np.arange(len(FEATURES), dtype=np.int64))
+
+    diagnosis = np.empty(n, dtype=object)
+    priority = np.empty(n, dtype=object)
+    severity_score = np.zeros(n, dtype=np.int64)
+    method = np.empty(n, dtype=object)
+
+    # ========== PHASE 1: CRITICAL RULES (one table index per row) ==========
+    started = time.perf_counter()
+    winner = CRITICAL_RULES.match_indices(masks)
+    done = winner != NO_MATCH
+    for idx, rule in enumerate(CRITICAL_RULES.rules):
+        rows = winner == idx
+        diagnosis[rows] = rule.diagnosis
+        priority[rows] = rule.priority
+        severity_score[rows] = rule.score
+    method[done] = CRITICAL_RULES.method
+
+    phase_end = time.perf_counter()
+    metrics.record('batch_critical_rules', phase_end - started)
+
+    # ========== PHASE 2: ONE MODEL CALL FOR EVERY REMAINING ROW ==========
+    rows = np.flatnonzero(~done)
+    if model is not None and len(rows):
+        try:
+            predicted = model.predict(X[rows])
+        except Exception:
+            logger.warning("ML prediction failed for %d rows; using fallback scoring", len(rows), exc_info=True)
+            predicted = None
+        if predicted is not None:
+            labels, inverse = np.unique(np.asarray(predicted, dtype=object), return_inverse=True)
+            mapped = [SEVERITY_MAP.get(label, ('MEDIUM', 70)) for label in labels]
+            diagnosis[rows] = labels[inverse]
+            priority[rows] = np.array([p for p, _ in mapped], dtype=object)[inverse]
+            severity_score[rows] = np.array([s for _, s in mapped], dtype=np.int64)[inverse]
+            method[rows] = 'ML Model'
+            done[rows] = True
+        phase_start, phase_end = phase_end, time.perf_counter()
+        metrics.record('batch_ml_model', phase_end - phase_start)
+
+    # ========== PHASE 3: FALLBACK SCORING AS ONE DOT PRODUCT ==========
+    phase_start = phase_end
+    rest = ~done
+    weights = np.array([SYMPTOM_WEIGHTS[name] for name in FEATURES])
+    score = X[rest] @ weights
+
+    pattern = FALLBACK_PATTERNS.match_indices(masks[rest])
+    fallback_diagnosis = np.where(score > 0, 'General Medical Emergency',
+                                  'Non-Emergency Medical Assistance').astype(object)
+    for idx, rule in enumerate(FALLBACK_PATTERNS.rules):
+        fallback_diagnosis[pattern == idx] = rule.diagnosis
+
+    diagnosis[rest] = fallback_diagnosis
+    severity_score[rest] = score
+    priority[rest] = np.where(score >= 120, 'HIGH', np.where(score >= 60, 'MEDIUM', 'LOW'))
+    method[rest] = FALLBACK_PATTERNS.method
+    phase_end = time.perf_counter()
+    metrics.record('batch_fallback', phase_end - phase_start)
+    metrics.record('batch_total', phase_end - started)
+
+    return diagnosis, priority, severity_score, method
@@ -0,0 +1,98 @@
+"""
+Versioned JSON documents with compare-and-swap updates.
+
+A versioned document is a JSON object with a 'version' counter. An update
+reads the document and its version without any lock, computes the new
+document, then calls compare_and_swap. That holds the file's flock only
+long enough to check the version is unchanged and rename the new file
+into place with version + 1. If another writer got there first, the swap
+fails and update_versioned re-reads and recomputes, with a short
+randomized backoff, up to CAS_RETRIES times.
+
+Readers never block, and writers serialize only for the check-and-rename,
+not for the whole read-compute-write. A writer that loses a race re-runs
+its change on the winner's state, so nothing is decided from stale data
+(for example two dispatches both seeing the last available unit).
+
+The version check under the flock reads the file itself, not the
+process-wide read cache. The cache revalidates on (inode, mtime, size),
+and a rename can reuse the inode of the file it replaces with the same
+size within one mtime tick, so a cached read could hand the check a stale
+version. A failed swap also drops the path from the cache, so the retry
+reads the winner's document rather than the same stale copy.
+
+Only a missing file starts from the default at version 0. A file that
+exists but cannot be read or parsed raises CorruptDocument, so an update
+never replaces data it could not see.
+"""
+import copy
+import json
+import random
+import time
+
+from ambulance.locking import atomic_write_json, lock_path, locked
+from ambulance.read_cache import file_key, read_cache
+
+CAS_RETRIES = 50
+CAS_BACKOFF = 0.002
+
+
+class VersionConflict(RuntimeError):
+    """An update kept losing to concurrent writers and gave up"""
+
+
+class CorruptDocument(ValueError):
+    """A versioned file exists but is not a readable JSON object"""
+
+
+def _load(path, default, cached=True):
+    if file_key(path) is None:
+        return default
+    if cached:
+        data = read_cache.load_json(path, None)
+    else:
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return default
+        except (OSError, ValueError):
+            data = None
+    if not isinstance(data, dict):
+        raise CorruptDocument(f"{path} is unreadable or not a JSON object; fix or remove it")
+    return data
+
+
+def read_versioned(path, default):
+    """(document, version) - a private copy, version 0 for files that never had one"""
+    data = _load(path, default)
+    return data, data.get('version', 0)
+
+
+def compare_and_swap(path, expected_version, data):
+    """Write `data` as version expected_version + 1 if the file is still at expected_version"""
+    with locked(lock_path(path)):
+        if _load(path, {}, cached=False).get('version', 0) != expected_version:
+            read_cache.invalidate(path)
+            return False
+        data['version'] = expected_version + 1
+        atomic_write_json(path, data)
+    read_cache.invalidate(path)
+    return True
+
+
+def update_versioned(path, change, default, retries=CAS_RETRIES):
+    """Apply change(document) optimistically and return its result
+
+    change mutates the document in place; if it leaves it unchanged nothing
+    is written. It may run more than once, so it must not have side effects
+    beyond the document.
+    """
+    for attempt in range(retries):
+        data, version = read_versioned(path, default)
+        original = copy.deepcopy(data)
+        result = change(data)
+        if data == original or compare_and_swap(path, version, data):
+            return result
+        time.sleep(random.uniform(0, CAS_BACKOFF * (attempt + 1)))
+    raise VersionConflict(f"{path} changed on every one of {retries} attempts")
@@ -0,0 +1,278 @@
+"""
+Headless triage worker.
+
+    python -m ambulance.worker [--intake intake.jsonl] [--once]
+
+Tails an append-only JSONL intake file, classifies new lines in
+micro-batches with the same triage logic as the patient portal, and
+commits each batch to the emergency queue with a single log append. One intake
+line is one request:
+
+    {"name": "Rahul", "age": 28, "phone": "9876543210", "address": "Sitabuldi",
+     "answers": {"chest_pain": 1, "shortness_of_breath": 0, ...},
+     "additional_info": "optional"}
+
+"critical_answers" ({"unconsciousness", "shortness_of_breath",
+"bleeding_trauma"}) can be given instead of, or as well as, "answers". When
+two or more are Yes, the request goes through rapid triage like the portal.
+Answers may be 1/0, true/false or "yes"/"no"; a line with any other answer,
+or without a name, is logged and skipped like a malformed JSON line.
+
+The read offset is kept in <intake>.offset and only advanced after the
+queue write. Each queued entry carries an intake_ref
+(file@inode.generation:offset), so a crash between the two writes re-reads
+lines that are already queued and skips them instead of queueing them
+twice. The check is an indexed lookup and also covers lines that have been
+dispatched since.
+
+The offset file also records the intake file's inode, a digest of the
+bytes just before the offset and a generation. When the file is replaced
+(rotated), shrinks below the offset or no longer holds those bytes
+(truncated and rewritten), reading restarts at 0 in the next generation,
+so new lines at old offsets get new refs rather than matching
+already-queued ones.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+
+from ambulance import datastore, triage
+from ambulance.locking import atomic_write_json
+
+DEFAULT_INTAKE = 'intake.jsonl'
+BATCH_SIZE = 256
+POLL_INTERVAL = 1.0
+
+# Bytes before the offset that must be unchanged to resume from it
+CHECK_BYTES = 4096
+
+# Questions of the portal's rapid triage step
+CRITICAL_QUESTIONS = ('unconsciousness', 'shortness_of_breath', 'bleeding_trauma')
+
+# Accepted spellings of a Yes/No answer (compared lower-cased)
+ANSWER_WORDS = {'1': 1, '0': 0, 'yes': 1, 'no': 0, 'true': 1, 'false': 0}
+
+
+def offset_path(intake_path):
+    return intake_path + '.offset'
+
+
+def load_offset(intake_path):
+    """Return the durable position dict ('offset', 'inode', 'check', 'generation') for an intake file"""
+    try:
+        with open(offset_path(intake_path)) as f:
+            data = json.load(f)
+        return {'offset': int(data['offset']), 'inode': data.get('inode'),
+                'check': data.get('check'), 'generation': int(data.get('generation', 0))}
+    except (OSError, ValueError, KeyError):
+        return {'offset': 0, 'inode': None, 'check': None, 'generation': 0}
+
+
+def save_offset(intake_path, offset, inode, generation):
+    """Persist the read position atomically (temp file + fsync + rename)"""
+    atomic_write_json(offset_path(intake_path),
+                      {'offset': offset, 'inode': inode, 'check': tail_digest(intake_path, offset),
+                       'generation': generation, 'updated_at': time.strftime("%Y-%m-%d %H:%M:%S")},
+                      indent=None)
+
+
+def tail_digest(intake_path, offset):
+    """SHA-256 of the CHECK_BYTES before offset, or None"""
+    try:
+        with open(intake_path, 'rb') as f:
+            f.seek(max(0, offset - CHECK_BYTES))
+            return hashlib.sha256(f.read(min(offset, CHECK_BYTES))).hexdigest()
+    except OSError:
+        return None
+
+
+def read_position(intake_path):
+    """The saved (offset, inode, generation), restarted at 0 in a new generation
+    if the intake file was rotated or truncated since
+
+    The restart is saved at once, so it is detected only once, and a crash
+    before the next queue write replays the new generation's refs.
+    """
+    saved = load_offset(intake_path)
+    offset, inode, generation = saved['offset'], saved['inode'], saved['generation']
+    try:
+        st = os.stat(intake_path)
+    except OSError:
+        return offset, inode, generation
+
+    reason = None
+    if inode is not None and st.st_ino != inode:
+        reason = 'was replaced'
+    elif st.st_size < offset:
+        reason = f'shrank below offset {offset}'
+    elif saved['check'] is not None and tail_digest(intake_path, offset) != saved['check']:
+        reason = f'was rewritten before offset {offset}'
+    if reason is None:
+        # Offset files written before inodes were recorded adopt the current file
+        return offset, st.st_ino, generation
+
+    print(f"⚠️ {intake_path} {reason}; starting from the beginning")
+    save_offset(intake_path, 0, st.st_ino, generation + 1)
+    return 0, st.st_ino, generation + 1
+
+
+def read_batch(intake_path, offset, limit=BATCH_SIZE):
+    """Read up to `limit` complete lines starting at `offset`
+
+    Returns ([(line_offset, record or None), ...], next_offset). A trailing
+    line without a newline is still being written and is left for later.
+    """
+    if not os.path.exists(intake_path):
+        return [], offset
+
+    lines = []
+    with open(intake_path, 'rb') as f:
+        f.seek(offset)
+        while len(lines) < limit:
+            raw = f.readline()
+            if not raw.endswith(b'\n'):
+                break
+            line_offset, offset = offset, offset + len(raw)
+            if not raw.strip():
+                continue
+            try:
+                lines.append((line_offset, json.loads(raw)))
+            except ValueError as e:
+                print(f"⚠️ Skipping malformed intake line at byte {line_offset}: {e}")
+                lines.append((line_offset, None))
+    return lines, offset
+
+
+def coerce_answer(value):
+    """1 or 0 for a Yes/No answer; raises ValueError for anything else"""
+    if isinstance(value, (bool, int, float)) and value in (0, 1):
+        return int(value)
+    if isinstance(value, str) and value.strip().lower() in ANSWER_WORDS:
+        return ANSWER_WORDS[value.strip().lower()]
+    raise ValueError(f"{value!r} is not a Yes/No answer")
+
+
+def _coerce_answers(record, key, names):
+    value = record.get(key) or {}
+    if not isinstance(value, dict):
+        raise ValueError(f"'{key}' must be an object, not {type(value).__name__}")
+    try:
+        return {name: coerce_answer(answer) for name, answer in value.items() if name in names}
+    except ValueError as e:
+        raise ValueError(f"'{key}': {e}") from None
+
+
+def validate_record(record):
+    """Return a copy of an intake record with its answers coerced to 0/1
+
+    Unknown questions are ignored. Raises ValueError if the record is not an
+    object, has no name or has an answer that is not Yes/No.
+    """
+    if not isinstance(record, dict):
+        raise ValueError(f"expected an object, not {type(record).__name__}")
+    if not isinstance(record.get('name'), str) or not record['name'].strip():
+        raise ValueError("missing 'name'")
+    return dict(record,
+                critical_answers=_coerce_answers(record, 'critical_answers', CRITICAL_QUESTIONS),
+                answers=_coerce_answers(record, 'answers', triage.FEATURES))
+
+
+def classify_records(records):
+    """Triage a list of validated intake records (see validate_record)
+
+    Returns [(diagnosis, priority, score, method, answers)].
+    """
+    results = [None] * len(records)
+    batch_idx, batch_rows = [], []
+
+    for i, record in enumerate(records):
+        critical = record['critical_answers']
+        # bleeding_trauma sets both bleeding and trauma, as on the portal
+        answers = triage.map_critical_answers(critical)
+        if sum(critical.values()) >= 2:
+            results[i] = triage.rapid_triage(answers) + (answers,)
+        else:
+            answers.update(record['answers'])
+            batch_idx.append(i)
+            batch_rows.append([answers[name] for name in triage.FEATURES])
+
+    if batch_rows:
+        diagnosis, priority, score, method = triage.classify_batch(batch_rows)
+        for j, i in enumerate(batch_idx):
+            answers = dict(zip(triage.FEATURES, batch_rows[j]))
+            results[i] = (str(diagnosis[j]), str(priority[j]), int(score[j]), str(method[j]), answers)
+    return results
+
+
+def process_batch(intake_path):
+    """Classify and queue one micro-batch; returns the number of lines consumed"""
+    start, inode, generation = read_position(intake_path)
+    lines, next_offset = read_batch(intake_path, start)
+    if next_offset == start:
+        return 0
+
+    source = f'{os.path.basename(intake_path)}@{inode}.{generation}'
+    valid = []
+    for line_offset, record in lines:
+        if record is None:
+            continue
+        try:
+            valid.append((line_offset, validate_record(record)))
+        except ValueError as e:
+            print(f"⚠️ Skipping invalid intake line at byte {line_offset}: {e}")
+    results = classify_records([rec for _, rec in valid])
+
+    new_entries = []
+    for (line_offset, record), (diagnosis, priority, score, method, answers) in zip(valid, results):
+        intake_ref = f'{source}:{line_offset}'
+        if datastore.seen_intake_ref(intake_ref):
+            continue
+        patient_info = {
+            'name': record['name'],
+            'age': record.get('age', ''),
+            'phone': record.get('phone', ''),
+            'address': record.get('address') or record.get('location', ''),
+            'additional_info': record.get('additional_info') or f'Intake worker - {method}',
+        }
+        entry = datastore.new_queue_entry(patient_info, diagnosis, priority, score,
+                                          triage.differential_diagnosis(answers), method)
+        entry['intake_ref'] = intake_ref
+        new_entries.append(entry)
+
+    # One queue append and one stats write per batch, then advance the offset
+    if new_entries:
+        datastore.enqueue(*new_entries)
+        datastore.increment_stat('calls_today', len(new_entries))
+    save_offset(intake_path, next_offset, inode, generation)
+
+    print(f"Queued {len(new_entries)} of {len(lines)} intake lines (offset {start} → {next_offset})")
+    return len(lines) or 1
+
+
+def run(intake_path=DEFAULT_INTAKE, once=False, poll_interval=POLL_INTERVAL):
+    """Process the intake file until interrupted (or until caught up with once=True)"""
+    while True:
+        consumed = process_batch(intake_path)
+        if consumed:
+            continue
+        if once:
+            return
+        time.sleep(poll_interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless triage worker")
+    parser.add_argument('--intake', default=DEFAULT_INTAKE, help='append-only JSONL intake file')
+    parser.add_argument('--once', action='store_true', help='exit once the intake file is drained')
+    parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL)
+    args = parser.parse_args(argv)
+    try:
+        run(args.intake, once=args.once, poll_interval=args.poll_interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
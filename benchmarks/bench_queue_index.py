@@ -0,0 +1,124 @@
+"""
+Queue id index benchmark.
+
+    python -m benchmarks.bench_queue_index                 # 1k, 10k and 100k entries
+    python -m benchmarks.bench_queue_index --sizes 1000 100000
+
+Builds a JSON queue of each size in a temporary directory and times the
+per-call cost of:
+
+    contains      QueueLog.contains (id index lookup)
+    intake_ref    QueueLog.has_intake_ref (id index lookup)
+    enqueue_dup   enqueueing an id that is already queued (dropped by the index)
+    enqueue_new   enqueueing a new entry (one log append + index update)
+    dispatch      appending a dispatch record (one log append + index delete)
+    scan          the old check: any(entry['id'] == id for entry in load())
+
+The indexed operations should stay flat as the queue grows; scan grows
+linearly. Exits with status 1 if an indexed path's p50 at the largest size
+is more than --max-growth times its p50 at the smallest size.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+from ambulance import ids, queue_log
+from benchmarks.bench_triage import time_calls
+
+INDEXED_PATHS = ('contains', 'intake_ref', 'enqueue_dup', 'enqueue_new', 'dispatch')
+
+
+def make_entry(i):
+    return {
+        'id': ids.next_id(),
+        'name': f'Patient {i}',
+        'age': 30,
+        'location': 'Sitabuldi',
+        'condition': 'Fracture',
+        'priority': random.choice(['HIGH', 'MEDIUM', 'LOW']),
+        'severity_score': random.randint(0, 100),
+        'differential': [],
+        'symptoms': 'benchmark',
+        'time': 'Just now',
+        'phone': '0000000000',
+        'intake_ref': f'bench.jsonl:{i}',
+    }
+
+
+def run_size(size, calls):
+    """Time every path against a fresh queue of `size` entries"""
+    # No group-commit wait for a lone caller, and no background compaction mid-run
+    log = queue_log.QueueLog(commit_window=0, auto_compact=False)
+    entries = [make_entry(i) for i in range(size)]
+    log.replace(entries)
+
+    probe_ids = [random.choice(entries)['id'] for _ in range(calls)]
+    probe_refs = [f'bench.jsonl:{random.randrange(size)}' for _ in range(calls)]
+    dispatch_ids = iter([entry['id'] for entry in random.sample(entries, calls)])
+    new_entries = iter([make_entry(size + i) for i in range(calls)])
+
+    # The old check loads the queue once per call; warm the replay cache first
+    log.load()
+    scan_calls = max(1, min(calls, 20))
+
+    return {
+        'contains': time_calls(log.contains, probe_ids, 1),
+        'intake_ref': time_calls(log.has_intake_ref, probe_refs, 1),
+        'enqueue_dup': time_calls(lambda entry_id: log.append({'op': 'enqueue', 'entry': entries[0]}),
+                                  probe_ids, 1),
+        'enqueue_new': time_calls(lambda _: log.append({'op': 'enqueue', 'entry': next(new_entries)}),
+                                  range(calls), 1),
+        'dispatch': time_calls(lambda _: log.append({'op': 'dispatch', 'id': next(dispatch_ids)}),
+                               range(calls), 1),
+        'scan': time_calls(lambda entry_id: any(e['id'] == entry_id for e in log.load()),
+                           probe_ids[:scan_calls], 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument('--max-growth', type=float, default=3.0,
+                        help='allowed p50 ratio between the largest and smallest size')
+    args = parser.parse_args(argv)
+    random.seed(0)
+
+    cwd = os.getcwd()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            for size in args.sizes:
+                os.makedirs(str(size))
+                os.chdir(str(size))
+                results[size] = run_size(size, args.calls)
+                os.chdir(tmp)
+        finally:
+            os.chdir(cwd)
+
+    print(f"{'size':>8} " + ' '.join(f'{name + " p50 µs":>18}' for name in INDEXED_PATHS + ('scan',)))
+    for size, result in results.items():
+        print(f"{size:>8} " + ' '.join(f"{result[name]['p50_ns'] / 1000:>18.1f}"
+                                        for name in INDEXED_PATHS + ('scan',)))
+
+    smallest, largest = results[min(results)], results[max(results)]
+    failures = [
+        f"{name}: p50 {largest[name]['p50_ns']} ns at {max(results)} entries vs "
+        f"{smallest[name]['p50_ns']} ns at {min(results)}"
+        for name in INDEXED_PATHS
+        if largest[name]['p50_ns'] > smallest[name]['p50_ns'] * args.max_growth
+    ]
+    if failures:
+        print("❌ Indexed paths grew with queue size:")
+        for failure in failures:
+            print(f"   {failure}")
+        return 1
+    print(f"✅ Indexed paths flat within {args.max_growth}x from {min(results)} to {max(results)} entries")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
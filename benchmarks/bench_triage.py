@@ -0,0 +1,219 @@
+"""
+Triage classification benchmark.
+
+    python -m benchmarks.bench_triage                    # run and compare to baseline
+    python -m benchmarks.bench_triage --save-baseline    # run and record a new baseline
+
+Runs every classification path over all 1024 symptom combinations and over
+the rows of balanced_emergency_triage_dataset.csv:
+
+    hybrid        hybrid_classify_and_prioritize (triage table lookup)
+    classify      the uncached rule chain + tree walk + fallback
+    rapid_triage  the rapid-triage critical mapping
+    tree_predict  TreePredictor.predict_one (pure-Python tree walk)
+    sklearn       raw DecisionTreeClassifier.predict on a one-row DataFrame
+                  (skipped when scikit-learn/pandas are not installed)
+    batch         classify_batch over the whole input at once
+
+Reports throughput and p50/p95/p99 per-call latency for each path. When a
+baseline exists, exits with status 1 if any path's p50 or p99 latency grew
+by more than --max-regression (default 25%).
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import sys
+import time
+
+from ambulance import triage
+from ambulance.model_registry import registry
+
+DATASET = 'balanced_emergency_triage_dataset.csv'
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline_triage.json')
+
+# Paths cheaper than this at p50 are too noisy to gate on
+MIN_GATED_NS = 2000
+
+
+def symptom_space():
+    """All 1024 answer vectors as feature rows"""
+    return [[(mask >> bit) & 1 for bit in range(len(triage.FEATURES))] for mask in range(triage.N_MASKS)]
+
+
+def dataset_rows(path=DATASET):
+    """Feature rows from the training CSV (extra/empty columns ignored)"""
+    if not os.path.exists(path):
+        return []
+    with open(path, newline='') as f:
+        return [[int(row[name]) for name in triage.FEATURES] for row in csv.DictReader(f)]
+
+
+def percentile(sorted_values, q):
+    idx = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[idx]
+
+
+def time_calls(fn, inputs, rounds):
+    """Time fn(x) per call; returns a result dict with ns latencies"""
+    samples = []
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for x in inputs:
+            t0 = time.perf_counter_ns()
+            fn(x)
+            samples.append(time.perf_counter_ns() - t0)
+    elapsed = time.perf_counter() - started
+    samples.sort()
+    return {
+        'calls': len(samples),
+        'throughput_per_s': len(samples) / elapsed if elapsed else 0.0,
+        'p50_ns': percentile(samples, 0.50),
+        'p95_ns': percentile(samples, 0.95),
+        'p99_ns': percentile(samples, 0.99),
+    }
+
+
+def time_batch(rows, rounds):
+    """Time classify_batch over the whole input; latency is per batch"""
+    import numpy as np
+
+    X = np.array(rows)
+    samples = []
+    for _ in range(rounds):
+        t0 = time.perf_counter_ns()
+        triage.classify_batch(X)
+        samples.append(time.perf_counter_ns() - t0)
+    samples.sort()
+    total_s = sum(samples) / 1e9
+    return {
+        'calls': len(samples),
+        'rows_per_call': len(rows),
+        'throughput_per_s': len(rows) * len(samples) / total_s if total_s else 0.0,
+        'p50_ns': percentile(samples, 0.50),
+        'p95_ns': percentile(samples, 0.95),
+        'p99_ns': percentile(samples, 0.99),
+    }
+
+
+def sklearn_predict():
+    """Return a one-row predict function for the raw pickle, or None"""
+    try:
+        import joblib
+        import pandas as pd
+    except ImportError:
+        return None
+    path = triage.find_pickle_path()
+    if path is None:
+        return None
+    model = joblib.load(path)
+    # Pad any training-only columns (empty CSV columns) with zeros
+    columns = list(getattr(model, 'feature_names_in_', triage.FEATURES))
+
+    def predict(row):
+        values = dict(zip(triage.FEATURES, row))
+        return model.predict(pd.DataFrame([[values.get(c, 0) for c in columns]], columns=columns))[0]
+    return predict
+
+
+def run(rounds, include_sklearn=True):
+    info = registry.current()
+    predictor = info.table.model
+    paths = {
+        'hybrid': lambda row: triage.hybrid_classify_and_prioritize(dict(zip(triage.FEATURES, row))),
+        'classify': lambda row: triage.classify(dict(zip(triage.FEATURES, row)),
+                                                predictor.predict_one if predictor else None),
+        'rapid_triage': lambda row: triage.rapid_triage(dict(zip(triage.FEATURES, row))),
+    }
+    if predictor is not None:
+        paths['tree_predict'] = predictor.predict_one
+    if include_sklearn:
+        predict = sklearn_predict()
+        if predict is not None:
+            paths['sklearn'] = predict
+
+    inputs = {'symptom_space': symptom_space(), 'dataset': dataset_rows()}
+    results = {}
+    for input_name, rows in inputs.items():
+        if not rows:
+            continue
+        for path_name, fn in paths.items():
+            # sklearn is ~1000x slower; one round is plenty
+            n = 1 if path_name == 'sklearn' else rounds
+            results[f'{input_name}/{path_name}'] = time_calls(fn, rows, n)
+        try:
+            results[f'{input_name}/batch'] = time_batch(rows, rounds)
+        except ImportError:
+            pass
+
+    return {
+        'created_at': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'model_version': info.version,
+        'model_source': info.source,
+        'rounds': rounds,
+        'results': results,
+    }
+
+
+def compare(current, baseline, max_regression):
+    """Return a list of regression messages (empty if none)"""
+    failures = []
+    for name, result in current['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if base is None:
+            continue
+        for metric in ('p50_ns', 'p99_ns'):
+            if base[metric] < MIN_GATED_NS:
+                continue
+            limit = base[metric] * (1 + max_regression)
+            if result[metric] > limit:
+                failures.append(f"{name} {metric}: {result[metric]} ns > {limit:.0f} ns "
+                                f"(baseline {base[metric]} ns)")
+    return failures
+
+
+def print_report(report):
+    print(f"Model {report['model_version']} from {report['model_source']}")
+    print(f"{'path':34} {'calls':>8} {'ops/s':>12} {'p50 µs':>9} {'p95 µs':>9} {'p99 µs':>9}")
+    for name, r in report['results'].items():
+        print(f"{name:34} {r['calls']:>8} {r['throughput_per_s']:>12.0f} "
+              f"{r['p50_ns'] / 1000:>9.2f} {r['p95_ns'] / 1000:>9.2f} {r['p99_ns'] / 1000:>9.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help='allowed fractional p50/p99 latency growth over the baseline')
+    parser.add_argument('--no-sklearn', action='store_true')
+    args = parser.parse_args(argv)
+
+    report = run(args.rounds, include_sklearn=not args.no_sklearn)
+    print_report(report)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline found; run with --save-baseline to create one")
+        return 0
+
+    with open(args.baseline) as f:
+        failures = compare(report, json.load(f), args.max_regression)
+    for failure in failures:
+        print(f"❌ REGRESSION {failure}")
+    if not failures:
+        print(f"✅ No path regressed more than {args.max_regression:.0%} against {args.baseline}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
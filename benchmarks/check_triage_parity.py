@@ -0,0 +1,160 @@
+"""
+Triage parity check against the original patient portal classifier.
+
+    python -m benchmarks.check_triage_parity
+
+reference_classify() is the rule chain, ML phase and fallback score as
+they were written inline in pages/patient.py, and reference_model() loads
+the pickle the same way that page did (joblib plus a one-row DataFrame
+validation predict). Every one of the 1024 symptom masks is classified
+by the reference and by each of the current paths:
+
+    table     hybrid_classify_and_prioritize (precomputed triage table)
+    classify  the uncached rule chain with the registry's predictor
+    batch     classify_batch over all masks at once
+
+Exits with status 1 and prints the first mismatches if any path differs.
+"""
+import sys
+
+from ambulance import triage
+from ambulance.model_registry import registry
+
+SEVERITY_MAP = {
+    'Cardiac Arrest': ('HIGH', 150),
+    'Heart Attack': ('HIGH', 135),
+    'Severe Respiratory Distress': ('HIGH', 130),
+    'Major Trauma/Bleeding': ('HIGH', 125),
+    'Stroke': ('HIGH', 120),
+    'Shock/Collapse': ('MEDIUM', 90),
+    'Seizure/Post-Seizure': ('MEDIUM', 85),
+    'Fainting/Syncope': ('LOW', 50),
+    'Minor Trauma': ('LOW', 45),
+    'Anxiety/Panic': ('LOW', 40)
+}
+
+# Mismatches printed per path before giving up
+MAX_REPORTED = 10
+
+
+def reference_model():
+    """The pickle as the original page loaded it, or None if it failed validation"""
+    try:
+        import joblib
+        import pandas as pd
+    except ImportError:
+        return None
+    path = triage.find_pickle_path()
+    if path is None:
+        return None
+    try:
+        model = joblib.load(path)
+        model.predict(pd.DataFrame([[0] * len(triage.FEATURES)], columns=triage.FEATURES))
+    except Exception:
+        return None
+    return model
+
+
+def reference_classify(answers, model=None):
+    """Returns: (diagnosis, priority, severity_score, method_used)"""
+    a = answers.get
+
+    # ========== PHASE 1: CRITICAL RULE-BASED CONDITIONS ==========
+    if a('unconsciousness', 0) == 1 and a('cyanosis', 0) == 1:
+        return 'Cardiac Arrest', 'HIGH', 150, 'Critical Rule'
+    if a('unconsciousness', 0) == 1:
+        return 'Critical - Unconscious Patient', 'HIGH', 145, 'Critical Rule'
+    if a('shortness_of_breath', 0) == 1 and a('cyanosis', 0) == 1:
+        return 'Severe Respiratory Distress', 'HIGH', 140, 'Critical Rule'
+    if a('chest_pain', 0) == 1 and a('shortness_of_breath', 0) == 1 and a('cyanosis', 0) == 1:
+        return 'Heart Attack (STEMI Suspected)', 'HIGH', 135, 'Critical Rule'
+    if a('trauma', 0) == 1 and a('bleeding', 0) == 1:
+        return 'Major Trauma/Hemorrhage', 'HIGH', 130, 'Critical Rule'
+    if a('chest_pain', 0) == 1 and a('shortness_of_breath', 0) == 1:
+        return 'Heart Attack (Suspected)', 'HIGH', 128, 'Critical Rule'
+    if a('confusion', 0) == 1 and a('weakness', 0) == 1:
+        return 'Stroke (Suspected)', 'HIGH', 125, 'Critical Rule'
+
+    # ========== PHASE 2: ML MODEL ==========
+    if model is not None:
+        import pandas as pd
+        try:
+            features = pd.DataFrame([[a(name, 0) for name in triage.FEATURES]], columns=triage.FEATURES)
+            diagnosis = model.predict(features)[0]
+            priority, severity_score = SEVERITY_MAP.get(diagnosis, ('MEDIUM', 70))
+            return diagnosis, priority, severity_score, 'ML Model'
+        except Exception:
+            pass
+
+    # ========== PHASE 3: FALLBACK RULE-BASED SCORING SYSTEM ==========
+    score = (a('chest_pain', 0) * 35 + a('shortness_of_breath', 0) * 30
+             + a('unconsciousness', 0) * 50 + a('bleeding', 0) * 30
+             + a('confusion', 0) * 25 + a('weakness', 0) * 25 + a('seizure', 0) * 28
+             + a('trauma', 0) * 30 + a('dizziness', 0) * 15 + a('cyanosis', 0) * 40)
+
+    if a('chest_pain', 0) == 1 and a('shortness_of_breath', 0) == 1:
+        diagnosis = 'Heart Attack (Suspected)'
+    elif a('confusion', 0) == 1 and a('weakness', 0) == 1:
+        diagnosis = 'Stroke (Suspected)'
+    elif a('bleeding', 0) == 1 and a('trauma', 0) == 1:
+        diagnosis = 'Major Trauma/Bleeding'
+    elif a('seizure', 0) == 1:
+        diagnosis = 'Seizure/Post-Seizure'
+    elif a('shortness_of_breath', 0) == 1:
+        diagnosis = 'Respiratory Distress'
+    elif a('dizziness', 0) == 1 and a('weakness', 0) == 1:
+        diagnosis = 'Syncope/Collapse'
+    elif score > 0:
+        diagnosis = 'General Medical Emergency'
+    else:
+        diagnosis = 'Non-Emergency Medical Assistance'
+
+    if score >= 120:
+        priority = 'HIGH'
+    elif score >= 60:
+        priority = 'MEDIUM'
+    else:
+        priority = 'LOW'
+
+    return diagnosis, priority, score, 'Rule-Based Fallback'
+
+
+def current_results():
+    """{path name: [result per mask]} for every current classification path"""
+    predictor = registry.current().table.model
+    masks = [triage.answers_from_mask(mask) for mask in range(triage.N_MASKS)]
+    results = {
+        'table': [triage.hybrid_classify_and_prioritize(answers) for answers in masks],
+        'classify': [triage.classify(answers, predictor.predict_one if predictor else None)
+                     for answers in masks],
+    }
+    try:
+        import numpy as np
+    except ImportError:
+        return results
+    X = np.array([[answers[name] for name in triage.FEATURES] for answers in masks])
+    columns = triage.classify_batch(X, predictor)
+    results['batch'] = [(str(d), str(p), int(s), str(m)) for d, p, s, m in zip(*columns)]
+    return results
+
+
+def main():
+    model = reference_model()
+    expected = [reference_classify(triage.answers_from_mask(mask), model) for mask in range(triage.N_MASKS)]
+    print(f"Reference: {'ML model loaded' if model is not None else 'rules only (model rejected)'}")
+
+    failed = False
+    for name, results in current_results().items():
+        mismatches = [mask for mask in range(triage.N_MASKS) if tuple(results[mask]) != tuple(expected[mask])]
+        if not mismatches:
+            print(f"✅ {name}: all {triage.N_MASKS} masks match")
+            continue
+        failed = True
+        print(f"❌ {name}: {len(mismatches)} of {triage.N_MASKS} masks differ")
+        for mask in mismatches[:MAX_REPORTED]:
+            print(f"   mask {mask}: {results[mask]} != {expected[mask]}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
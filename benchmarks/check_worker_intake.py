@@ -0,0 +1,87 @@
+"""
+Intake validation check for the headless triage worker.
+
+    python -m benchmarks.check_worker_intake
+
+Runs one worker batch in a temporary directory over an intake file that
+mixes valid requests with lines the worker must skip: malformed JSON, a
+missing name, a non-Yes/No answer, and "answers" given as a list. Checks
+that the valid requests are queued with their answers coerced to 0/1,
+that the bad lines are skipped rather than failing the batch, and that
+the offset moves past all of them so a restart does not retry the batch.
+
+Exits with status 1 and prints the failed checks if any.
+"""
+import json
+import os
+import sys
+import tempfile
+
+from ambulance import counters, datastore, metrics, worker
+
+GOOD = [
+    {'name': 'Asha', 'address': 'Sitabuldi', 'answers': {'chest_pain': 'yes', 'shortness_of_breath': True}},
+    {'name': 'Ravi', 'address': 'Nandanvan', 'critical_answers': {'unconsciousness': '1', 'bleeding_trauma': 'Yes'}},
+    {'name': 'Meena', 'address': 'Besa', 'answers': {'dizziness': 1, 'weakness': 1.0, 'seizure': 'no'}},
+]
+BAD = [
+    '{"name": "Torn", "answers": {',
+    {'address': 'Sadar', 'answers': {'chest_pain': 1}},
+    {'name': 'Kiran', 'critical_answers': {'unconsciousness': 'yes', 'shortness_of_breath': 'maybe'}},
+    {'name': 'Sunil', 'answers': {'chest_pain': 2}},
+    {'name': 'Priya', 'answers': ['chest_pain']},
+]
+
+
+def write_intake(path):
+    lines = [GOOD[0], BAD[0], BAD[1], GOOD[1], BAD[2], BAD[3], BAD[4], GOOD[2]]
+    with open(path, 'w') as f:
+        for line in lines:
+            f.write((line if isinstance(line, str) else json.dumps(line)) + '\n')
+    return os.path.getsize(path)
+
+
+def main():
+    failures = []
+
+    def check(ok, message):
+        print(f"{'✅' if ok else '❌'} {message}")
+        if not ok:
+            failures.append(message)
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        intake = os.path.join(directory, 'intake.jsonl')
+        size = write_intake(intake)
+
+        try:
+            consumed = worker.process_batch(intake)
+        except Exception as e:
+            check(False, f"process_batch raised {type(e).__name__}: {e}")
+            return 1
+
+        check(consumed == len(GOOD) + len(BAD), f"all {len(GOOD) + len(BAD)} lines consumed ({consumed})")
+        check(worker.load_offset(intake)['offset'] == size, "offset saved past the bad lines")
+
+        queued = {entry['name']: entry for entry in datastore.load_queue()}
+        check(sorted(queued) == sorted(record['name'] for record in GOOD),
+              f"only the valid requests are queued ({sorted(queued)})")
+        if 'Asha' in queued:
+            check(queued['Asha']['condition'] == 'Heart Attack (Suspected)',
+                  "'yes' and true answers count as Yes")
+        if 'Ravi' in queued:
+            check(queued['Ravi']['priority'] == 'HIGH', "string critical answers trigger rapid triage")
+        if 'Meena' in queued:
+            check(queued['Meena']['condition'] == 'Syncope/Collapse', "1.0 counts as Yes and 'no' as No")
+
+        check(worker.process_batch(intake) == 0, "a second run has nothing left to read")
+
+        # Write pending shards while the temporary directory still exists
+        counters.flush()
+        metrics.flush()
+        metrics.reset()
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
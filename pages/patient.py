@@ -1,11 +1,7 @@
 import streamlit as st
-import json
 from datetime import datetime
-import os
-import pickle
-import numpy as np
-import joblib
-import pandas as pd  # <-- 1. IMPORT PANDAS
+from ambulance import datastore, triage
+from ambulance.model_registry import registry
 
 # Page configuration
 st.set_page_config(
@@ -15,61 +11,10 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# Load ML Model with better error handling
-MODEL_LOADED = False
-model = None
-
-# --- 2. UPDATED VALIDATION TEST TO USE A DATAFRAME ---
-def load_model():
-    """Try to load the ML model from multiple possible locations with compatibility fixes"""
-    global model, MODEL_LOADED
-    
-    possible_paths = [
-        'emergency_triage_model.pkl',
-        './emergency_triage_model.pkl',
-        '../emergency_triage_model.pkl',
-        'models/emergency_triage_model.pkl',
-    ]
-    
-    for path in possible_paths:
-        if not os.path.exists(path):
-            continue
-            
-        try:
-            # Use joblib.load() since the model was saved with joblib.dump()
-            model = joblib.load(path)
-            MODEL_LOADED = True
-            print(f"✅ Model loaded successfully from: {path} (using joblib)")
-            
-            # Quick validation test
-            try:
-                # --- START OF FIX ---
-                # Model expects a Pandas DataFrame with feature names, not a numpy array.
-                test_data = [[0, 0, 0, 0, 0, 0, 0, 0, 0, 0]]
-                test_cols = ['chest_pain', 'shortness_of_breath', 'unconsciousness', 'bleeding', 
-                               'confusion', 'weakness', 'seizure', 'trauma', 'dizziness', 'cyanosis']
-                test_df = pd.DataFrame(test_data, columns=test_cols)
-                _ = model.predict(test_df)
-                # --- END OF FIX ---
-                
-                print("✅ Model validation passed")
-                return True
-            except Exception as e:
-                print(f"⚠️ Model loaded but validation failed: {e}")
-                print("   (This is likely due to the model expecting a DataFrame with feature names)")
-                MODEL_LOADED = False
-                model = None
-                continue
-                
-        except Exception as e:
-            print(f"Failed to load from {path} using joblib: {e}")
-            continue
-    
-    print("⚠️ ML Model not found or incompatible. Using rule-based fallback system.")
-    return False
-
-# Try to load model on startup
-load_model()
+# Triage model is loaded once per process and shared across sessions;
+# this only re-checks the model file and hot-reloads it if it changed
+model_info = registry.current()
+MODEL_LOADED = model_info.table.model_loaded
 
 def get_model_status_message():
     """Return a formatted message about model status"""
@@ -78,209 +23,39 @@ def get_model_status_message():
     else:
         return "⚠️ ML Model: **Unavailable** - Using rule-based system (still highly accurate)"
 
-# File paths for shared data
-QUEUE_FILE = "emergency_queue.json"
-STATS_FILE = "system_stats.json"
+def get_model_details_message():
+    """Return model version and load timing for the status caption"""
+    if not MODEL_LOADED:
+        return "ML model not found or incompatible"
+    return (f"Model version {model_info.version} from {model_info.source} · "
+            f"loaded in {model_info.load_seconds * 1000:.1f} ms at {model_info.loaded_at}")
 
-def load_queue():
-    """Load queue from file"""
+# Shared data files live in ambulance/datastore.py
+def enqueue_request(request):
+    """Append a new request to the queue log"""
     try:
-        if os.path.exists(QUEUE_FILE):
-            with open(QUEUE_FILE, 'r') as f:
-                return json.load(f)
-        return []
-    except:
-        return []
-
-def save_queue(queue):
-    """Save queue to file with deduplication"""
-    try:
-        seen = set()
-        unique_queue = []
-        for entry in queue:
-            entry_id = entry.get("id")
-            if entry_id and entry_id not in seen:
-                unique_queue.append(entry)
-                seen.add(entry_id)
-        
-        with open(QUEUE_FILE, 'w') as f:
-            json.dump(unique_queue, f, indent=2)
+        datastore.enqueue(request)
         return True
     except Exception as e:
         st.error(f"Error saving queue: {e}")
         return False
 
-def load_stats():
-    """Load stats from file"""
+def record_call():
+    """Count a submitted request in calls_today"""
     try:
-        if os.path.exists(STATS_FILE):
-            with open(STATS_FILE, 'r') as f:
-                return json.load(f)
-        return {
-            'calls_today': 0,
-            'dispatched': 0,
-            'avg_response': 8.5,
-            'success_rate': 95
-        }
-    except:
-        return {
-            'calls_today': 0,
-            'dispatched': 0,
-            'avg_response': 8.5,
-            'success_rate': 95
-        }
-
-def save_stats(stats):
-    """Save stats to file"""
-    try:
-        with open(STATS_FILE, 'w') as f:
-            json.dump(stats, f, indent=2)
+        datastore.increment_stat('calls_today')
     except Exception as e:
         st.error(f"Error saving stats: {e}")
 
 
-# --- 3. UPDATED PREDICTION TO USE A DATAFRAME & REVERTED TO STRING MAP ---
 def hybrid_classify_and_prioritize(answers):
     """
     Hybrid ML + Rule-based emergency classification
-    
-    PRIORITY ORDER:
-    1. Critical life-threatening rules (INSTANT response - no ML delay)
-    2. ML Model prediction (for complex pattern recognition)
-    3. Fallback scoring system (if ML unavailable)
-    
+
+    Served from the precompiled triage table (see ambulance/triage.py).
     Returns: (diagnosis, priority, severity_score, method_used)
     """
-    
-    # ========== PHASE 1: CRITICAL RULE-BASED CONDITIONS (INSTANT RESPONSE) ==========
-    # These bypass ML for speed - life-threatening conditions need immediate classification
-    
-    # RULE 1: Unconscious + Cyanosis = Cardiac Arrest (HIGHEST PRIORITY)
-    if answers.get('unconsciousness', 0) == 1 and answers.get('cyanosis', 0) == 1:
-        return 'Cardiac Arrest', 'HIGH', 150, 'Critical Rule'
-    
-    # RULE 2: Unconscious alone = Critical (brain injury, stroke, cardiac event)
-    if answers.get('unconsciousness', 0) == 1:
-        return 'Critical - Unconscious Patient', 'HIGH', 145, 'Critical Rule'
-    
-    # RULE 3: Severe Respiratory Distress + Cyanosis (suffocation, cardiac/respiratory failure)
-    if answers.get('shortness_of_breath', 0) == 1 and answers.get('cyanosis', 0) == 1:
-        return 'Severe Respiratory Distress', 'HIGH', 140, 'Critical Rule'
-    
-    # RULE 4: Triple cardiac symptoms (Chest pain + Breathing difficulty + Cyanosis)
-    if (answers.get('chest_pain', 0) == 1 and 
-        answers.get('shortness_of_breath', 0) == 1 and 
-        answers.get('cyanosis', 0) == 1):
-        return 'Heart Attack (STEMI Suspected)', 'HIGH', 135, 'Critical Rule'
-    
-    # RULE 5: Major Trauma with Bleeding (hypovolemic shock risk)
-    if answers.get('trauma', 0) == 1 and answers.get('bleeding', 0) == 1:
-        return 'Major Trauma/Hemorrhage', 'HIGH', 130, 'Critical Rule'
-    
-    # RULE 6: Chest Pain + Shortness of Breath (cardiac event without cyanosis yet)
-    if answers.get('chest_pain', 0) == 1 and answers.get('shortness_of_breath', 0) == 1:
-        return 'Heart Attack (Suspected)', 'HIGH', 128, 'Critical Rule'
-    
-    # RULE 7: Stroke symptoms (Confusion + One-sided Weakness)
-    if answers.get('confusion', 0) == 1 and answers.get('weakness', 0) == 1:
-        return 'Stroke (Suspected)', 'HIGH', 125, 'Critical Rule'
-    
-    # ========== PHASE 2: USE ML MODEL FOR COMPLEX PATTERN RECOGNITION ==========
-    # ML is better at detecting subtle combinations and non-obvious patterns
-    
-    if MODEL_LOADED and model is not None:
-        try:
-            # Prepare features in the EXACT order the model was trained on
-            features = [
-                answers.get('chest_pain', 0),
-                answers.get('shortness_of_breath', 0),
-                answers.get('unconsciousness', 0),
-                answers.get('bleeding', 0),
-                answers.get('confusion', 0),
-                answers.get('weakness', 0),
-                answers.get('seizure', 0),
-                answers.get('trauma', 0),
-                answers.get('dizziness', 0),
-                answers.get('cyanosis', 0)
-            ]
-            
-            # --- START OF FIX ---
-            # Create a DataFrame with the correct column names for prediction
-            feature_cols = ['chest_pain', 'shortness_of_breath', 'unconsciousness', 'bleeding', 
-                           'confusion', 'weakness', 'seizure', 'trauma', 'dizziness', 'cyanosis']
-            feature_df = pd.DataFrame([features], columns=feature_cols)
-            # --- END OF FIX ---
-            
-            
-            # Get ML prediction (will be a string like "Heart Attack")
-            diagnosis = model.predict(feature_df)[0]
-            
-            # Map ML diagnosis to priority and severity score (String-based map)
-            # This is the original map, which is correct for your model.
-            severity_map = {
-                'Cardiac Arrest': ('HIGH', 150),
-                'Heart Attack': ('HIGH', 135),
-                'Severe Respiratory Distress': ('HIGH', 130),
-                'Major Trauma/Bleeding': ('HIGH', 125),
-                'Stroke': ('HIGH', 120),
-                'Shock/Collapse': ('MEDIUM', 90),
-                'Seizure/Post-Seizure': ('MEDIUM', 85),
-                'Fainting/Syncope': ('LOW', 50),
-                'Minor Trauma': ('LOW', 45),
-                'Anxiety/Panic': ('LOW', 40)
-            }
-            
-            priority, severity_score = severity_map.get(diagnosis, ('MEDIUM', 70))
-            
-            return diagnosis, priority, severity_score, 'ML Model'
-            
-        except Exception as e:
-            # If ML fails, fall through to rule-based scoring
-            print(f"⚠️ ML prediction failed: {e}. Using fallback scoring.")
-    
-    # ========== PHASE 3: FALLBACK RULE-BASED SCORING SYSTEM ==========
-    # Used when ML model is unavailable or fails
-    
-    # Calculate weighted severity score
-    score = 0
-    score += answers.get('chest_pain', 0) * 35        # Cardiac indicator
-    score += answers.get('shortness_of_breath', 0) * 30  # Respiratory/cardiac
-    score += answers.get('unconsciousness', 0) * 50   # Critical brain/cardiac
-    score += answers.get('bleeding', 0) * 30          # Hemorrhage risk
-    score += answers.get('confusion', 0) * 25         # Neurological/stroke
-    score += answers.get('weakness', 0) * 25          # Stroke/cardiac
-    score += answers.get('seizure', 0) * 28           # Neurological emergency
-    score += answers.get('trauma', 0) * 30            # Injury severity
-    score += answers.get('dizziness', 0) * 15         # General instability
-    score += answers.get('cyanosis', 0) * 40          # Oxygen deprivation
-    
-    # Determine diagnosis from symptom patterns
-    if answers.get('chest_pain', 0) == 1 and answers.get('shortness_of_breath', 0) == 1:
-        diagnosis = 'Heart Attack (Suspected)'
-    elif answers.get('confusion', 0) == 1 and answers.get('weakness', 0) == 1:
-        diagnosis = 'Stroke (Suspected)'
-    elif answers.get('bleeding', 0) == 1 and answers.get('trauma', 0) == 1:
-        diagnosis = 'Major Trauma/Bleeding'
-    elif answers.get('seizure', 0) == 1:
-        diagnosis = 'Seizure/Post-Seizure'
-    elif answers.get('shortness_of_breath', 0) == 1:
-        diagnosis = 'Respiratory Distress'
-    elif answers.get('dizziness', 0) == 1 and answers.get('weakness', 0) == 1:
-        diagnosis = 'Syncope/Collapse'
-    elif score > 0:
-        diagnosis = 'General Medical Emergency'
-    else:
-        diagnosis = 'Non-Emergency Medical Assistance'
-    
-    # Determine priority based on score
-    if score >= 120:
-        priority = 'HIGH'
-    elif score >= 60:
-        priority = 'MEDIUM'
-    else:
-        priority = 'LOW'
-    
-    return diagnosis, priority, score, 'Rule-Based Fallback'
+    return triage.hybrid_classify_and_prioritize(answers)
 
 # Custom CSS with GREEN THEME
 st.markdown("""
@@ -557,6 +332,7 @@ if st.session_state.request_step == 'home':
         st.markdown(f"<p class='success-message'>{status_msg}</p>", unsafe_allow_html=True)
     else:
         st.markdown(f"<p class='info-message'>{status_msg}</p>", unsafe_allow_html=True)
+    st.caption(get_model_details_message())
     
     col1, col2, col3 = st.columns(3)
     
@@ -672,44 +448,8 @@ elif st.session_state.request_step == 'critical_questions':
                     st.session_state.is_critical_case = True
                     
                     # Map critical answers to questionnaire format
-                    # bleeding_trauma maps to both bleeding and trauma
-                    mapped_answers = {}
-                    if 'unconsciousness' in critical_answers:
-                        mapped_answers['unconsciousness'] = critical_answers['unconsciousness']
-                    if 'shortness_of_breath' in critical_answers:
-                        mapped_answers['shortness_of_breath'] = critical_answers['shortness_of_breath']
-                    if 'bleeding_trauma' in critical_answers:
-                        # Combined question: if Yes, set both bleeding and trauma to 1
-                        mapped_answers['bleeding'] = critical_answers['bleeding_trauma']
-                        mapped_answers['trauma'] = critical_answers['bleeding_trauma']
-                    
-                    # Determine diagnosis based on critical answers
-                    if mapped_answers.get('unconsciousness', 0) == 1:
-                        if mapped_answers.get('bleeding', 0) == 1 or mapped_answers.get('trauma', 0) == 1:
-                            diagnosis = 'Critical - Unconscious with Trauma/Bleeding'
-                            severity_score = 150
-                        else:
-                            diagnosis = 'Critical - Unconscious Patient'
-                            severity_score = 145
-                    elif mapped_answers.get('shortness_of_breath', 0) == 1:
-                        if mapped_answers.get('bleeding', 0) == 1 or mapped_answers.get('trauma', 0) == 1:
-                            diagnosis = 'Severe Respiratory Distress with Trauma'
-                            severity_score = 145
-                        else:
-                            diagnosis = 'Severe Respiratory Distress'
-                            severity_score = 140
-                    elif mapped_answers.get('bleeding', 0) == 1 or mapped_answers.get('trauma', 0) == 1:
-                        diagnosis = 'Major Trauma/Bleeding'
-                        severity_score = 135
-                    else:
-                        diagnosis = 'Critical Emergency - Multiple Critical Symptoms'
-                        severity_score = 135
-                    
-                    # Set all answers (mapped critical + default others to 0 for consistency)
-                    full_answers = mapped_answers.copy()
-                    for key in questionnaire.keys():
-                        if key not in full_answers:
-                            full_answers[key] = 0
+                    # (bleeding_trauma maps to both bleeding and trauma; others default to 0)
+                    full_answers = triage.map_critical_answers(critical_answers)
                     
                     st.session_state.questionnaire_answers = full_answers
                     st.session_state.patient_info['additional_info'] = 'CRITICAL CASE - Rapid triage triggered'
@@ -726,15 +466,11 @@ elif st.session_state.request_step == 'questionnaire':
     st.markdown("<p class='info-message'>✅ Critical triage complete. Please answer the remaining questions. Our ML model uses this data for diagnosis.</p>", unsafe_allow_html=True)
     
     # Start with critical answers already collected, mapped to questionnaire format
-    answers = {}
-    if 'unconsciousness' in st.session_state.critical_answers:
-        answers['unconsciousness'] = st.session_state.critical_answers['unconsciousness']
-    if 'shortness_of_breath' in st.session_state.critical_answers:
-        answers['shortness_of_breath'] = st.session_state.critical_answers['shortness_of_breath']
+    answers = triage.map_critical_answers(st.session_state.critical_answers)
     # Note: bleeding_trauma is a combined question for critical triage
     # If it was "Yes", we would have skipped this step (critical case)
-    # If it was "No", we don't pre-fill bleeding/trauma because user might have minor cases
-    # that don't qualify as "active bleeding or major visible trauma"
+    # If it was "No", bleeding and trauma are still asked separately below, because user might
+    # have minor cases that don't qualify as "active bleeding or major visible trauma"
     
     with st.form("questionnaire_form"):
         # Show remaining questions (excluding critical ones already answered)
@@ -784,31 +520,9 @@ elif st.session_state.request_step == 'result':
     # Check if this is a critical case (rapid triage)
     if st.session_state.is_critical_case:
         # Critical case: Determine diagnosis from critical answers
-        answers = st.session_state.questionnaire_answers
-        priority = 'HIGH'
-        
-        if answers.get('unconsciousness', 0) == 1:
-            if answers.get('bleeding', 0) == 1 or answers.get('trauma', 0) == 1:
-                diagnosis = 'Critical - Unconscious with Trauma/Bleeding'
-                severity_score = 150
-            else:
-                diagnosis = 'Critical - Unconscious Patient'
-                severity_score = 145
-        elif answers.get('shortness_of_breath', 0) == 1:
-            if answers.get('bleeding', 0) == 1 or answers.get('trauma', 0) == 1:
-                diagnosis = 'Severe Respiratory Distress with Trauma'
-                severity_score = 145
-            else:
-                diagnosis = 'Severe Respiratory Distress'
-                severity_score = 140
-        elif answers.get('bleeding', 0) == 1 or answers.get('trauma', 0) == 1:
-            diagnosis = 'Major Trauma/Bleeding'
-            severity_score = 135
-        else:
-            diagnosis = 'Critical Emergency - Multiple Critical Symptoms'
-            severity_score = 135
-        
-        method_used = 'Rapid Triage (Critical Rule)'
+        diagnosis, priority, severity_score, method_used = triage.rapid_triage(
+            st.session_state.questionnaire_answers
+        )
     else:
         # Use hybrid ML classification for non-critical cases
         with st.spinner("🤖 AI analyzing symptoms..."):
@@ -816,6 +530,15 @@ elif st.session_state.request_step == 'result':
                 st.session_state.questionnaire_answers
             )
     
+    # Top-k differential from the model's leaf class distribution (precomputed per symptom mask),
+    # shown only when the model made the diagnosis rather than a critical rule or the fallback score
+    differential = []
+    if method_used == 'ML Model':
+        differential = triage.differential_diagnosis(st.session_state.questionnaire_answers)
+    differential_html = ''
+    if differential:
+        differential_html = f"<p><strong>Model Differential:</strong> {triage.format_differential(differential)}</p>"
+    
     # Determine action message
     if priority == 'HIGH':
         action = 'Immediate ambulance dispatch - Life threatening'
@@ -826,31 +549,13 @@ elif st.session_state.request_step == 'result':
     
     # Add to queue once
     if not st.session_state.request_submitted:
-        current_queue = load_queue()
-        current_stats = load_stats()
-        
-        new_request = {
-            'id': abs(hash(str(st.session_state.patient_info) + str(datetime.now()))),
-            'name': st.session_state.patient_info['name'],
-            'age': st.session_state.patient_info['age'],
-            'location': st.session_state.patient_info['address'],
-            'condition': diagnosis,
-            'priority': priority,
-            'severity_score': severity_score,
-            'symptoms': st.session_state.patient_info.get('additional_info', 'AI-assessed symptoms'),
-            'time': 'Just now',
-            'phone': st.session_state.patient_info['phone']
-        }
+        new_request = datastore.new_queue_entry(
+            st.session_state.patient_info, diagnosis, priority, severity_score, differential, method_used
+        )
         
-        request_id = new_request['id']
-        existing_ids = {req.get('id') for req in current_queue}
-        
-        if request_id not in existing_ids:
-            current_queue.append(new_request)
-            save_queue(current_queue)
-            
-            current_stats['calls_today'] += 1
-            save_stats(current_stats)
+        # One appended log line instead of rewriting the whole queue
+        if enqueue_request(new_request):
+            record_call()
         
         st.session_state.request_submitted = True
     
@@ -906,7 +611,7 @@ elif st.session_state.request_step == 'result':
         st.markdown(f"""
             <div class='result-box'>
                 <h3>🏥 AI Diagnosis</h3>
-                <p><strong>Condition:</strong> {diagnosis}</p>
+                <p><strong>Condition:</strong> {diagnosis}</p>{differential_html}
                 <p><strong>Priority Level:</strong> {priority}</p>
                 <p><strong>Recommended Action:</strong> {action}</p>
             </div>
@@ -1,8 +1,10 @@
 import streamlit as st
-import json
+import pandas as pd
 from datetime import datetime
 import time
-import os
+from ambulance import datastore, timeseries
+from ambulance.shards import ZONE_NAMES
+from ambulance.triage import format_differential
 
 # Page configuration
 st.set_page_config(
@@ -19,90 +21,58 @@ from streamlit_autorefresh import st_autorefresh
 st_autorefresh(interval=5000, key="auto_refresh_tech")
 
 
-# File paths for shared data
-QUEUE_FILE = "emergency_queue.json"
-STATS_FILE = "system_stats.json"
-FLEET_FILE = "fleet_status.json"
+# Queue and fleet trends are sampled once a second by one thread per server process
+timeseries.store.start()
 
-def load_queue():
-    """Load queue from file"""
-    try:
-        if os.path.exists(QUEUE_FILE):
-            with open(QUEUE_FILE, 'r') as f:
-                return json.load(f)
-        return []
-    except:
-        return []
-
-def save_queue(queue):
-    """Save queue to file without duplicates"""
+# Shared data files live in ambulance/datastore.py
+load_queue = datastore.load_queue
+load_stats = datastore.load_stats
+load_fleet_status = datastore.load_fleet_status
+load_fleet = datastore.load_fleet
+
+def dispatch_patient(request_id):
+    """Dequeue the request, count it and send an ambulance in one step"""
     try:
-        seen = set()
-        unique_queue = []
-        for entry in queue:
-            entry_id = entry.get("id") or entry.get("name")
-            if entry_id not in seen:
-                unique_queue.append(entry)
-                seen.add(entry_id)
-
-        with open(QUEUE_FILE, 'w') as f:
-            json.dump(unique_queue, f, indent=2)
+        return datastore.dispatch_patient(request_id)
     except Exception as e:
-        st.error(f"Error saving queue: {e}")
+        st.error(f"Error dispatching: {e}")
+        return False
 
-def load_stats():
-    """Load stats from file"""
+def complete_mission():
+    """Bring an en-route ambulance back and record the mission"""
     try:
-        if os.path.exists(STATS_FILE):
-            with open(STATS_FILE, 'r') as f:
-                return json.load(f)
-        return {
-            'calls_today': 0,
-            'dispatched': 0,
-            'avg_response': 8.5,
-            'success_rate': 95
-        }
-    except:
-        return {
-            'calls_today': 0,
-            'dispatched': 0,
-            'avg_response': 8.5,
-            'success_rate': 95
-        }
-
-def save_stats(stats):
-    """Save stats to file"""
+        return datastore.complete_mission()
+    except Exception as e:
+        st.error(f"Error saving fleet status: {e}")
+        return False
+
+def advance_unit(unit_id):
+    """Move one ambulance to the next step of its mission"""
     try:
-        with open(STATS_FILE, 'w') as f:
-            json.dump(stats, f, indent=2)
+        return datastore.advance_unit(unit_id)
     except Exception as e:
-        st.error(f"Error saving stats: {e}")
+        st.error(f"Error updating {unit_id}: {e}")
+        return False
+
+def format_minutes(value):
+    """Minutes for a stat card, or a dash before the first dispatch today"""
+    return f"{value:.1f}m" if value is not None else "—"
+
+def format_percent(value):
+    return f"{value}%" if value is not None else "—"
 
-def load_fleet_status():
-    """Load fleet status from file"""
+def move_units(source, target):
+    """Move one ambulance between fleet states"""
     try:
-        if os.path.exists(FLEET_FILE):
-            with open(FLEET_FILE, 'r') as f:
-                return json.load(f)
-        return {
-            'total': 10,
-            'available': 8,
-            'en_route': 0,
-            'maintenance': 2
-        }
-    except:
-        return {
-            'total': 10,
-            'available': 8,
-            'en_route': 0,
-            'maintenance': 2
-        }
-
-def save_fleet_status(fleet):
-    """Save fleet status to file"""
+        return datastore.move_units(source, target)
+    except Exception as e:
+        st.error(f"Error saving fleet status: {e}")
+        return False
+
+def reset_fleet():
+    """Restore the default fleet counts"""
     try:
-        with open(FLEET_FILE, 'w') as f:
-            json.dump(fleet, f, indent=2)
+        datastore.reset_fleet()
     except Exception as e:
         st.error(f"Error saving fleet status: {e}")
 
@@ -347,7 +317,8 @@ if 'user_type' not in st.session_state or st.session_state.user_type != "technic
 
 # Load data from files - Always load queue fresh (not cached in session state)
 # Queue should always reflect the latest file contents
-current_queue = load_queue()
+# Only the subscribed zones' queue shards are read (all zones when none are picked)
+current_queue = load_queue(st.session_state.get('zones') or None)
 stats_from_file = load_stats()
 fleet_from_file = load_fleet_status()
 
@@ -403,8 +374,8 @@ with col3:
     st.markdown(f"""
         <div class='stat-card'>
             <div style='font-size: 2rem; margin-bottom: 0.5rem;'>⏱️</div>
-            <div class='stat-value'>{st.session_state.stats_data['avg_response']:.1f}m</div>
-            <div class='stat-label'>Avg. Response</div>
+            <div class='stat-value'>{format_minutes(st.session_state.stats_data['avg_response'])}</div>
+            <div class='stat-label'>Avg. Response · p90 {format_minutes(st.session_state.stats_data['response_p90'])}</div>
         </div>
     """, unsafe_allow_html=True)
 
@@ -412,13 +383,17 @@ with col4:
     st.markdown(f"""
         <div class='stat-card'>
             <div style='font-size: 2rem; margin-bottom: 0.5rem;'>💓</div>
-            <div class='stat-value'>{st.session_state.stats_data['success_rate']}%</div>
+            <div class='stat-value'>{format_percent(st.session_state.stats_data['success_rate'])}</div>
             <div class='stat-label'>Success Rate</div>
         </div>
     """, unsafe_allow_html=True)
 
 st.markdown("<hr>", unsafe_allow_html=True)
 
+# Zone subscription - changing it reruns the page with the new shards
+st.multiselect("📍 Zones", ZONE_NAMES, key="zones",
+               placeholder="All zones", format_func=str.title)
+
 # Always use fresh queue data from file (not session state)
 # Display queue
 if len(current_queue) == 0:
@@ -428,13 +403,13 @@ if len(current_queue) == 0:
         </div>
     """, unsafe_allow_html=True)
 else:
-    # Sort by priority and severity
-    priority_order = {'HIGH': 0, 'MEDIUM': 1, 'LOW': 2}
-    sorted_queue = sorted(current_queue, 
-                         key=lambda x: (priority_order[x['priority']], -x['severity_score']))
-    
-    for idx, patient in enumerate(sorted_queue):
+    # load_queue already returns dispatch order (priority, severity, arrival)
+    for idx, patient in enumerate(current_queue):
         priority_class = f"priority-{patient['priority'].lower()}"
+        differential = patient.get('differential') or []
+        differential_html = ''
+        if differential:
+            differential_html = f" <span style='color: #6b7280;'>(Model differential: {format_differential(differential)})</span>"
         
         with st.container():
             col1, col2 = st.columns([5, 1])
@@ -446,9 +421,9 @@ else:
                             <span class='priority-indicator {priority_class}'></span>
                             #{idx + 1} - {patient['name']} ({patient['age']} years old)
                         </div>
-                        <div class='queue-detail'><strong>Condition:</strong> {patient['condition']}</div>
+                        <div class='queue-detail'><strong>Condition:</strong> {patient['condition']}{differential_html}</div>
                         <div class='queue-detail'><strong>Symptoms:</strong> {patient['symptoms']}</div>
-                        <div class='queue-detail'><strong>Location:</strong> {patient['location']}</div>
+                        <div class='queue-detail'><strong>Location:</strong> {patient['location']} ({patient.get('zone', 'unassigned').title()})</div>
                         <div class='queue-detail'>
                             <strong>Priority:</strong> {patient['priority']} | 
                             <strong>Severity Score:</strong> {patient['severity_score']} | 
@@ -462,23 +437,13 @@ else:
                 # Check if ambulances are available
                 if st.session_state.fleet_status['available'] > 0:
                     if st.button(f"🚑 Dispatch", key=f"dispatch_{patient['id']}", type="primary", use_container_width=True):
-                        st.success(f"✅ Ambulance dispatched to {patient['name']}!")
-                        st.balloons()
-                        
-                        # Update stats
-                        st.session_state.stats_data['dispatched'] += 1
-                        save_stats(st.session_state.stats_data)
-                        
-                        # Update fleet status
-                        st.session_state.fleet_status['available'] -= 1
-                        st.session_state.fleet_status['en_route'] += 1
-                        save_fleet_status(st.session_state.fleet_status)
-                        
-                        # Remove from queue - reload fresh queue, remove the dispatched one, and save
-                        updated_queue = load_queue()
-                        updated_queue = [p for p in updated_queue if p['id'] != patient['id']]
-                        save_queue(updated_queue)
-                        st.rerun()
+                        # Dequeue, dispatched += 1 and available -> en_route together
+                        if dispatch_patient(patient['id']):
+                            st.success(f"✅ Ambulance dispatched to {patient['name']}!")
+                            st.balloons()
+                            st.rerun()
+                        else:
+                            st.warning(f"⚠️ {patient['name']} was already dispatched or no ambulance is free")
                 else:
                     st.button(f"⚠️ No Ambulances", key=f"no_amb_{patient['id']}", disabled=True, use_container_width=True)
 
@@ -501,8 +466,11 @@ with col2:
     st.markdown(f"""
         <div class='fleet-card'>
             <div style='font-size: 2.5rem; margin-bottom: 0.5rem;'>🚑</div>
-            <div style='font-size: 2.5rem; font-weight: 700; color: #f59e0b;'>{st.session_state.fleet_status['en_route']}</div>
-            <div style='color: #374151; font-weight: 600; margin-top: 0.5rem;'>En Route</div>
+            <div style='font-size: 2.5rem; font-weight: 700; color: #f59e0b;'>{st.session_state.fleet_status['on_mission']}</div>
+            <div style='color: #374151; font-weight: 600; margin-top: 0.5rem;'>On Mission</div>
+            <div style='color: #6b7280; font-size: 0.85rem;'>
+                {st.session_state.fleet_status['en_route']} en route · {st.session_state.fleet_status['on_scene']} on scene · {st.session_state.fleet_status['returning']} returning
+            </div>
         </div>
     """, unsafe_allow_html=True)
 
@@ -535,31 +503,61 @@ col1, col2, col3 = st.columns(3)
 
 with col1:
     if st.button("🔄 Reset Fleet Status", key="reset_fleet_unique", use_container_width=True):
-        st.session_state.fleet_status = {
-            'total': 10,
-            'available': 8,
-            'en_route': 0,
-            'maintenance': 2
-        }
-        save_fleet_status(st.session_state.fleet_status)
+        reset_fleet()
+        st.session_state.fleet_status = load_fleet_status()
         st.session_state.fleet_action_taken = True
 
 with col2:
-    if st.button("✅ Complete En Route Mission", key="complete_mission_unique", use_container_width=True):
-        if st.session_state.fleet_status['en_route'] > 0:
-            st.session_state.fleet_status['en_route'] -= 1
-            st.session_state.fleet_status['available'] += 1
-            save_fleet_status(st.session_state.fleet_status)
+    if st.button("✅ Complete Earliest Mission", key="complete_mission_unique", use_container_width=True):
+        if complete_mission():
+            st.session_state.fleet_status = load_fleet_status()
             st.session_state.fleet_action_taken = True
 
 with col3:
     if st.button("🔧 Send to Maintenance", key="send_maintenance_unique", use_container_width=True):
-        if st.session_state.fleet_status['available'] > 0:
-            st.session_state.fleet_status['available'] -= 1
-            st.session_state.fleet_status['maintenance'] += 1
-            save_fleet_status(st.session_state.fleet_status)
+        if move_units('available', 'maintenance'):
+            st.session_state.fleet_status = load_fleet_status()
             st.session_state.fleet_action_taken = True
 
+# Per-unit view - each busy unit can be moved one step along its mission
+UNIT_ACTIONS = {
+    'en_route': "📍 Arrived",
+    'on_scene': "↩️ Returning",
+    'returning': "🏁 Back at Base",
+    'maintenance': "🔧 Back in Service",
+}
+
+with st.expander(f"🚑 Units ({st.session_state.fleet_status['total']})"):
+    for unit in load_fleet().units():
+        col1, col2 = st.columns([4, 1])
+        with col1:
+            patient = f" · patient #{unit['patient']}" if unit['patient'] else ""
+            heading = f" → {unit['destination']}" if unit['destination'] else ""
+            st.markdown(f"**{unit['id']}** · {unit['state'].replace('_', ' ')} · {unit['position']}{heading}{patient}")
+        with col2:
+            action = UNIT_ACTIONS.get(unit['state'])
+            if action and st.button(action, key=f"advance_{unit['id']}", use_container_width=True):
+                if advance_unit(unit['id']):
+                    st.session_state.fleet_status = load_fleet_status()
+                    st.rerun()
+
+# Trends - rendered from the fixed-size ring buffers in ambulance/timeseries.py
+TREND_LEVELS = {"Last 15 minutes": 1, "Last 24 hours": 60, "Last 30 days": 3600}
+
+with st.expander("📈 Trends"):
+    window = st.radio("Window", list(TREND_LEVELS), horizontal=True, key="trend_window")
+    rows = timeseries.store.rows(TREND_LEVELS[window])
+    if rows:
+        trends = pd.DataFrame([values for _, values in rows], index=[when for when, _ in rows])
+        st.markdown("**Queue depth by priority**")
+        st.line_chart(trends.reindex(columns=['queue_high', 'queue_medium', 'queue_low']))
+        st.markdown("**Fleet**")
+        st.line_chart(trends.reindex(columns=['available', 'on_mission', 'maintenance']))
+        st.markdown("**Triage rate (calls per minute)**")
+        st.line_chart(trends.reindex(columns=['triage_per_min']))
+    else:
+        st.info("No samples yet")
+
 # Reset fleet action flag for next iteration
 if st.session_state.fleet_action_taken:
     st.session_state.fleet_action_taken = False
@@ -572,7 +570,7 @@ st.markdown(f"""
         <p style='font-size: 0.95rem;'>Last updated: {datetime.now().strftime("%H:%M:%S")}</p>
         <p style='font-size: 0.9rem; margin-top: 0.5rem;'>
             Fleet Status: {st.session_state.fleet_status['available']} Available | 
-            {st.session_state.fleet_status['en_route']} En Route | 
+            {st.session_state.fleet_status['on_mission']} On Mission | 
             {st.session_state.fleet_status['maintenance']} Maintenance
         </p>
     </div>